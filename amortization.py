@@ -0,0 +1,157 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    # Optional: the pure-Python path gives the same cents, only slower
+    np = None
+
+def _cents(value):
+    """Round half up to the cent; both paths use the same steps so they agree"""
+    return math.floor(value * 100 + 0.5) / 100
+
+def _np_cents(values):
+    return np.floor(values * 100 + 0.5) / 100
+
+def level_payment(principal, annual_rate, term_months):
+    """Fixed monthly payment that repays principal over term_months, to the cent"""
+    rate = annual_rate / 1200
+    if rate <= 0:
+        return _cents(principal / term_months)
+    growth = (1 + rate) ** term_months
+    return _cents(principal * rate * growth / (growth - 1))
+
+def amortize(principals, annual_rates, terms, keep_schedule=False):
+    """Monthly payment, total interest and total repaid for many loans at once.
+
+    Each month's interest is rounded to the cent and the final payment
+    clears whatever balance is left, so totals are exact. Results are
+    NumPy arrays when NumPy is installed, otherwise lists. With
+    keep_schedule, 'interest', 'principal' and 'balance' are per-loan
+    rows padded with zeros past each loan's term.
+    """
+    if np is not None:
+        return _amortize_numpy(principals, annual_rates, terms, keep_schedule)
+    return _amortize_python(principals, annual_rates, terms, keep_schedule)
+
+def _amortize_numpy(principals, annual_rates, terms, keep_schedule):
+    principal = _np_cents(np.asarray(principals, dtype=float))
+    rate = np.asarray(annual_rates, dtype=float) / 1200
+    term = np.asarray(terms, dtype=np.int64)
+    growth = (1 + rate) ** term
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = np.where(rate > 0, principal * rate * growth / (growth - 1), principal / term)
+    payment = _np_cents(payment)
+
+    months = int(term.max()) if len(term) else 0
+    balance = principal.copy()
+    total_interest = np.zeros_like(principal)
+    final_payment = np.zeros_like(principal)
+    if keep_schedule:
+        interest_rows = np.zeros((len(principal), months))
+        principal_rows = np.zeros((len(principal), months))
+        balance_rows = np.zeros((len(principal), months))
+
+    # One vector step per month rather than one Python step per loan-month
+    for month in range(months):
+        active = month < term
+        last = month == term - 1
+        interest = np.where(active, _np_cents(balance * rate), 0.0)
+        repaid = np.where(last, balance, np.minimum(payment - interest, balance))
+        repaid = np.where(active, _np_cents(repaid), 0.0)
+        balance = _np_cents(balance - repaid)
+        total_interest += interest
+        final_payment = np.where(last, repaid + interest, final_payment)
+        if keep_schedule:
+            interest_rows[:, month] = interest
+            principal_rows[:, month] = repaid
+            balance_rows[:, month] = balance
+
+    total_interest = _np_cents(total_interest)
+    result = {
+        'monthly_payment': payment,
+        'final_payment': _np_cents(final_payment),
+        'total_interest': total_interest,
+        'total_payment': _np_cents(principal + total_interest)
+    }
+    if keep_schedule:
+        result.update(interest=interest_rows, principal=principal_rows, balance=balance_rows)
+    return result
+
+def _amortize_python(principals, annual_rates, terms, keep_schedule):
+    result = {'monthly_payment': [], 'final_payment': [], 'total_interest': [], 'total_payment': []}
+    if keep_schedule:
+        result.update(interest=[], principal=[], balance=[])
+    terms = [int(term) for term in terms]
+    months = max(terms, default=0)
+    # Bulk requests repeat the same amount, rate and term a lot
+    seen = {}
+
+    for principal, annual_rate, term in zip(principals, annual_rates, terms):
+        key = (principal, annual_rate, term)
+        if key in seen and not keep_schedule:
+            for name, value in zip(('monthly_payment', 'final_payment', 'total_interest', 'total_payment'), seen[key]):
+                result[name].append(value)
+            continue
+        principal = _cents(float(principal))
+        rate = float(annual_rate) / 1200
+        payment = level_payment(principal, float(annual_rate), term)
+        balance = principal
+        total_interest = 0.0
+        final_payment = 0.0
+        rows = ([], [], [])
+        for month in range(term):
+            interest = _cents(balance * rate)
+            repaid = _cents(balance if month == term - 1 else min(payment - interest, balance))
+            balance = _cents(balance - repaid)
+            total_interest += interest
+            if month == term - 1:
+                final_payment = repaid + interest
+            if keep_schedule:
+                rows[0].append(interest)
+                rows[1].append(repaid)
+                rows[2].append(balance)
+
+        result['monthly_payment'].append(payment)
+        result['final_payment'].append(_cents(final_payment))
+        total_interest = _cents(total_interest)
+        result['total_interest'].append(total_interest)
+        result['total_payment'].append(_cents(principal + total_interest))
+        seen[key] = (payment, result['final_payment'][-1], total_interest, result['total_payment'][-1])
+        if keep_schedule:
+            padding = [0.0] * (months - term)
+            result['interest'].append(rows[0] + padding)
+            result['principal'].append(rows[1] + padding)
+            result['balance'].append(rows[2] + padding)
+    return result
+
+def to_lists(result):
+    """Plain lists for JSON, whichever path produced the result"""
+    return {key: value.tolist() if hasattr(value, 'tolist') else value for key, value in result.items()}
+
+def schedule(principal, annual_rate, term_months):
+    """Month-by-month repayment rows for one loan"""
+    result = to_lists(amortize([principal], [annual_rate], [term_months], keep_schedule=True))
+    payment = result['monthly_payment'][0]
+    return [
+        {
+            'month': month + 1,
+            'payment': result['final_payment'][0] if month == term_months - 1 else payment,
+            'interest': result['interest'][0][month],
+            'principal': result['principal'][0][month],
+            'balance': result['balance'][0][month]
+        }
+        for month in range(term_months)
+    ]
+
+def add_bid_costs(bids, term_months):
+    """Set monthly_payment and total_interest on each bid dict, costed in one batch"""
+    if not bids:
+        return bids
+    costs = to_lists(amortize([float(bid['amount']) for bid in bids],
+                              [float(bid['interest_rate']) for bid in bids],
+                              [int(term_months)] * len(bids)))
+    for bid, payment, interest in zip(bids, costs['monthly_payment'], costs['total_interest']):
+        bid['monthly_payment'] = payment
+        bid['total_interest'] = interest
+    return bids
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
 from datetime import datetime, timedelta
@@ -7,13 +7,20 @@ import os
 import threading
 import atexit
 import uuid
+import time
+import hashlib
+import json
+import math
 
 # Import DynamoDB models
-from dynamodb_models import user_model, loan_model, bid_model, User
+from dynamodb_models import (dynamodb, user_model, loan_model, bid_model, bot_ledger_model, lease_model,
+                             auto_invest_rule_model, idempotency_model, event_bus, User, BID_EVENTS)
 
 # Import Cognito authentication
 from cognito_auth import CognitoAuth
 
+from order_book import OrderBook, OrderBookRegistry
+
 
 def convert_dynamodb_data(data):
     """Convert DynamoDB Decimal objects to Python types"""
@@ -37,15 +44,249 @@ login_manager.login_view = 'login'
 # Initialize Cognito
 cognito_auth = CognitoAuth()
 
+# Share model events with the other workers on this host, so their caches
+# and live streams see writes made here
+if os.getenv('EVENT_TRANSPORT') == 'unix':
+    from event_transport import UnixSocketTransport
+    event_bus.set_transport(UnixSocketTransport(os.getenv('EVENT_SOCKET_DIR', '/tmp/p2p-lending-events')))
+atexit.register(event_bus.close)
+
+# In-memory order books of pending bids, kept in sync by bid events
+order_books = OrderBookRegistry(bid_model.get_bids_for_loan, max_age=int(os.getenv('ORDER_BOOK_MAX_AGE', '30')))
+bid_model.add_listener(order_books.on_bid_event)
+
+# Per-lender aggregates, loaded on first view and then kept current by bid events
+from portfolio import PortfolioRegistry
+portfolios = PortfolioRegistry(bid_model.get_bids_by_lender, loan_model.get_loan_requests, user_model.get_user_by_id,
+                               max_age=int(os.getenv('PORTFOLIO_MAX_AGE', '300')))
+bid_model.add_listener(portfolios.on_bid_event)
+
+# Columnar index of open loans for lender search; rebuilt into a new
+# instance when stale, so the listeners go through the module global
+from loan_search import LoanSearchIndex
+loan_index = LoanSearchIndex(user_model.get_user_by_id)
+loan_index_refreshing = threading.Lock()
+loan_model.add_listener(lambda event, loan: loan_index.on_loan_event(event, loan))
+bid_model.add_listener(lambda event, bid: loan_index.on_bid_event(event, bid))
+
+def refresh_loan_index():
+    """Build a fresh search index from the tables and swap it in"""
+    global loan_index
+    if not loan_index_refreshing.acquire(blocking=False):
+        return  # Another refresh is already running
+    try:
+        loans = loan_model.get_all_open_loans()
+        borrowers = user_model.get_users({loan['borrower_id'] for loan in loans})
+        pending = bid_model.get_pending_bids_for_loans([loan['id'] for loan in loans])
+        index = LoanSearchIndex(user_model.get_user_by_id)
+        index.rebuild(loans, borrowers, pending)
+        loan_index = index
+        app.logger.info(f"Loan search index rebuilt with {len(index)} open loans")
+    except Exception as e:
+        app.logger.error(f"Failed to rebuild loan search index: {e}")
+    finally:
+        loan_index_refreshing.release()
+
+def get_loan_index():
+    """The search index; built on first use and refreshed in the background once stale"""
+    if loan_index.loaded_at is None:
+        refresh_loan_index()
+    elif time.time() - loan_index.loaded_at > int(os.getenv('LOAN_INDEX_MAX_AGE', '600')):
+        threading.Thread(target=refresh_loan_index, daemon=True).start()
+    return loan_index
+
+# Pub/sub for the live bid streams on loan pages and the borrower dashboard
+from live_events import EventHub, HubFull
+live_events = EventHub(max_subscribers=int(os.getenv('SSE_MAX_SUBSCRIBERS', '5000')))
+# Fan-out to many streams happens off the request thread; under a burst the oldest events go first
+bid_model.add_listener(live_events.on_bid_event, asynchronous=True, max_queue=10000, overflow='drop_oldest')
+loan_model.add_listener(live_events.on_loan_event, asynchronous=True, max_queue=10000, overflow='drop_oldest')
+
+# Market rates from every worker's bid events; the lookups run off the writer's thread
+from market_index import market_index, MarketIndexFeed
+market_feed = MarketIndexFeed(market_index, loan_model, user_model)
+event_bus.subscribe(BID_EVENTS, market_feed.on_event, asynchronous=True, max_queue=10000,
+                    overflow='drop_oldest', name='market-index')
+
+def get_market_index():
+    """The market index; seeded from recent bids in the background on first use"""
+    market_feed.seed_in_background(bid_model, days=int(os.getenv('MARKET_INDEX_SEED_DAYS', '30')))
+    return market_index
+
+# Full-text index over open loans' purpose and description, snapshotted to
+# disk so a warm restart only syncs the changes instead of re-tokenizing
+from text_index import TextIndex
+text_index = TextIndex()
+text_index_refreshing = threading.Lock()
+loan_model.add_listener(lambda event, loan: text_index.on_loan_event(event, loan))
+
+def text_index_path():
+    return os.getenv('LOAN_TEXT_INDEX_PATH', '/tmp/p2p-lending-text-index.json.gz')
+
+def refresh_text_index():
+    """Bring the text index up to date with the open loans and snapshot it"""
+    global text_index
+    if not text_index_refreshing.acquire(blocking=False):
+        return  # Another refresh is already running
+    try:
+        loans = loan_model.get_all_open_loans()
+        if text_index.loaded_at is None:
+            snapshot = TextIndex.load(text_index_path(),
+                                      max_age=int(os.getenv('LOAN_TEXT_INDEX_SNAPSHOT_MAX_AGE', '86400')))
+            if snapshot is not None:
+                added, removed = snapshot.sync(loans)
+                app.logger.info(f"Loan text index restored from snapshot: {added} added, {removed} removed")
+                text_index = snapshot
+            else:
+                index = TextIndex()
+                index.rebuild(loans)
+                app.logger.info(f"Loan text index built with {len(index)} open loans")
+                text_index = index
+        else:
+            text_index.sync(loans)
+        text_index.save(text_index_path())
+    except Exception as e:
+        app.logger.error(f"Failed to refresh loan text index: {e}")
+    finally:
+        text_index_refreshing.release()
+
+def save_text_index():
+    """Snapshot the text index on shutdown so the next start is warm"""
+    if text_index.loaded_at is not None:
+        try:
+            text_index.save(text_index_path())
+        except Exception as e:
+            print(f"Error saving loan text index: {e}")
+
+atexit.register(save_text_index)
+
+def get_text_index():
+    """The text index; loaded on first use and synced in the background once stale"""
+    if text_index.loaded_at is None:
+        refresh_text_index()
+    elif time.time() - text_index.loaded_at > int(os.getenv('LOAN_INDEX_MAX_AGE', '600')):
+        threading.Thread(target=refresh_text_index, daemon=True).start()
+    return text_index
+
+# Streaming table exports for analytics
+from export_data import EXPORT_TABLES, FORMATS, EXTENSIONS, compressor, export_stream
+
 # Import bot manager after app creation
 bot_manager = None
 
+def create_bot_leader(name='bot-engine'):
+    """Build the leader elector so only one worker runs a background loop"""
+    from leader_election import LeaderElector, FileLease, DynamoDBLease
+    
+    if os.getenv('BOT_LEADER_BACKEND', 'file') == 'dynamodb':
+        lease = DynamoDBLease(lease_model, name=name, ttl_seconds=int(os.getenv('BOT_LEADER_TTL', '15')))
+    elif name == 'bot-engine':
+        lease = FileLease(os.getenv('BOT_LEADER_LOCK', '/tmp/p2p-lending-bot-leader.lock'))
+    else:
+        lease = FileLease(f'/tmp/p2p-lending-{name}.lock')
+    
+    return LeaderElector(lease, heartbeat_interval=int(os.getenv('BOT_LEADER_HEARTBEAT', '5')))
+
+auto_invest_engine = None
+
+def get_auto_invest_engine():
+    """Create the auto-invest engine on first use"""
+    global auto_invest_engine
+    if auto_invest_engine is None:
+        from auto_invest import AutoInvestEngine
+        auto_invest_engine = AutoInvestEngine(
+            auto_invest_rule_model,
+            bot_ledger_model,
+            market_index=get_market_index(),
+            refresh_interval=int(os.getenv('AUTO_INVEST_REFRESH', '60')),
+            user_model=user_model
+        )
+    return auto_invest_engine
+
+# Match every loan this process writes against the rules, off the writer's thread.
+# Loans written by other workers are theirs to match, so remote events are skipped.
+loan_model.add_listener(lambda event, loan: get_auto_invest_engine().on_loan_event(event, loan),
+                        asynchronous=True, max_queue=10000, overflow='block', remote=False, name='auto-invest')
+
+matching_engine = None
+
+def settle_bid_with_bots(lender_id, bid_id, filled, released, status, loan_id):
+    """Pass a matching engine fill or rejection on to the bot that placed the bid"""
+    if not bot_manager:
+        return
+    if status == 'accepted':
+        bot_manager.record_bid_status(lender_id, bid_id, filled, status, loan_id, released=released)
+    else:
+        bot_manager.record_bid_status(lender_id, bid_id, released, status, loan_id)
+
+def get_matching_engine():
+    """Create the partial-fill matching engine on first use"""
+    global matching_engine
+    if matching_engine is None:
+        from matching import MatchingEngine
+        matching_engine = MatchingEngine(
+            loan_model,
+            bid_model,
+            bot_ledger_model,
+            order_books,
+            on_settled=settle_bid_with_bots,
+            max_workers=int(os.getenv('MATCHING_WORKERS', '4'))
+        )
+    return matching_engine
+
+auction_closer = None
+
+def get_auction_closer():
+    """Create the auction-close engine on first use"""
+    global auction_closer
+    if auction_closer is None:
+        from auction_close import AuctionCloser
+        auction_closer = AuctionCloser(
+            loan_model,
+            bid_model,
+            get_matching_engine(),
+            order_books,
+            rule=os.getenv('AUCTION_WINNER_RULE', 'fill'),
+            min_fill_ratio=float(os.getenv('AUCTION_MIN_FILL', '1.0')),
+            batch_size=int(os.getenv('AUCTION_BATCH_SIZE', '500')),
+            resync_interval=int(os.getenv('AUCTION_RESYNC_INTERVAL', '300')),
+            leader=create_bot_leader('auction-closer')
+        )
+        loan_model.add_listener(auction_closer.on_loan_event, name='auction-close')
+    return auction_closer
+
 def initialize_bots():
     """Initialize bot lenders"""
     global bot_manager
     try:
         from bot_lenders import BotLenderManager
-        bot_manager = BotLenderManager()
+        from bot_decisions import decision_log
+        from rate_limiter import AdaptiveRateLimiter, install_throttle_listener
+        decision_log.configure(
+            sample_rate=float(os.getenv('BOT_DECISION_SAMPLE_RATE', '0.01')),
+            summary_interval=float(os.getenv('BOT_DECISION_SUMMARY_INTERVAL', '300'))
+        )
+        
+        if bot_manager:
+            bot_manager.stop_automated_bidding()
+        
+        # Keep bot bursts from eating the table capacity user requests need
+        limiter = AdaptiveRateLimiter(
+            read_rate=float(os.getenv('BOT_READ_RATE', '20')),
+            write_rate=float(os.getenv('BOT_WRITE_RATE', '10'))
+        )
+        install_throttle_listener(dynamodb.meta.client, limiter)
+        
+        bot_manager = BotLenderManager(
+            max_workers=int(os.getenv('BOT_BID_WORKERS', '4')),
+            ledger=bot_ledger_model,
+            leader=create_bot_leader(),
+            allocation_mode=os.getenv('BOT_ALLOCATION_MODE', 'random'),
+            limiter=limiter,
+            shard_processes=int(os.getenv('BOT_SHARD_PROCESSES', '0')),
+            market_index=get_market_index() if os.getenv('BOT_MARKET_PRICING', 'on') != 'off' else None,
+            order_books=order_books
+        )
         
         # Create bot lenders if they don't exist
         if not bot_manager.bots:
@@ -55,6 +296,10 @@ def initialize_bots():
         bot_manager.start_automated_bidding(check_interval=60)
         app.logger.info("Bot lenders initialized successfully")
         
+        # Close auctions at expiry so bot capital in losing bids comes back
+        if os.getenv('AUCTION_CLOSE', 'on') != 'off':
+            get_auction_closer().start()
+        
     except Exception as e:
         app.logger.error(f"Failed to initialize bots: {e}")
 
@@ -63,10 +308,78 @@ def cleanup_bots():
     global bot_manager
     if bot_manager:
         bot_manager.stop_automated_bidding()
+    if auction_closer:
+        auction_closer.stop()
 
 # Register cleanup function
 atexit.register(cleanup_bots)
 
+# Forms carry a fresh key per render, so double submits and back-button resends replay
+app.jinja_env.globals['new_idempotency_key'] = lambda: str(uuid.uuid4())
+
+def claim_idempotent_request(scope, *args):
+    """Claim the request's Idempotency-Key header or form token.
+    
+    Returns (key_id, earlier): key_id to settle with finish_idempotent_request
+    once the write is done (None when the client sent no key), or the
+    earlier attempt's record when the key was used before.
+    """
+    key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+    if not key:
+        return None, None
+    
+    form = sorted((name, value) for name, value in request.form.items(multi=True) if name != 'idempotency_key')
+    payload = [scope, args, form]
+    if request.is_json:
+        payload.append(request.get_json(silent=True))
+    fingerprint = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    key_id = f'{scope}:{current_user.id}:{key[:128]}'
+    claimed, earlier = idempotency_model.claim(key_id, fingerprint,
+                                               int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400')))
+    if claimed is None:
+        # Key table unavailable: take the write without replay protection rather than fail it
+        app.logger.warning(f"Idempotency key not tracked for {scope}")
+        return None, None
+    if claimed:
+        return key_id, None
+    earlier['conflict'] = earlier.get('fingerprint', fingerprint) != fingerprint
+    return None, earlier
+
+def finish_idempotent_request(key_id, resource_id, response=None):
+    """Record the result under the key, or free the key if the write failed"""
+    if key_id is None:
+        return
+    if resource_id or response is not None:
+        idempotency_model.complete(key_id, resource_id, response)
+    else:
+        idempotency_model.release(key_id)
+
+def replay_idempotent_request(earlier, location, message):
+    """Answer a repeated submission the way the first one was answered, without writing again"""
+    if earlier['conflict']:
+        flash('This form was already submitted with different details. Please start again.', 'error')
+    elif earlier.get('status') == 'done':
+        flash(message, 'success')
+    else:
+        flash('Your earlier submission is still being processed.', 'info')
+    response = redirect(location)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def replay_idempotent_json(earlier):
+    """API counterpart of replay_idempotent_request: the stored response body, or why there is none"""
+    if earlier['conflict']:
+        response = jsonify({'error': 'This Idempotency-Key was already used for a different request'})
+        response.status_code = 422
+    elif earlier.get('status') == 'done' and earlier.get('response'):
+        response = app.response_class(earlier['response'], mimetype='application/json')
+    else:
+        response = jsonify({'error': 'The earlier request with this Idempotency-Key is still being processed'})
+        response.status_code = 409
+        response.headers['Retry-After'] = '5'
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
 # Custom Jinja2 filters for dictionary operations
 @app.template_filter('dict_min')
 def dict_min_filter(items, key):
@@ -456,8 +769,8 @@ def dashboard():
         # Get available loan requests
         available_loans = loan_model.get_all_open_loans()
         
-        # Get lender's bids
-        my_bids = bid_model.get_bids_by_lender(current_user.id)
+        # Lender's bids and totals come from the precomputed portfolio
+        portfolio = portfolios.get(current_user.id)
         
         # Add borrower info to loans and format data
         for loan in available_loans:
@@ -490,22 +803,15 @@ def dashboard():
             bids = bid_model.get_bids_for_loan(loan['id'])
             loan['bid_count'] = len(bids)
         
-        # Add loan info to bids and format data
+        from datetime import datetime
+        my_bids = [dict(position) for position in portfolio.recent(5)]
         for bid in my_bids:
-            loan_data = loan_model.get_loan_request(bid['loan_request_id'])
-            if loan_data:
-                bid['loan_amount'] = float(loan_data['amount'])
-                bid['loan_purpose'] = loan_data['purpose']
-            
-            bid['amount'] = float(bid['amount'])
-            bid['interest_rate'] = float(bid['interest_rate'])
-            # Convert bid created_at
-            from datetime import datetime
             bid['created_at'] = datetime.fromisoformat(bid['created_at'].replace('Z', '+00:00'))
         
         return render_template('lender_dashboard.html', 
                              available_loans=available_loans, 
-                             my_bids=my_bids)
+                             my_bids=my_bids,
+                             portfolio=portfolio.summary())
 
 @app.route('/request_loan', methods=['GET', 'POST'])
 @login_required
@@ -521,14 +827,23 @@ def request_loan():
         max_interest_rate = float(request.form['max_interest_rate'])
         description = request.form.get('description', '')
         
-        loan_id = loan_model.create_loan_request(
-            borrower_id=current_user.id,
-            amount=amount,
-            purpose=purpose,
-            term_months=term_months,
-            max_interest_rate=max_interest_rate,
-            description=description
-        )
+        key_id, earlier = claim_idempotent_request('request_loan')
+        if earlier:
+            return replay_idempotent_request(earlier, url_for('dashboard'), 'Loan request created successfully!')
+        
+        try:
+            loan_id = loan_model.create_loan_request(
+                borrower_id=current_user.id,
+                amount=amount,
+                purpose=purpose,
+                term_months=term_months,
+                max_interest_rate=max_interest_rate,
+                description=description
+            )
+        except Exception:
+            finish_idempotent_request(key_id, None)
+            raise
+        finish_idempotent_request(key_id, loan_id)
         
         if loan_id:
             flash('Loan request created successfully!', 'success')
@@ -563,8 +878,12 @@ def loan_details(loan_id):
             'created_at': borrower_created_at
         }
     
-    # Get bids
-    bids = bid_model.get_bids_for_loan(loan_id)
+    # Open loans read their pending bids from the order book; closed loans show every bid
+    if loan['status'] == 'open':
+        book = order_books.get(loan_id)
+    else:
+        book = OrderBook(loan_id, bid_model.get_bids_for_loan(loan_id))
+    bids = [dict(bid) for bid in book.sorted_bids()]
     
     # Add lender info to bids and convert Decimals
     for bid in bids:
@@ -582,6 +901,11 @@ def loan_details(loan_id):
     # Convert loan Decimals and dates
     loan['amount'] = float(loan['amount'])
     loan['max_interest_rate'] = float(loan['max_interest_rate'])
+    loan['funded_amount'] = float(loan.get('funded_amount', 0))
+    
+    # What each bid would cost the borrower, costed in one batch
+    from amortization import add_bid_costs
+    add_bid_costs(bids, loan['term_months'])
     
     # Convert ISO string to datetime object
     from datetime import datetime
@@ -589,10 +913,7 @@ def loan_details(loan_id):
     if 'expires_at' in loan:
         loan['expires_at'] = datetime.fromisoformat(loan['expires_at'].replace('Z', '+00:00'))
     
-    # Sort bids by interest rate (lowest first)
-    bids.sort(key=lambda x: x['interest_rate'])
-    
-    return render_template('loan_details.html', loan=loan, bids=bids)
+    return render_template('loan_details.html', loan=loan, bids=bids, book=book.summary())
 
 @app.route('/place_bid/<loan_id>', methods=['GET'])
 @login_required
@@ -625,9 +946,17 @@ def place_bid_form(loan_id):
             'created_at': borrower_created_at
         }
     
-    # Get existing bids for reference
-    bids = bid_model.get_bids_for_loan(loan_id)
-    loan['bids'] = bids
+    # Best bids and aggregates come from the order book
+    from datetime import datetime
+    book = order_books.get(loan_id)
+    loan['bids'] = [dict(bid) for bid in book.sorted_bids(limit=3)]
+    for bid in loan['bids']:
+        bid['amount'] = float(bid['amount'])
+        bid['interest_rate'] = float(bid['interest_rate'])
+        bid['created_at'] = datetime.fromisoformat(bid['created_at'].replace('Z', '+00:00'))
+    
+    from amortization import add_bid_costs
+    add_bid_costs(loan['bids'], loan['term_months'])
     
     # Convert loan data
     loan['amount'] = float(loan['amount'])
@@ -637,7 +966,7 @@ def place_bid_form(loan_id):
     from datetime import datetime
     loan['created_at'] = datetime.fromisoformat(loan['created_at'].replace('Z', '+00:00'))
     
-    return render_template('place_bid.html', loan=loan)
+    return render_template('place_bid.html', loan=loan, book=book.summary())
 
 @app.route('/place_bid/<loan_id>', methods=['POST'])
 @login_required
@@ -664,13 +993,22 @@ def place_bid(loan_id):
         flash('Interest rate cannot exceed maximum rate.', 'error')
         return redirect(url_for('loan_details', loan_id=loan_id))
     
-    bid_id = bid_model.create_bid(
-        loan_request_id=loan_id,
-        lender_id=current_user.id,
-        amount=amount,
-        interest_rate=interest_rate,
-        message=message
-    )
+    key_id, earlier = claim_idempotent_request('place_bid', loan_id)
+    if earlier:
+        return replay_idempotent_request(earlier, url_for('loan_details', loan_id=loan_id), 'Bid placed successfully!')
+    
+    try:
+        bid_id = bid_model.create_bid(
+            loan_request_id=loan_id,
+            lender_id=current_user.id,
+            amount=amount,
+            interest_rate=interest_rate,
+            message=message
+        )
+    except Exception:
+        finish_idempotent_request(key_id, None)
+        raise
+    finish_idempotent_request(key_id, bid_id)
     
     if bid_id:
         flash('Bid placed successfully!', 'success')
@@ -692,21 +1030,150 @@ def accept_bid(bid_id):
         flash('You can only accept bids on your own loans.', 'error')
         return redirect(url_for('dashboard'))
     
-    # Update bid status to accepted
-    bid_model.update_bid_status(bid_id, 'accepted')
-    
-    # Update loan status to funded
-    loan_model.update_loan_status(bid['loan_request_id'], 'funded')
-    
-    # Reject all other bids for this loan
-    all_bids = bid_model.get_bids_for_loan(bid['loan_request_id'])
-    for other_bid in all_bids:
-        if other_bid['id'] != bid_id and other_bid['status'] == 'pending':
-            bid_model.update_bid_status(other_bid['id'], 'rejected')
+    # Same conditional commit as partial fills: refuses a bid that is no longer
+    # pending and caps the fill at what the loan still needs
+    result = get_matching_engine().accept_bid(loan, bid)
+    if not result:
+        flash('This bid can no longer be accepted.', 'error')
+        return redirect(url_for('loan_details', loan_id=loan['id']))
     
     flash('Bid accepted successfully! Your loan has been funded.', 'success')
     return redirect(url_for('dashboard'))
 
+@app.route('/auto_invest', methods=['GET', 'POST'])
+@login_required
+def auto_invest():
+    if current_user.user_type != 'lender':
+        flash('Only lenders can set up auto-invest.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    if request.method == 'POST':
+        try:
+            interest_rate = float(request.form['interest_rate'])
+            min_credit_score = int(request.form.get('min_credit_score') or 0)
+            terms = [int(term) for term in request.form.getlist('terms')]
+            min_amount = float(request.form.get('min_amount') or 0)
+            max_amount = request.form.get('max_amount')
+            max_amount = float(max_amount) if max_amount else None
+        except (KeyError, ValueError):
+            flash('Interest rate, credit score and amounts must be numbers.', 'error')
+            return redirect(url_for('auto_invest'))
+        
+        # Rules bid on their own, so a bad value here would become live bids
+        error = None
+        if not all(math.isfinite(value) for value in (interest_rate, min_amount, max_amount or 0)):
+            error = 'Interest rate and amounts must be finite numbers.'
+        elif interest_rate <= 0:
+            error = 'Interest rate must be positive.'
+        elif min_amount < 0 or (max_amount is not None and max_amount <= 0):
+            error = 'Loan amounts must be positive.'
+        elif max_amount is not None and min_amount > max_amount:
+            error = 'Minimum loan amount cannot exceed the maximum.'
+        if error:
+            flash(error, 'error')
+            return redirect(url_for('auto_invest'))
+        
+        rule = auto_invest_rule_model.create_rule(
+            lender_id=current_user.id,
+            interest_rate=interest_rate,
+            min_credit_score=min_credit_score,
+            terms=terms,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            purposes=request.form.getlist('purposes')
+        )
+        
+        if rule:
+            get_auto_invest_engine().refresh()
+            flash('Auto-invest rule saved!', 'success')
+        else:
+            flash('Failed to save rule. Please try again.', 'error')
+        return redirect(url_for('auto_invest'))
+    
+    rules = auto_invest_rule_model.get_rules_by_lender(current_user.id)
+    account = bot_ledger_model.get_accounts([current_user.id]).get(current_user.id)
+    return render_template('auto_invest.html', rules=rules, account=account)
+
+@app.route('/auto_invest/budget', methods=['POST'])
+@login_required
+def auto_invest_budget():
+    if current_user.user_type != 'lender':
+        flash('Only lenders can set up auto-invest.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        amount = float(request.form['amount'])
+    except (KeyError, ValueError):
+        flash('Deposit amount must be a number.', 'error')
+        return redirect(url_for('auto_invest'))
+    if not math.isfinite(amount) or amount <= 0:
+        flash('Deposit amount must be a positive number.', 'error')
+        return redirect(url_for('auto_invest'))
+    
+    # Auto-invest bids reserve capital from the same ledger the bots use
+    deposited = (bot_ledger_model.open_account(current_user.id, amount)
+                 or bot_ledger_model.add_capital(current_user.id, amount))
+    if deposited:
+        flash(f'Added ${amount:,.2f} to your auto-invest budget.', 'success')
+    else:
+        flash('Failed to update your auto-invest budget. Please try again.', 'error')
+    return redirect(url_for('auto_invest'))
+
+@app.route('/auto_invest/<rule_id>/delete', methods=['POST'])
+@login_required
+def delete_auto_invest_rule(rule_id):
+    if auto_invest_rule_model.delete_rule(rule_id, current_user.id):
+        get_auto_invest_engine().refresh()
+        flash('Auto-invest rule deleted.', 'success')
+    else:
+        flash('Rule not found.', 'error')
+    return redirect(url_for('auto_invest'))
+
+def event_stream(topics):
+    """Server-Sent Events response for a set of live_events topics"""
+    try:
+        subscription = live_events.subscribe(topics, request.headers.get('Last-Event-ID'))
+    except HubFull:
+        return Response('Too many live streams, retry later', status=503, headers={'Retry-After': '30'})
+    return Response(live_events.stream(subscription, heartbeat=int(os.getenv('SSE_HEARTBEAT', '15'))),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/loan/<loan_id>/events')
+def loan_events(loan_id):
+    """Live bid_placed, bid_status and loan_status events for one loan"""
+    if not loan_model.get_loan_request(loan_id):
+        return jsonify({'error': 'Loan not found'}), 404
+    return event_stream([f'loan:{loan_id}'])
+
+@app.route('/dashboard/events')
+@login_required
+def dashboard_events():
+    """Live events for all of the current borrower's loans, including ones created later"""
+    if current_user.user_type != 'borrower':
+        return jsonify({'error': 'Only borrowers have a loan stream'}), 403
+    
+    loans = loan_model.get_loans_by_borrower(current_user.id)
+    return event_stream([f'borrower:{current_user.id}'] + [f"loan:{loan['id']}" for loan in loans])
+
+@app.route('/loan/<loan_id>/auto_fill', methods=['POST'])
+@login_required
+def auto_fill_loan(loan_id):
+    """Fill a loan from its best bids, splitting it across lenders"""
+    loan = loan_model.get_loan_request(loan_id)
+    if not loan or loan['borrower_id'] != current_user.id:
+        flash('You can only fill your own loans.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    result = get_matching_engine().fill_loan(loan_id)
+    if not result or not result['allocations']:
+        flash('No pending bids could be used to fill this loan.', 'error')
+    elif result['funded']:
+        flash(f"Loan funded by {len(result['allocations'])} bids!", 'success')
+    else:
+        flash(f"Filled ${result['funded_amount']:,.2f}; ${result['remaining']:,.2f} still open for bids.", 'success')
+    return redirect(url_for('loan_details', loan_id=loan_id))
+
 @app.route('/api/loans')
 def api_loans():
     """API endpoint for loan data"""
@@ -730,6 +1197,268 @@ def api_loans():
     
     return jsonify(loans_data)
 
+@app.route('/api/market/rates')
+def api_market_rates():
+    """API endpoint for market bid rates by term, credit and amount bucket"""
+    market_index = get_market_index()
+    
+    # With a loan profile, return the quote for its bucket
+    if request.args.get('term_months') and request.args.get('amount'):
+        credit_score = request.args.get('credit_score', 0, type=int)
+        amount = request.args.get('amount', type=float)
+        term_months = request.args.get('term_months', type=int)
+        return jsonify({
+            'bucket': market_index.bucket_key(credit_score, amount, term_months),
+            'p25': market_index.quote(credit_score, amount, term_months, 25),
+            'p50': market_index.quote(credit_score, amount, term_months, 50),
+            'p75': market_index.quote(credit_score, amount, term_months, 75)
+        })
+    
+    return jsonify({'buckets': market_index.snapshot(), 'min_samples': market_index.min_samples})
+
+@app.route('/api/loans/search')
+@login_required
+def api_search_loans():
+    """API endpoint for filtering and sorting open loans, with facet counts"""
+    args = request.args
+    try:
+        results = get_loan_index().search(
+            min_amount=args.get('min_amount', type=float),
+            max_amount=args.get('max_amount', type=float),
+            terms=args.getlist('term', type=int) or None,
+            purposes=args.getlist('purpose') or None,
+            min_rate=args.get('min_rate', type=float),
+            max_rate=args.get('max_rate', type=float),
+            credit_bands=args.getlist('credit_band') or None,
+            max_dti=args.get('max_dti', type=float),
+            sort=args.get('sort', 'newest'),
+            limit=min(args.get('limit', 20, type=int), 100),
+            offset=max(args.get('offset', 0, type=int), 0)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(results)
+
+@app.route('/api/loans/text_search')
+@login_required
+def api_text_search_loans():
+    """API endpoint for ranked full-text search over open loans' purpose and description"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+
+    results = get_text_index().search(
+        query,
+        limit=max(min(request.args.get('limit', 20, type=int), 100), 1),
+        prefix=request.args.get('prefix', 'true').lower() != 'false'
+    )
+    return jsonify({'query': query, 'loans': results})
+
+@app.route('/api/bids/bulk', methods=['POST'])
+@login_required
+def api_bulk_bids():
+    """Place many bids at once: {"bids": [{"loan_id", "amount", "interest_rate", "message"}]}"""
+    if current_user.user_type != 'lender':
+        return jsonify({'error': 'Only lenders can place bids'}), 403
+
+    data = request.get_json(silent=True) or {}
+    intents = data.get('bids')
+    if not isinstance(intents, list) or not intents:
+        return jsonify({'error': 'bids must be a non-empty list'}), 400
+    max_bids = int(os.getenv('BULK_BID_MAX', '500'))
+    if len(intents) > max_bids:
+        return jsonify({'error': f'At most {max_bids} bids per request'}), 400
+
+    key_id, earlier = claim_idempotent_request('bulk_bids')
+    if earlier:
+        return replay_idempotent_json(earlier)
+    try:
+        body = place_bulk_bids(intents)
+    except Exception:
+        finish_idempotent_request(key_id, None)
+        raise
+    # A retry with the same key gets these per-item results back rather than a second set of bids
+    finish_idempotent_request(key_id, None, response=json.dumps(body))
+    return jsonify(body)
+
+def place_bulk_bids(intents):
+    """Validate and write bulk bid intents for the current lender; returns the response body"""
+    # One batch read validates every intent against current loan state
+    loans = loan_model.get_loan_requests([intent.get('loan_id') for intent in intents
+                                          if isinstance(intent, dict) and isinstance(intent.get('loan_id'), str)])
+    results = []
+    accepted = []
+    for index, intent in enumerate(intents):
+        try:
+            loan = loans.get(intent['loan_id'])
+            amount = float(intent['amount'])
+            interest_rate = float(intent['interest_rate'])
+        except (KeyError, TypeError, ValueError, AttributeError):
+            results.append({'index': index, 'status': 'rejected', 'error': 'loan_id, amount and interest_rate are required'})
+            continue
+
+        error = None
+        if not loan or loan['status'] != 'open':
+            error = 'This loan is no longer available for bidding.'
+        elif not (math.isfinite(amount) and math.isfinite(interest_rate)):
+            # NaN compares false against every limit below, and DynamoDB can't store it
+            error = 'Amount and interest rate must be finite numbers.'
+        elif amount <= 0 or interest_rate <= 0:
+            error = 'Amount and interest rate must be positive.'
+        elif amount > float(loan['amount']):
+            error = 'Bid amount cannot exceed loan amount.'
+        elif interest_rate > float(loan['max_interest_rate']):
+            error = 'Interest rate cannot exceed maximum rate.'
+        if error:
+            results.append({'index': index, 'loan_id': intent['loan_id'], 'status': 'rejected', 'error': error})
+            continue
+
+        results.append({'index': index, 'loan_id': intent['loan_id']})
+        accepted.append((results[-1], {'loan_request_id': intent['loan_id'], 'amount': amount,
+                                       'interest_rate': interest_rate, 'message': str(intent.get('message', ''))}))
+
+    bid_ids = bid_model.create_bids(current_user.id, [bid for _, bid in accepted]) if accepted else []
+
+    for (result, bid), bid_id in zip(accepted, bid_ids):
+        if bid_id:
+            result.update(status='created', bid_id=bid_id)
+        else:
+            result.update(status='failed', error='Write was throttled; retry this bid')
+
+    counts = {status: sum(1 for result in results if result['status'] == status)
+              for status in ('created', 'rejected', 'failed')}
+    return {**counts, 'results': results}
+
+@app.route('/api/portfolio')
+@login_required
+def api_portfolio():
+    """API endpoint for the current lender's portfolio aggregates"""
+    if current_user.user_type != 'lender':
+        return jsonify({'error': 'Only lenders have a portfolio'}), 403
+    
+    return jsonify(portfolios.get(current_user.id).summary())
+
+@app.route('/api/amortization', methods=['POST'])
+@login_required
+def api_amortization():
+    """Bulk payment calculator: {"loans": [{"amount", "interest_rate", "term_months"}], "schedule": false}"""
+    from amortization import amortize, to_lists
+    
+    data = request.get_json(silent=True) or {}
+    loans = data.get('loans') or []
+    max_loans = int(os.getenv('AMORTIZATION_MAX_LOANS', '100000'))
+    max_schedules = int(os.getenv('AMORTIZATION_MAX_SCHEDULES', '1000'))
+    if len(loans) > max_loans:
+        return jsonify({'error': f'At most {max_loans} loans per request'}), 400
+    if data.get('schedule') and len(loans) > max_schedules:
+        return jsonify({'error': f'At most {max_schedules} schedules per request'}), 400
+    
+    try:
+        principals = [float(loan['amount']) for loan in loans]
+        rates = [float(loan['interest_rate']) for loan in loans]
+        terms = [int(loan['term_months']) for loan in loans]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Each loan needs amount, interest_rate and term_months'}), 400
+    if not all(math.isfinite(value) for value in principals + rates):
+        # NaN compares false against the limits below, and inf has no schedule
+        return jsonify({'error': 'Amounts and interest rates must be finite numbers'}), 400
+    if any(amount <= 0 for amount in principals) or any(rate < 0 for rate in rates) \
+            or any(term < 1 or term > 600 for term in terms):
+        return jsonify({'error': 'Amounts must be positive, rates non-negative and terms 1-600 months'}), 400
+    
+    result = to_lists(amortize(principals, rates, terms, keep_schedule=bool(data.get('schedule'))))
+    if data.get('schedule'):
+        # Trim each schedule's zero padding back to its own term
+        for key in ('interest', 'principal', 'balance'):
+            result[key] = [row[:term] for row, term in zip(result[key], terms)]
+    result['count'] = len(loans)
+    return jsonify(result)
+
+@app.route('/admin/matching/fill', methods=['POST'])
+@login_required
+def batch_fill_loans():
+    """Run the matching engine over a list of loans, or every open loan"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    loan_ids = (request.get_json(silent=True) or {}).get('loan_ids')
+    if not loan_ids:
+        loan_ids = [loan['id'] for loan in loan_model.get_all_open_loans()]
+    
+    results = get_matching_engine().fill_loans(loan_ids)
+    return jsonify({
+        'loans': len(loan_ids),
+        'funded': sum(1 for result in results if result['funded']),
+        'results': results
+    })
+
+@app.route('/admin/events')
+@login_required
+def event_bus_status():
+    """Model event bus counters and subscriber queues"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    status = event_bus.describe()
+    if event_bus.transport is not None:
+        status['transport_stats'] = event_bus.transport.stats
+    status['live_events'] = live_events.describe()
+    return jsonify(status)
+
+@app.route('/admin/export/<table>')
+@login_required
+def export_table_data(table):
+    """Stream a whole table as compressed NDJSON or CSV"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Admin access required'}), 403
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f"Unknown table; choose one of {', '.join(EXPORT_TABLES)}"}), 404
+    
+    fmt = request.args.get('format', 'ndjson')
+    compression = request.args.get('compression', 'gzip')
+    if fmt not in FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(FORMATS)}"}), 400
+    try:
+        compressor(compression)
+        segments = min(max(int(request.args.get('segments', 4)), 1), 16)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    filename = f"{table}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{fmt}{EXTENSIONS[compression]}"
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    if compression != 'none':
+        mimetype = 'application/gzip' if compression == 'gzip' else 'application/zstd'
+    return Response(export_stream(table, fmt, compression, segments), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'X-Accel-Buffering': 'no'})
+
+@app.route('/admin/auctions')
+@login_required
+def auction_status():
+    """Auction-close engine state"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return jsonify(get_auction_closer().describe())
+
+@app.route('/admin/auctions/close', methods=['POST'])
+@login_required
+def close_due_auctions():
+    """Close one batch of expired auctions now"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    closer = get_auction_closer()
+    if not closer.running:
+        closer.load_open_loans()
+    results = closer.close_due()
+    return jsonify({
+        'closed': len(results),
+        'funded': sum(1 for result in results if result['funded']),
+        'expired': sum(1 for result in results if result.get('expired')),
+        'results': results
+    })
+
 # Bot Management Routes
 @app.route('/admin/bots')
 @login_required
@@ -798,6 +1527,136 @@ def bot_stats_api():
     stats = bot_manager.get_bot_stats()
     return jsonify(stats)
 
+@app.route('/admin/bots/stats/history')
+@login_required
+def bot_stats_history_api():
+    """Time series of bot statistics for the admin chart"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    global bot_manager
+    if not bot_manager:
+        return jsonify([])
+    
+    return jsonify(bot_manager.get_stats_history())
+
+@app.route('/admin/bots/limiter')
+@login_required
+def bot_limiter_api():
+    """Bot DynamoDB budgets, queue depth and throttle counts"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    global bot_manager
+    if not bot_manager or not bot_manager.limiter:
+        return jsonify({'rate_limiter': None})
+    
+    return jsonify(bot_manager.limiter.get_stats())
+
+@app.route('/admin/bots/leader')
+@login_required
+def bot_leader_api():
+    """Report which worker holds the bot engine lease"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    global bot_manager
+    if not bot_manager or not bot_manager.leader:
+        return jsonify({'leader': None})
+    
+    return jsonify(bot_manager.leader.describe())
+
+@app.route('/admin/bots/decisions', methods=['GET', 'POST'])
+@login_required
+def bot_decisions_api():
+    """Decision counters per bot and reason; POST changes the sample rate"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    from bot_decisions import decision_log
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            decision_log.configure(sample_rate=data.get('sample_rate'),
+                                   summary_interval=data.get('summary_interval'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid settings: {e}'}), 400
+    
+    return jsonify(decision_log.summary())
+
+@app.route('/admin/bots/decisions/<loan_id>', methods=['GET', 'DELETE'])
+@login_required
+def bot_decision_trace(loan_id):
+    """Full decision trace for one loan, re-evaluated on demand"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    from bot_decisions import decision_log
+    if request.method == 'DELETE':
+        decision_log.stop_trace(loan_id)
+        return jsonify({'success': True, 'message': f'Stopped tracing loan {loan_id}'})
+    
+    global bot_manager
+    if not bot_manager:
+        return jsonify({'error': 'Bot manager not initialized'}), 400
+    
+    trace = bot_manager.explain_loan(loan_id)
+    if trace is None:
+        return jsonify({'error': 'Loan not found'}), 404
+    return jsonify({'loan_id': loan_id, 'events': trace})
+
+@app.route('/admin/bots/rates', methods=['GET'])
+@login_required
+def bot_rates_api():
+    """API endpoint exposing each bot's pricing grid"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    global bot_manager
+    if not bot_manager:
+        return jsonify({})
+    
+    return jsonify(bot_manager.get_rate_tables())
+
+@app.route('/admin/bots/rates', methods=['POST'])
+@login_required
+def override_bot_rate():
+    """Override one cell of a bot's pricing grid"""
+    if not current_user.email.endswith('@admin.com'):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    global bot_manager
+    if not bot_manager:
+        return jsonify({'error': 'Bot manager not initialized'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    bot = bot_manager.get_bot(data.get('bot_id'))
+    if not bot:
+        return jsonify({'error': 'Bot not found'}), 404
+    
+    # Through the manager, which persists the grid so the bidding leader uses it too
+    from bot_lenders import LedgerWriteFailed, MAX_OVERRIDE_RATE
+    try:
+        if data.get('reset'):
+            bot_manager.reset_rate_table(bot.bot_id)
+            return jsonify({'success': True, 'message': f'Pricing grid reset for {bot.name}'})
+        
+        updated = bot_manager.set_rate_override(
+            bot.bot_id,
+            data['credit_bucket'],
+            data['amount_bucket'],
+            data['term_bucket'],
+            data['rate']
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid override: {e}'}), 400
+    except LedgerWriteFailed as e:
+        return jsonify({'error': f'{e}; nothing was changed'}), 503
+    
+    if not updated:
+        return jsonify({'error': f'Unknown pricing bucket, or rate outside 0-{MAX_OVERRIDE_RATE:g}%'}), 400
+    return jsonify({'success': True, 'message': f'Pricing grid updated for {bot.name}'})
+
 @app.route('/admin/bots/reset', methods=['POST'])
 @login_required
 def reset_bots():
@@ -809,7 +1668,7 @@ def reset_bots():
     try:
         if bot_manager:
             bot_manager.stop_automated_bidding()
-            bot_manager.bots.clear()
+            bot_manager.bots = []
             bot_manager.create_bot_lenders()
             bot_manager.start_automated_bidding()
         else:
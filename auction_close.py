@@ -0,0 +1,208 @@
+import calendar
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def expiry_timestamp(expires_at):
+    """Epoch seconds for a loan's expires_at, stored as naive UTC ISO text"""
+    return calendar.timegm(datetime.fromisoformat(expires_at).utctimetuple())
+
+class AuctionCloser:
+    """Closes each loan's auction when it expires.
+
+    Deadlines sit in a min-heap, so the background thread sleeps until the
+    next one and new loans only cost a push. Due loans are closed in
+    batches: one BatchGetItem for the loans, one scan for their pending
+    bids to fill the order books, then the matching engine settles each
+    loan. A rescheduled loan leaves its old heap entry behind, which is
+    skipped when popped. New loans are scheduled from the loan model's
+    created events, whichever path wrote them; open loans are also re-read
+    every resync_interval to pick up loans whose events never arrived here.
+    """
+
+    def __init__(self, loan_model, bid_model, matching_engine, order_books, rule='fill',
+                 min_fill_ratio=1.0, batch_size=500, resync_interval=300, retry_delay=30,
+                 max_attempts=3, leader=None, clock=time.time):
+        self.loan_model = loan_model
+        self.bid_model = bid_model
+        self.matching_engine = matching_engine
+        self.order_books = order_books
+        self.rule = rule
+        self.min_fill_ratio = min_fill_ratio
+        self.batch_size = batch_size
+        self.resync_interval = resync_interval
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.leader = leader
+        self.clock = clock
+        self.heap = []
+        self.deadlines = {}
+        self.attempts = {}
+        self.last_sync = 0
+        self.stats = {'closed': 0, 'funded': 0, 'expired': 0, 'retried': 0, 'failed': 0}
+        self.running = False
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def schedule(self, loan_id, expires_at):
+        """Close loan_id at expires_at (ISO text or epoch seconds)"""
+        deadline = expiry_timestamp(expires_at) if isinstance(expires_at, str) else float(expires_at)
+        with self._cond:
+            if self.deadlines.get(loan_id) == deadline:
+                return
+            self.deadlines[loan_id] = deadline
+            heapq.heappush(self.heap, (deadline, loan_id))
+            self._cond.notify()
+
+    def on_loan_event(self, event, loan):
+        """Listener for DynamoDBLoanRequest: schedule each new loan at its stored expiry"""
+        if event == 'created' and loan.get('expires_at'):
+            self.schedule(loan['id'], loan['expires_at'])
+
+    def cancel(self, loan_id):
+        """Stop tracking a loan; its heap entry is dropped when it surfaces"""
+        with self._cond:
+            self.deadlines.pop(loan_id, None)
+            self.attempts.pop(loan_id, None)
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def next_deadline(self):
+        with self._cond:
+            self._drop_stale()
+            return self.heap[0][0] if self.heap else None
+
+    def _drop_stale(self):
+        """Pop heap entries superseded by a reschedule or cancel; caller holds the lock"""
+        while self.heap and self.deadlines.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def load_open_loans(self):
+        """Schedule every open loan; already scheduled ones are left alone"""
+        loans = self.loan_model.get_all_open_loans()
+        for loan in loans:
+            if loan.get('expires_at') and loan['id'] not in self.deadlines:
+                self.schedule(loan['id'], loan['expires_at'])
+        self.last_sync = self.clock()
+        return len(loans)
+
+    def due(self, now=None):
+        """Pop up to batch_size loans whose deadline has passed"""
+        now = self.clock() if now is None else now
+        loan_ids = []
+        with self._cond:
+            while len(loan_ids) < self.batch_size:
+                self._drop_stale()
+                if not self.heap or self.heap[0][0] > now:
+                    break
+                _, loan_id = heapq.heappop(self.heap)
+                del self.deadlines[loan_id]
+                loan_ids.append(loan_id)
+        return loan_ids
+
+    def close_due(self, now=None):
+        """Close one batch of expired loans; returns the engine results"""
+        loan_ids = self.due(now)
+        if not loan_ids:
+            return []
+
+        loans = self.loan_model.get_loan_requests(loan_ids)
+        open_loans = [loans[loan_id] for loan_id in loan_ids
+                      if loan_id in loans and loans[loan_id].get('status') == 'open']
+        for loan_id in loan_ids:
+            if loan_id not in loans or loans[loan_id].get('status') != 'open':
+                self.attempts.pop(loan_id, None)
+                self.order_books.close(loan_id)
+        if not open_loans:
+            return []
+
+        # Accepted bids come along so the books keep the lenders of earlier partial fills
+        self.order_books.preload(self.bid_model.get_pending_bids_for_loans([loan['id'] for loan in open_loans],
+                                                                           statuses=('pending', 'accepted')))
+        results = self.matching_engine.close_loans(open_loans, self.rule, self.min_fill_ratio)
+
+        for loan, result in zip(open_loans, results):
+            if result and (result['funded'] or result.get('expired')):
+                self.attempts.pop(loan['id'], None)
+                self.stats['closed'] += 1
+                self.stats['funded' if result['funded'] else 'expired'] += 1
+                continue
+            # Conflicts or errors: try again shortly, within limits
+            attempts = self.attempts.get(loan['id'], 0) + 1
+            if attempts < self.max_attempts:
+                self.attempts[loan['id']] = attempts
+                self.stats['retried'] += 1
+                self.schedule(loan['id'], self.clock() + self.retry_delay)
+            else:
+                self.attempts.pop(loan['id'], None)
+                self.stats['failed'] += 1
+                logger.error(f"Giving up closing loan {loan['id']} after {attempts} attempts")
+
+        closed = sum(1 for result in results if result and (result['funded'] or result.get('expired')))
+        logger.info(f"Closed {closed} of {len(open_loans)} expired auctions")
+        return [result for result in results if result]
+
+    def is_leader(self):
+        return self.leader is None or self.leader.is_leader
+
+    def start(self):
+        """Load open loans and start the timer thread"""
+        if self.running:
+            return
+        self.running = True
+        if self.leader:
+            self.leader.start()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='auction-closer')
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self.leader:
+            self.leader.stop()
+
+    def _run(self):
+        """Sleep until the next deadline or resync, then close what is due"""
+        while self.running:
+            try:
+                if self.clock() - self.last_sync >= self.resync_interval:
+                    self.load_open_loans()
+                if self.is_leader():
+                    self.close_due()
+            except Exception as e:
+                logger.error(f"Error in auction close loop: {e}")
+
+            with self._cond:
+                if not self.running:
+                    break
+                self._drop_stale()
+                wake = self.last_sync + self.resync_interval
+                if self.leader and not self.leader.is_leader:
+                    # Followers only keep their heap current
+                    wake = min(wake, self.clock() + self.leader.heartbeat_interval)
+                elif self.heap:
+                    wake = min(wake, self.heap[0][0])
+                delay = wake - self.clock()
+                if delay > 0:
+                    self._cond.wait(timeout=delay)
+
+    def describe(self):
+        """State for the admin API"""
+        deadline = self.next_deadline()
+        return {
+            'running': self.running,
+            'scheduled': len(self),
+            'next_deadline': datetime.utcfromtimestamp(deadline).isoformat() if deadline else None,
+            'rule': self.rule,
+            'min_fill_ratio': self.min_fill_ratio,
+            'leader': self.leader.describe() if self.leader else None,
+            **self.stats
+        }
@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from bot_lenders import BotLender
+
+logger = logging.getLogger(__name__)
+
+# Loan terms offered on the request form; a rule without terms accepts all of them
+ALL_TERMS = [6, 12, 18, 24, 36, 48, 60]
+
+def normalize_purpose(purpose):
+    return (purpose or '').strip().lower().replace(' ', '_')
+
+def _prefix_masks(pairs):
+    """Sorted keys and, per key, the bitmask of rules whose value is <= that key"""
+    keys = []
+    masks = []
+    mask = 0
+    for value, bit in sorted(pairs):
+        mask |= bit
+        if keys and keys[-1] == value:
+            masks[-1] = mask
+        else:
+            keys.append(value)
+            masks.append(mask)
+    return keys, masks
+
+def _suffix_masks(pairs):
+    """Sorted keys and, per key, the bitmask of rules whose value is >= that key"""
+    keys = []
+    masks = []
+    mask = 0
+    for value, bit in sorted(pairs, reverse=True):
+        mask |= bit
+        if keys and keys[-1] == value:
+            masks[-1] = mask
+        else:
+            keys.append(value)
+            masks.append(mask)
+    keys.reverse()
+    masks.reverse()
+    return keys, masks
+
+class RuleIndex:
+    """Reverse index from loan attributes to the auto-invest rules they satisfy.
+
+    Each rule owns one bit. Range predicates (minimum credit score, amount
+    bounds, rate) are sorted thresholds with cumulative bitmasks, and set
+    predicates (terms, purposes) are per-value bitmasks. Matching a loan is
+    one bisect or dict lookup per predicate and an AND of the masks.
+    """
+
+    def __init__(self, rules=()):
+        self.rebuild(rules)
+
+    def rebuild(self, rules):
+        """Rebuild every mask; the new state is swapped in atomically"""
+        rules = list(rules)
+        credit, min_amount, max_amount, rate = [], [], [], []
+        terms, purposes = {}, {}
+        any_term = any_purpose = 0
+
+        for position, rule in enumerate(rules):
+            bit = 1 << position
+            credit.append((int(rule.get('min_credit_score', 0)), bit))
+            min_amount.append((float(rule.get('min_amount', 0)), bit))
+            max_amount.append((float(rule['max_amount']) if rule.get('max_amount') is not None
+                               else float('inf'), bit))
+            rate.append((float(rule['interest_rate']), bit))
+
+            if rule.get('terms'):
+                for term in rule['terms']:
+                    terms[int(term)] = terms.get(int(term), 0) | bit
+            else:
+                any_term |= bit
+
+            if rule.get('purposes'):
+                for purpose in rule['purposes']:
+                    key = normalize_purpose(purpose)
+                    purposes[key] = purposes.get(key, 0) | bit
+            else:
+                any_purpose |= bit
+
+        self._state = (
+            rules,
+            _prefix_masks(credit),
+            _prefix_masks(min_amount),
+            _suffix_masks(max_amount),
+            _prefix_masks(rate),
+            terms, any_term,
+            purposes, any_purpose
+        )
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def match(self, loan, borrower):
+        """Rules satisfied by a loan and its borrower"""
+        (rules, credit, min_amount, max_amount, rate,
+         terms, any_term, purposes, any_purpose) = self._state
+        if not rules:
+            return []
+
+        amount = float(loan['amount'])
+        mask = terms.get(int(loan['term_months']), 0) | any_term
+        mask &= purposes.get(normalize_purpose(loan.get('purpose')), 0) | any_purpose
+        mask &= _at_most(credit, int(borrower.get('credit_score', 0) or 0))
+        mask &= _at_most(min_amount, amount)
+        mask &= _at_least(max_amount, amount)
+        mask &= _at_most(rate, float(loan['max_interest_rate']))
+
+        matched = []
+        while mask:
+            low = mask & -mask
+            matched.append(rules[low.bit_length() - 1])
+            mask ^= low
+        return matched
+
+def _at_most(index, value):
+    """Mask of rules whose threshold is <= value"""
+    keys, masks = index
+    position = bisect_right(keys, value) - 1
+    return masks[position] if position >= 0 else 0
+
+def _at_least(index, value):
+    """Mask of rules whose threshold is >= value"""
+    keys, masks = index
+    position = bisect_left(keys, value)
+    return masks[position] if position < len(keys) else 0
+
+class AutoInvestLender(BotLender):
+    """A human lender's rule acting through the bot bidding path.
+
+    Capital comes from the lender's ledger account, so bids reserve and
+    release funds exactly as bot bids do. Bids are tagged as auto-invest
+    rather than bot bids, so the market index still counts them as quotes.
+    """
+
+    bid_source = 'auto_invest'
+
+    def __init__(self, rule, ledger=None):
+        super().__init__(
+            bot_id=rule['lender_id'],
+            name='Auto-Invest',
+            strategy='auto_invest',
+            capital=0,
+            min_credit_score=int(rule.get('min_credit_score', 0)),
+            max_loan_amount=float(rule['max_amount']) if rule.get('max_amount') is not None else float('inf'),
+            preferred_terms=[int(term) for term in rule.get('terms') or ALL_TERMS],
+            ledger=ledger
+        )
+        self.rule = rule
+
+    def calculate_interest_rate(self, loan, borrower):
+        """Bid at the rate the lender set on the rule"""
+        return round(min(float(self.rule['interest_rate']), float(loan['max_interest_rate'])), 2)
+
+class AutoInvestEngine:
+    """Matches new loans against saved rules and places the resulting bids"""
+
+    def __init__(self, rule_model, ledger, market_index=None, refresh_interval=60, user_model=None):
+        self.rule_model = rule_model
+        self.ledger = ledger
+        self.user_model = user_model
+        self.market_index = market_index
+        self.refresh_interval = refresh_interval
+        self.index = RuleIndex()
+        self.last_refresh = 0
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self):
+        """Reload every active rule; picks up rules saved by other workers"""
+        with self._refresh_lock:
+            self.index.rebuild(self.rule_model.get_active_rules())
+            self.last_refresh = time.time()
+        logger.info(f"Loaded {len(self.index)} auto-invest rules")
+
+    def maybe_refresh(self):
+        if time.time() - self.last_refresh >= self.refresh_interval:
+            self.refresh()
+
+    def on_loan_event(self, event, loan):
+        """Listener for DynamoDBLoanRequest: match every newly written loan, whichever path wrote it"""
+        if event != 'created':
+            return []
+        borrower = self.user_model.get_user_by_id(loan['borrower_id']) if self.user_model else None
+        if not borrower:
+            return []
+        return self.invest(loan, borrower)
+
+    def invest(self, loan, borrower):
+        """Bid on a loan for every lender with a matching rule"""
+        try:
+            self.maybe_refresh()
+            # One bid per lender, at the best rate any of their rules offers
+            best = {}
+            for rule in self.index.match(loan, borrower):
+                lender_id = rule['lender_id']
+                if lender_id == loan['borrower_id']:
+                    continue
+                if lender_id not in best or float(rule['interest_rate']) < float(best[lender_id]['interest_rate']):
+                    best[lender_id] = rule
+            if not best:
+                return []
+
+            accounts = self.ledger.get_accounts(list(best))
+            bid_ids = []
+            for lender_id, rule in best.items():
+                account = accounts.get(lender_id)
+                if not account:
+                    continue  # No auto-invest budget deposited
+                lender = AutoInvestLender(rule, ledger=self.ledger)
+                lender.market_index = self.market_index
+                lender.load_ledger_account(account)
+                bid_id = lender.place_bid(loan, borrower)
+                if bid_id:
+                    bid_ids.append(bid_id)
+
+            if bid_ids:
+                logger.info(f"Auto-invest placed {len(bid_ids)} bids on loan {loan['id']}")
+            return bid_ids
+        except Exception as e:
+            logger.error(f"Error auto-investing in loan {loan.get('id', 'unknown')}: {e}")
+            return []
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Backtesting harness for bot lender strategies
+Replays a synthetic or recorded loan stream through BotLender and runs
+parameter sweeps across a process pool
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bot_lenders import BotLender, credit_bucket
+from portfolio_allocation import EXPECTED_LOSS_RATES
+
+PURPOSES = ['debt_consolidation', 'home_improvement', 'medical', 'auto', 'education', 'business']
+TERMS = [12, 24, 36, 48, 60]
+
+# Annual default probability per credit bucket. With half of a defaulted
+# principal recovered this reproduces the allocator's expected loss rates.
+DEFAULT_RATES = [rate / 100 * 2 for rate in EXPECTED_LOSS_RATES]
+
+def synthetic_loan_stream(num_loans, seed=42):
+    """Yield (loan, borrower) pairs from a seeded synthetic market"""
+    rng = random.Random(seed)
+    for i in range(num_loans):
+        credit_score = int(min(850, max(550, rng.gauss(700, 60))))
+        annual_income = round(rng.lognormvariate(11.0, 0.4), -2)
+        amount = rng.randint(1, 60) * 1000
+        term_months = rng.choice(TERMS)
+        bucket = credit_bucket(credit_score)
+
+        # Best competing offer the borrower would otherwise take
+        clearing_rate = round(max(3.0, 6.0 + (2 - bucket) * 1.2 + rng.gauss(0, 1.0)), 2)
+
+        loan = {
+            'id': f'bt-{i}',
+            'amount': amount,
+            'purpose': rng.choice(PURPOSES),
+            'term_months': term_months,
+            'max_interest_rate': round(clearing_rate + rng.uniform(1.0, 4.0), 2),
+            'clearing_rate': clearing_rate
+        }
+        borrower = {'credit_score': credit_score, 'annual_income': annual_income}
+        yield loan, borrower
+
+def recorded_loan_stream(path):
+    """Yield (loan, borrower) pairs from an NDJSON file of recorded loans"""
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            borrower = record.pop('borrower', {})
+            yield record, borrower
+
+def run_backtest(config, num_loans=100000, seed=42, loans_per_month=1000, stream_path=None):
+    """Replay the loan stream through one bot configuration and report metrics"""
+    # Rejection logging would dominate the run time
+    logging.getLogger('bot_lenders').setLevel(logging.WARNING)
+
+    # BotLender prices with the module-level RNG, so seed it per run
+    random.seed(seed)
+    outcome_rng = random.Random(seed + 1)
+
+    bot = BotLender(
+        bot_id=f"backtest-{config['name']}",
+        name=config['name'],
+        strategy=config['strategy'],
+        capital=config['capital'],
+        min_credit_score=config.get('min_credit_score', 600),
+        max_loan_amount=config.get('max_loan_amount', 50000),
+        preferred_terms=config.get('preferred_terms'),
+        risk_tolerance=config.get('risk_tolerance', 'medium')
+    )
+    capital = float(bot.capital)
+    available = capital
+    bot.available_capital = Decimal(str(available))
+
+    maturities = []  # heap of (month, principal, interest, defaulted)
+    loans_seen = bids = accepted = 0
+    rate_total = interest_earned = losses = utilization_total = 0.0
+    months = 0
+
+    stream = recorded_loan_stream(stream_path) if stream_path else synthetic_loan_stream(num_loans, seed)
+    for index, (loan, borrower) in enumerate(stream):
+        month = index // loans_per_month
+
+        # Settle matured loans and sample utilization once per simulated month
+        if month != months:
+            utilization_total += (capital - available) / capital * (month - months)
+            months = month
+            while maturities and maturities[0][0] <= month:
+                _, principal, interest, defaulted = heapq.heappop(maturities)
+                if defaulted:
+                    losses += principal / 2  # assume half is recovered
+                    available += principal / 2
+                else:
+                    interest_earned += interest
+                    available += principal
+            bot.available_capital = Decimal(str(available))
+
+        loans_seen += 1
+        if not bot.should_bid_on_loan(loan, borrower):
+            continue
+
+        bids += 1
+        rate = bot.calculate_interest_rate(loan, borrower)
+        if rate > loan.get('clearing_rate', loan['max_interest_rate']):
+            continue
+
+        amount = float(loan['amount'])
+        term = loan['term_months']
+        accepted += 1
+        rate_total += rate
+        available -= amount
+        bot.available_capital = Decimal(str(available))
+
+        default_probability = DEFAULT_RATES[credit_bucket(borrower.get('credit_score', 0))] * term / 12
+        defaulted = outcome_rng.random() < default_probability
+        interest = amount * rate / 100 * term / 12
+        heapq.heappush(maturities, (month + term, amount, interest, defaulted))
+
+    months = max(months, 1)
+    return {
+        'name': config['name'],
+        'strategy': config['strategy'],
+        'config': config,
+        'loans_seen': loans_seen,
+        'bids': bids,
+        'accepted': accepted,
+        'bid_rate': bids / loans_seen if loans_seen else 0,
+        'fill_rate': accepted / bids if bids else 0,
+        'capital_utilization': utilization_total / months * 100,
+        'avg_rate': rate_total / accepted if accepted else 0,
+        'interest_earned': round(interest_earned, 2),
+        'losses': round(losses, 2),
+        'simulated_return': round((interest_earned - losses) / capital * 100, 4)
+    }
+
+def _run_backtest_job(job):
+    """Process pool entry point"""
+    config, kwargs = job
+    return run_backtest(config, **kwargs)
+
+def parameter_grid(base_config, **axes):
+    """Expand a base config over every combination of the given parameter values"""
+    names = list(axes)
+    configs = []
+    for values in itertools.product(*(axes[name] for name in names)):
+        config = dict(base_config)
+        config.update(zip(names, values))
+        config['name'] = base_config['name'] + ''.join(f'|{n}={v}' for n, v in zip(names, values))
+        configs.append(config)
+    return configs
+
+def run_sweep(configs, processes=None, **kwargs):
+    """Backtest every config in parallel; each worker regenerates the stream from the seed"""
+    jobs = [(config, kwargs) for config in configs]
+    if processes == 1:
+        return [_run_backtest_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_run_backtest_job, jobs))
+
+def print_report(results):
+    """Print a per-configuration summary table"""
+    print(f"{'Configuration':<60} {'Bid%':>6} {'Fill%':>6} {'Util%':>6} {'AvgRate':>8} {'Return%':>8}")
+    print("-" * 100)
+    for result in sorted(results, key=lambda r: r['simulated_return'], reverse=True):
+        print(f"{result['name'][:60]:<60} {result['bid_rate'] * 100:>6.1f} {result['fill_rate'] * 100:>6.1f} "
+              f"{result['capital_utilization']:>6.1f} {result['avg_rate']:>8.2f} {result['simulated_return']:>8.2f}")
+
+def main():
+    """Run a strategy sweep from the command line"""
+    parser = argparse.ArgumentParser(description='Backtest bot lender strategies')
+    parser.add_argument('--loans', type=int, default=100000, help='synthetic loans per configuration')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--loans-per-month', type=int, default=1000)
+    parser.add_argument('--stream', help='NDJSON file of recorded loans to replay instead of synthetic data')
+    parser.add_argument('--output', help='write full results as JSON to this file')
+    args = parser.parse_args()
+
+    configs = []
+    for strategy in ['conservative', 'balanced', 'aggressive']:
+        base = {'name': strategy, 'strategy': strategy, 'capital': 500000}
+        configs.extend(parameter_grid(
+            base,
+            min_credit_score=[600, 650, 700, 750, 800],
+            max_loan_amount=[15000, 35000]
+        ))
+
+    print(f"🧪 Backtesting {len(configs)} configurations over "
+          f"{'recorded stream ' + args.stream if args.stream else f'{args.loans:,} synthetic loans'}")
+    start = time.time()
+    results = run_sweep(
+        configs,
+        processes=args.processes,
+        num_loans=args.loans,
+        seed=args.seed,
+        loans_per_month=args.loans_per_month,
+        stream_path=args.stream
+    )
+    elapsed = time.time() - start
+
+    print_report(results)
+    print(f"\n⏱️  Completed in {elapsed:.1f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"📄 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
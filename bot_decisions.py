@@ -0,0 +1,126 @@
+import random
+import threading
+import time
+import logging
+from collections import Counter, OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+class DecisionLog:
+    """Structured bot decision events with per-reason counters and sampling.
+
+    Recording a decision only bumps a counter. A log line is formatted only
+    for sampled events, and full events are kept only for loans that have
+    been put under trace.
+    """
+
+    def __init__(self, sample_rate=0.0, summary_interval=60, max_traced_loans=100, max_trace_events=200):
+        self.sample_rate = sample_rate
+        self.summary_interval = summary_interval
+        self.max_traced_loans = max_traced_loans
+        self.max_trace_events = max_trace_events
+        self.counters = Counter()
+        self.totals = Counter()
+        self.traces = OrderedDict()
+        self.last_summary = time.time()
+        self._lock = threading.Lock()
+        # Separate RNG so sampling never disturbs seeded bot pricing
+        self._rng = random.Random()
+
+    def configure(self, sample_rate=None, summary_interval=None):
+        """Change sampling or summary settings at runtime"""
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        if summary_interval is not None:
+            self.summary_interval = float(summary_interval)
+
+    def record(self, bot_name, loan_id, reason, **fields):
+        """Count a decision and emit it only if sampled or traced"""
+        key = (bot_name, reason)
+        with self._lock:
+            self.counters[key] += 1
+            trace = self.traces.get(loan_id)
+
+        if trace is not None:
+            trace.append({
+                'timestamp': time.time(),
+                'bot': bot_name,
+                'loan_id': loan_id,
+                'reason': reason,
+                **fields
+            })
+
+        if self.sample_rate and self._rng.random() < self.sample_rate:
+            logger.info("bot_decision bot=%s loan=%s reason=%s %s", bot_name, loan_id, reason, fields)
+
+    def counts(self):
+        """Copy of the per (bot, reason) counts in the current window"""
+        with self._lock:
+            return Counter(self.counters)
+
+    def merge(self, counts):
+        """Add counts recorded in another process, such as a shard worker"""
+        with self._lock:
+            self.counters.update(counts)
+
+    def start_trace(self, loan_id):
+        """Keep full decision events for one loan from now on"""
+        with self._lock:
+            if loan_id not in self.traces:
+                self.traces[loan_id] = deque(maxlen=self.max_trace_events)
+                while len(self.traces) > self.max_traced_loans:
+                    self.traces.popitem(last=False)
+            return self.traces[loan_id]
+
+    def stop_trace(self, loan_id):
+        """Stop tracing a loan and discard its events"""
+        with self._lock:
+            self.traces.pop(loan_id, None)
+
+    def get_trace(self, loan_id):
+        """Return the recorded events for a traced loan"""
+        with self._lock:
+            trace = self.traces.get(loan_id)
+        return list(trace) if trace is not None else []
+
+    def summary(self):
+        """Counts per bot and reason since the last summary, plus running totals"""
+        with self._lock:
+            window = dict(self.counters)
+            totals = self.totals + self.counters
+        return {
+            'window': _nest(window),
+            'totals': _nest(totals),
+            'since': self.last_summary,
+            'sample_rate': self.sample_rate,
+            'traced_loans': list(self.traces)
+        }
+
+    def maybe_log_summary(self, force=False):
+        """Log one summary line per bot and reset the window once per interval"""
+        now = time.time()
+        if not force and now - self.last_summary < self.summary_interval:
+            return None
+
+        with self._lock:
+            window = self.counters
+            self.totals.update(window)
+            self.counters = Counter()
+            started = self.last_summary
+            self.last_summary = now
+
+        by_bot = _nest(window)
+        for bot_name, reasons in sorted(by_bot.items()):
+            logger.info("bot_decision_summary bot=%s window=%.0fs %s", bot_name, now - started,
+                        ' '.join(f'{reason}={count}' for reason, count in sorted(reasons.items())))
+        return by_bot
+
+def _nest(counter):
+    """Turn {(bot, reason): count} into {bot: {reason: count}}"""
+    nested = {}
+    for (bot_name, reason), count in counter.items():
+        nested.setdefault(bot_name, {})[reason] = count
+    return nested
+
+# Shared by every bot in the process
+decision_log = DecisionLog()
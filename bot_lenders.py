@@ -1,20 +1,87 @@
+import math
 import random
 import time
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 from decimal import Decimal
 import threading
 import logging
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dynamodb_models import user_model, loan_model, bid_model, User
+from portfolio_allocation import Candidate, allocate_capital, expected_yield
+from bot_decisions import decision_log
+from bot_stats import BotStatsTracker
+from bot_sharding import LoanSnapshot, evaluate_shard, gevent_patched, shard_bots
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pricing grid used by BotLender.calculate_interest_rate. Each input is mapped
+# to a bucket index and the per-bucket adjustments are summed once per bot.
+BASE_RATE = 5.0
+CREDIT_THRESHOLDS = [650, 700, 750, 800]           # score >= threshold moves up a bucket
+CREDIT_ADJUSTMENTS = [2.0, 1.0, 0.0, -0.5, -1.0]
+AMOUNT_THRESHOLDS = [10000, 25000]                 # amount > threshold moves up a bucket
+AMOUNT_ADJUSTMENTS = [-0.25, 0.0, 0.5]
+TERM_THRESHOLDS = [24, 48]                         # term > threshold moves up a bucket
+TERM_ADJUSTMENTS = [-0.25, 0.0, 0.5]
+STRATEGY_ADJUSTMENTS = {
+    'conservative': -0.5,
+    'aggressive': 1.0,
+    'balanced': 0.0
+}
+# Percentile of the market index each strategy quotes at once a bucket has data
+MARKET_PERCENTILES = {
+    'conservative': 40,
+    'aggressive': 65,
+    'balanced': 50
+}
+# Highest rate an admin may set on a grid cell
+MAX_OVERRIDE_RATE = 36.0
+
+class LedgerWriteFailed(Exception):
+    """Raised when a pricing grid change could not be saved to the bot ledger"""
+
+def credit_bucket(credit_score):
+    """Map a credit score to its pricing bucket index"""
+    return bisect_right(CREDIT_THRESHOLDS, credit_score)
+
+def amount_bucket(loan_amount):
+    """Map a loan amount to its pricing bucket index"""
+    return bisect_left(AMOUNT_THRESHOLDS, loan_amount)
+
+def term_bucket(term_months):
+    """Map a loan term to its pricing bucket index"""
+    return bisect_left(TERM_THRESHOLDS, term_months)
+
+def grid_rate(c, a, t, strategy):
+    """Default rate for one cell of the pricing grid"""
+    return (BASE_RATE + CREDIT_ADJUSTMENTS[c] + AMOUNT_ADJUSTMENTS[a]
+            + TERM_ADJUSTMENTS[t] + STRATEGY_ADJUSTMENTS.get(strategy, 0.0))
+
+# Bot user ids derive from the bot's email, so workers seeding at once converge on one account
+BOT_NAMESPACE = uuid.UUID('8d6f1c2e-4a7b-4e0f-9c3d-2b5a6e7f8091')
+
+def build_rate_table(strategy):
+    """Precompute base rates for every (credit, amount, term, strategy) bucket"""
+    table = {}
+    for c in range(len(CREDIT_ADJUSTMENTS)):
+        for a in range(len(AMOUNT_ADJUSTMENTS)):
+            for t in range(len(TERM_ADJUSTMENTS)):
+                table[(c, a, t, strategy)] = grid_rate(c, a, t, strategy)
+    return table
+
 class BotLender:
     """Represents an automated bot lender with specific lending criteria"""
     
+    # Stored on each bid; the market index leaves pending bot quotes out
+    bid_source = 'bot'
+    
     def __init__(self, bot_id, name, strategy, capital, min_credit_score=600, 
-                 max_loan_amount=50000, preferred_terms=None, risk_tolerance='medium'):
+                 max_loan_amount=50000, preferred_terms=None, risk_tolerance='medium',
+                 ledger=None):
         self.bot_id = bot_id
         self.name = name
         self.strategy = strategy
@@ -26,6 +93,13 @@ class BotLender:
         self.risk_tolerance = risk_tolerance
         self.active_bids = []
         self.funded_loans = []
+        self.rate_table = build_rate_table(strategy)
+        self.rate_overrides = {}
+        self.ledger = ledger
+        self.stats = None
+        self.limiter = None
+        self.market_index = None
+        self._lock = threading.Lock()
         
     def should_bid_on_loan(self, loan, borrower):
         """Determine if this bot should bid on a given loan"""
@@ -33,34 +107,42 @@ class BotLender:
         # Check available capital
         loan_amount = float(loan['amount'])
         if self.available_capital < loan_amount:
-            logger.info(f"{self.name}: Insufficient capital for loan {loan['id']}")
+            decision_log.record(self.name, loan['id'], 'insufficient_capital',
+                                amount=loan_amount, available=float(self.available_capital))
             return False
         
         # Check credit score requirement
         borrower_credit_score = borrower.get('credit_score', 0)
         if borrower_credit_score < self.min_credit_score:
-            logger.info(f"{self.name}: Credit score {borrower_credit_score} below minimum {self.min_credit_score}")
+            decision_log.record(self.name, loan['id'], 'credit_score',
+                                credit_score=borrower_credit_score, minimum=self.min_credit_score)
             return False
         
         # Check loan amount limits
         if loan_amount > self.max_loan_amount:
-            logger.info(f"{self.name}: Loan amount ${loan_amount} exceeds maximum ${self.max_loan_amount}")
+            decision_log.record(self.name, loan['id'], 'loan_amount',
+                                amount=loan_amount, maximum=self.max_loan_amount)
             return False
         
         # Check preferred terms
         if loan['term_months'] not in self.preferred_terms:
-            logger.info(f"{self.name}: Term {loan['term_months']} months not in preferred terms")
+            decision_log.record(self.name, loan['id'], 'term',
+                                term_months=loan['term_months'], preferred=self.preferred_terms)
             return False
         
         # Strategy-specific checks
         if self.strategy == 'conservative':
-            return self._conservative_check(loan, borrower)
+            eligible = self._conservative_check(loan, borrower)
         elif self.strategy == 'aggressive':
-            return self._aggressive_check(loan, borrower)
+            eligible = self._aggressive_check(loan, borrower)
         elif self.strategy == 'balanced':
-            return self._balanced_check(loan, borrower)
+            eligible = self._balanced_check(loan, borrower)
+        else:
+            eligible = True
         
-        return True
+        decision_log.record(self.name, loan['id'], 'eligible' if eligible else 'strategy',
+                            strategy=self.strategy)
+        return eligible
     
     def _conservative_check(self, loan, borrower):
         """Conservative lending strategy"""
@@ -112,50 +194,22 @@ class BotLender:
     
     def calculate_interest_rate(self, loan, borrower):
         """Calculate competitive interest rate based on risk assessment"""
-        base_rate = 5.0  # Base interest rate
-        credit_score = borrower.get('credit_score', 600)
-        loan_amount = float(loan['amount'])
-        term_months = loan['term_months']
         max_rate = float(loan['max_interest_rate'])
+        key = (
+            credit_bucket(borrower.get('credit_score', 600)),
+            amount_bucket(float(loan['amount'])),
+            term_bucket(loan['term_months']),
+            self.strategy
+        )
+        calculated_rate = self.rate_table[key]
         
-        # Credit score adjustment
-        if credit_score >= 800:
-            credit_adjustment = -1.0
-        elif credit_score >= 750:
-            credit_adjustment = -0.5
-        elif credit_score >= 700:
-            credit_adjustment = 0.0
-        elif credit_score >= 650:
-            credit_adjustment = 1.0
-        else:
-            credit_adjustment = 2.0
-        
-        # Loan amount adjustment
-        if loan_amount > 25000:
-            amount_adjustment = 0.5
-        elif loan_amount > 10000:
-            amount_adjustment = 0.0
-        else:
-            amount_adjustment = -0.25
-        
-        # Term adjustment
-        if term_months > 48:
-            term_adjustment = 0.5
-        elif term_months > 24:
-            term_adjustment = 0.0
-        else:
-            term_adjustment = -0.25
-        
-        # Strategy adjustment
-        if self.strategy == 'conservative':
-            strategy_adjustment = -0.5
-        elif self.strategy == 'aggressive':
-            strategy_adjustment = 1.0
-        else:
-            strategy_adjustment = 0.0
-        
-        # Calculate final rate
-        calculated_rate = base_rate + credit_adjustment + amount_adjustment + term_adjustment + strategy_adjustment
+        # Anchor on what the market is clearing at; overrides still shift the quote
+        if self.market_index:
+            market_rate = self.market_index.quote(borrower.get('credit_score', 600), loan['amount'],
+                                                  loan['term_months'],
+                                                  MARKET_PERCENTILES.get(self.strategy, 50))
+            if market_rate is not None:
+                calculated_rate = market_rate + calculated_rate - grid_rate(*key)
         
         # Add some randomness for competitive bidding
         randomness = random.uniform(-0.3, 0.3)
@@ -166,13 +220,62 @@ class BotLender:
         
         return round(calculated_rate, 2)
     
-    def place_bid(self, loan, borrower):
+    def get_rate_table(self):
+        """Return the pricing grid as a JSON-friendly list of rows"""
+        return [
+            {
+                'credit_bucket': c,
+                'amount_bucket': a,
+                'term_bucket': t,
+                'strategy': strategy,
+                'rate': rate
+            }
+            for (c, a, t, strategy), rate in sorted(self.rate_table.items())
+        ]
+    
+    def set_rate_override(self, credit_bucket, amount_bucket, term_bucket, rate):
+        """Override the base rate for one cell of the pricing grid"""
+        key = (int(credit_bucket), int(amount_bucket), int(term_bucket), self.strategy)
+        rate = float(rate)
+        if key not in self.rate_table or not (math.isfinite(rate) and 0 < rate <= MAX_OVERRIDE_RATE):
+            return False
+        self.rate_table[key] = rate
+        self.rate_overrides[f'{key[0]}:{key[1]}:{key[2]}'] = rate
+        logger.info(f"{self.name}: Rate for bucket {key[:3]} overridden to {rate}%")
+        return True
+    
+    def reset_rate_table(self):
+        """Discard overrides and rebuild the pricing grid from the defaults"""
+        self.rate_table = build_rate_table(self.strategy)
+        self.rate_overrides = {}
+    
+    def apply_rate_overrides(self, overrides):
+        """Make the grid the defaults plus these overrides, as persisted in the ledger"""
+        overrides = {key: float(rate) for key, rate in overrides.items()}
+        if overrides == self.rate_overrides:
+            return
+        # Build the new grid aside and swap it in, so pricing never sees it half applied
+        rate_table = build_rate_table(self.strategy)
+        for key, rate in overrides.items():
+            cell = tuple(int(bucket) for bucket in key.split(':')) + (self.strategy,)
+            if cell in rate_table:
+                rate_table[cell] = rate
+        self.rate_table = rate_table
+        self.rate_overrides = overrides
+    
+    def place_bid(self, loan, borrower, interest_rate=None):
         """Place a bid on a loan"""
         if not self.should_bid_on_loan(loan, borrower):
             return None
         
         loan_amount = float(loan['amount'])
-        interest_rate = self.calculate_interest_rate(loan, borrower)
+        if interest_rate is None:
+            interest_rate = self.calculate_interest_rate(loan, borrower)
+        
+        # Reserve capital up front so concurrent bids cannot overspend
+        if not self._reserve_capital(loan_amount):
+            decision_log.record(self.name, loan['id'], 'capital_reservation_failed', amount=loan_amount)
+            return None
         
         # Generate bot message
         messages = [
@@ -189,18 +292,26 @@ class BotLender:
             loan_id = str(loan['id'])
             lender_id = str(self.bot_id)
             
+            self._wait_for_write()
             bid_id = bid_model.create_bid(
                 loan_request_id=loan_id,
                 lender_id=lender_id,
                 amount=loan_amount,
                 interest_rate=interest_rate,
-                message=message
+                message=message,
+                source=self.bid_source
             )
             
             if bid_id:
-                self.available_capital -= Decimal(str(loan_amount))
-                self.active_bids.append(bid_id)
-                logger.info(f"{self.name}: Placed bid ${loan_amount} at {interest_rate}% on loan {loan_id}")
+                with self._lock:
+                    self.active_bids.append(bid_id)
+                if self.stats:
+                    self.stats.on_bid_placed(self, loan_amount)
+                if self.ledger:
+                    self._wait_for_write()
+                    self.ledger.record_bid(self.bot_id, bid_id)
+                decision_log.record(self.name, loan_id, 'bid_placed',
+                                    bid_id=bid_id, amount=loan_amount, interest_rate=interest_rate)
                 return bid_id
             else:
                 logger.warning(f"{self.name}: Failed to create bid for loan {loan_id}")
@@ -210,15 +321,113 @@ class BotLender:
             import traceback
             logger.error(f"Full traceback: {traceback.format_exc()}")
         
+        self._release_capital(loan_amount)
         return None
+    
+    def _reserve_capital(self, amount):
+        """Atomically take amount out of available capital if it is there"""
+        amount = Decimal(str(amount))
+        
+        # The ledger's conditional ADD is the source of truth when configured
+        if self.ledger:
+            self._wait_for_write()
+            if not self.ledger.reserve_capital(self.bot_id, amount):
+                return False
+        
+        with self._lock:
+            if not self.ledger and self.available_capital < amount:
+                return False
+            self.available_capital -= amount
+            return True
+    
+    def _release_capital(self, amount):
+        """Return a previously reserved amount to available capital"""
+        if self.ledger:
+            self._wait_for_write()
+            self.ledger.release_capital(self.bot_id, amount)
+        with self._lock:
+            self.available_capital += Decimal(str(amount))
+    
+    def _wait_for_write(self):
+        """Take a token from the shared write budget, if one is configured"""
+        if self.limiter:
+            self.limiter.acquire_write()
+    
+    def settle_bid(self, bid_id, amount, accepted, loan_id=None, released=0):
+        """Update in-memory state once a borrower accepts or rejects our bid.
+        
+        released is the unfilled part of a partially accepted bid.
+        """
+        with self._lock:
+            if bid_id not in self.active_bids:
+                return False
+            self.active_bids.remove(bid_id)
+            if accepted:
+                self.funded_loans.append(loan_id)
+                self.available_capital += Decimal(str(released))
+            else:
+                self.available_capital += Decimal(str(amount))
+        if self.stats:
+            self.stats.on_bid_settled(self, amount, accepted, released)
+        return True
+    
+    def load_ledger_account(self, account):
+        """Replace in-memory capital state with a persisted ledger account"""
+        with self._lock:
+            self.capital = Decimal(str(account.get('capital', self.capital)))
+            self.available_capital = Decimal(str(account.get('available_capital', self.capital)))
+            self.active_bids = list(account.get('active_bids', []))
+            self.funded_loans = list(account.get('funded_loans', []))
+        self.apply_rate_overrides(account.get('rate_overrides', {}))
+        if self.stats:
+            self.stats.sync(self)
 
 class BotLenderManager:
     """Manages multiple bot lenders and their automated bidding"""
     
-    def __init__(self):
+    def __init__(self, max_workers=4, ledger=None, leader=None, allocation_mode='random',
+                 max_purpose_share=0.4, max_term_share=0.6, limiter=None, shard_processes=0,
+                 market_index=None, order_books=None):
+        self.stats = BotStatsTracker()
+        self.limiter = limiter
+        self.market_index = market_index
+        self.order_books = order_books
         self.bots = []
+        self.ledger = ledger
+        self.leader = leader
+        self.allocation_mode = allocation_mode
+        self.max_purpose_share = max_purpose_share
+        self.max_term_share = max_term_share
         self.running = False
         self.bid_thread = None
+        self.max_workers = max(1, int(max_workers))
+        # Evaluate bots in this many worker processes; 0 keeps evaluation in-process
+        self.shard_processes = max(0, int(shard_processes))
+        self._shard_pool = None
+        self._loan_locks = {}
+        self._loan_locks_guard = threading.Lock()
+    
+    @property
+    def bots(self):
+        return self._bots
+    
+    @bots.setter
+    def bots(self, bots):
+        """Replace the managed bots and rebuild the incremental stats"""
+        self._bots = list(bots)
+        for bot in self._bots:
+            bot.stats = self.stats
+            bot.limiter = self.limiter
+            bot.market_index = self.market_index
+        self.stats.reset(self._bots)
+    
+    def add_bot(self, bot):
+        """Start managing a bot"""
+        bot.stats = self.stats
+        bot.limiter = self.limiter
+        bot.market_index = self.market_index
+        self._bots.append(bot)
+        self.stats.register(bot)
         
     def create_bot_lenders(self):
         """Create a diverse set of bot lenders"""
@@ -281,16 +490,8 @@ class BotLenderManager:
         ]
         
         for config in bot_configs:
-            # Create bot user account
-            bot_id = user_model.create_user(
-                email=f"{config['name'].lower().replace(' ', '.')}@botlenders.com",
-                password="bot_secure_password_123",
-                first_name=config['name'].split()[0],
-                last_name="Bot",
-                phone="555-BOT-LEND",
-                user_type="lender",
-                annual_income=1000000  # High income for bots
-            )
+            email = f"{config['name'].lower().replace(' ', '.')}@botlenders.com"
+            bot_id = self._bot_user_id(email, config['name'])
             
             if bot_id:
                 bot = BotLender(
@@ -301,40 +502,148 @@ class BotLenderManager:
                     min_credit_score=config['min_credit_score'],
                     max_loan_amount=config['max_loan_amount'],
                     preferred_terms=config['preferred_terms'],
-                    risk_tolerance=config['risk_tolerance']
+                    risk_tolerance=config['risk_tolerance'],
+                    ledger=self.ledger
                 )
-                self.bots.append(bot)
+                self.add_bot(bot)
                 logger.info(f"Created bot lender: {config['name']} with ${config['capital']} capital")
             else:
                 logger.error(f"Failed to create bot user for {config['name']}")
+        
+        if self.ledger:
+            self.load_ledger(open_missing=True)
+    
+    def _bot_user_id(self, email, name):
+        """The bot's user id, creating its user at most once however many workers start together.
+
+        The id is derived from the email and the create is conditional on
+        that id, so racing workers all end up with the same account.
+        """
+        bot_id = str(uuid.uuid5(BOT_NAMESPACE, email))
+        if user_model.get_user_by_id(bot_id):
+            return bot_id
+        # Bots created before ids were derived keep their account, and with it their ledger
+        existing_user = user_model.get_user_by_email(email) if self.ledger else None
+        if existing_user:
+            return existing_user['id']
+        user_model.create_user(
+            email=email,
+            password="bot_secure_password_123",
+            first_name=name.split()[0],
+            last_name="Bot",
+            phone="555-BOT-LEND",
+            user_type="lender",
+            annual_income=1000000,  # High income for bots
+            user_id=bot_id
+        )
+        # Created now or by another worker a moment ago; either way the account exists
+        return bot_id
+    
+    def set_rate_override(self, bot_id, credit_bucket, amount_bucket, term_bucket, rate):
+        """Override a bot's grid cell here and in the ledger, so the bidding leader picks it up"""
+        bot = self.get_bot(bot_id)
+        if not bot:
+            return False
+        previous = (bot.rate_table, dict(bot.rate_overrides))
+        bot.rate_table = dict(bot.rate_table)
+        if not bot.set_rate_override(credit_bucket, amount_bucket, term_bucket, rate):
+            bot.rate_table, bot.rate_overrides = previous
+            return False
+        self._save_rate_overrides(bot, previous)
+        return True
+    
+    def reset_rate_table(self, bot_id):
+        """Drop a bot's overrides here and in the ledger"""
+        bot = self.get_bot(bot_id)
+        if not bot:
+            return False
+        previous = (bot.rate_table, dict(bot.rate_overrides))
+        bot.reset_rate_table()
+        self._save_rate_overrides(bot, previous)
+        return True
+    
+    def _save_rate_overrides(self, bot, previous):
+        """Persist a bot's overrides, restoring its previous grid if the ledger write fails"""
+        if self.ledger and not self.ledger.set_rate_overrides(bot.bot_id, bot.rate_overrides):
+            bot.rate_table, bot.rate_overrides = previous
+            raise LedgerWriteFailed(f"Could not save the pricing grid of {bot.name}")
+    
+    def load_ledger(self, open_missing=False):
+        """Rehydrate every bot's capital state with a single batch read"""
+        if not self.ledger or not self.bots:
+            return
+        
+        try:
+            self._wait_for_read()
+            accounts = self.ledger.get_accounts([bot.bot_id for bot in self.bots])
+        except Exception as e:
+            logger.error(f"Error loading bot ledger: {e}")
+            return
+        
+        for bot in self.bots:
+            account = accounts.get(bot.bot_id)
+            if account is None and open_missing:
+                account = self.ledger.open_account(bot.bot_id, bot.capital)
+            if account:
+                bot.load_ledger_account(account)
     
-    def start_automated_bidding(self, check_interval=30):
+    def start_automated_bidding(self, check_interval=30, max_workers=None):
         """Start the automated bidding process"""
         if self.running:
             logger.warning("Automated bidding is already running")
             return
         
+        if max_workers:
+            self.max_workers = max(1, int(max_workers))
+        if self.shard_processes and gevent_patched():
+            logger.warning("Running under gevent: bot sharding disabled, evaluating bots in-process")
+            self.shard_processes = 0
+        
         self.running = True
+        if self.leader:
+            self.leader.start()
         self.bid_thread = threading.Thread(
             target=self._bidding_loop,
             args=(check_interval,),
             daemon=True
         )
         self.bid_thread.start()
-        logger.info(f"Started automated bidding with {len(self.bots)} bots")
+        logger.info(f"Started automated bidding with {len(self.bots)} bots and {self.max_workers} workers")
     
     def stop_automated_bidding(self):
         """Stop the automated bidding process"""
         self.running = False
         if self.bid_thread:
             self.bid_thread.join(timeout=5)
+        if self.leader:
+            self.leader.stop()
+        if self._shard_pool:
+            self._shard_pool.shutdown(wait=False)
+            self._shard_pool = None
         logger.info("Stopped automated bidding")
     
+    def is_leader(self):
+        """Whether this process should run the bidding loop"""
+        return self.leader is None or self.leader.is_leader
+    
     def _bidding_loop(self, check_interval):
         """Main bidding loop that runs in a separate thread"""
+        last_refresh = 0
         while self.running:
+            # Followers poll at heartbeat speed so they can take over quickly
+            if not self.is_leader():
+                # They answer the admin stats too, so keep their view of the ledger current
+                if time.time() - last_refresh >= check_interval:
+                    last_refresh = time.time()
+                    self.load_ledger()
+                    self.stats.maybe_record_history()
+                time.sleep(min(check_interval, self.leader.heartbeat_interval))
+                continue
+            
             try:
                 self._process_new_loans()
+                decision_log.maybe_log_summary()
+                self.stats.maybe_record_history()
                 time.sleep(check_interval)
             except Exception as e:
                 logger.error(f"Error in bidding loop: {e}")
@@ -343,69 +652,268 @@ class BotLenderManager:
     def _process_new_loans(self):
         """Process new loan requests and place bids"""
         try:
+            # Pick up releases and commits made by other processes
+            self.load_ledger()
+            
             # Get all open loans
+            self._wait_for_read()
             open_loans = loan_model.get_all_open_loans()
+            self._prune_loan_locks({loan['id'] for loan in open_loans})
             
             if not open_loans:
                 logger.debug("No open loans found")
                 return
             
-            for loan in open_loans:
-                # Get borrower information
-                borrower_data = user_model.get_user_by_id(loan['borrower_id'])
-                if not borrower_data:
-                    continue
-                
-                # Get existing bids for this loan
-                existing_bids = bid_model.get_bids_for_loan(loan['id'])
+            if self.allocation_mode == 'portfolio':
+                self._allocate_portfolio(open_loans)
+                return
+            
+            if self.shard_processes:
+                self._process_sharded(open_loans)
+                return
+            
+            # Loans are independent, so evaluate them on a bounded worker pool
+            bot_ids = [bot.bot_id for bot in self.bots]
+            with ThreadPoolExecutor(max_workers=self.max_workers,
+                                    thread_name_prefix='bot-bidder') as executor:
+                futures = [executor.submit(self._process_loan, loan, bot_ids) for loan in open_loans]
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Error processing loan: {e}")
+                    
+        except Exception as e:
+            logger.error(f"Error processing new loans: {e}")
+    
+    def _wait_for_read(self):
+        """Take a token from the shared read budget, if one is configured"""
+        if self.limiter:
+            self.limiter.acquire_read()
+    
+    def _get_loan_lock(self, loan_id):
+        """Get the lock that serializes bot bidding on a single loan"""
+        with self._loan_locks_guard:
+            lock = self._loan_locks.get(loan_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._loan_locks[loan_id] = lock
+            return lock
+    
+    def _prune_loan_locks(self, open_ids):
+        """Drop the locks of loans that are no longer open"""
+        with self._loan_locks_guard:
+            for loan_id in [loan_id for loan_id in self._loan_locks if loan_id not in open_ids]:
+                del self._loan_locks[loan_id]
+    
+    def _process_loan(self, loan, bot_ids):
+        """Evaluate one loan and place bids from a random subset of bots"""
+        # Stop mid-tick if another worker has taken over
+        if not self.is_leader():
+            return
+        
+        # Get borrower information
+        self._wait_for_read()
+        borrower_data = user_model.get_user_by_id(loan['borrower_id'])
+        if not borrower_data:
+            return
+        
+        # Hold the loan lock while counting and placing so the per-loan cap holds
+        with self._get_loan_lock(loan['id']):
+            # Bots that already bid, including bids accepted by a partial fill
+            bidder_ids = self._get_loan_bidders(loan['id'], bot_ids)
+            
+            # Limit bot bids per loan (max 3 bots can bid on same loan)
+            if len(bidder_ids) >= 3:
+                return
+            
+            # Randomly select bots to bid (not all bots bid on every loan)
+            available_bots = [bot for bot in self.bots if bot.bot_id not in bidder_ids]
+            
+            # Each loan gets 1-2 bot bids with some probability
+            num_bids = random.choices([0, 1, 2], weights=[0.3, 0.5, 0.2])[0]
+            num_bids = min(num_bids, len(available_bots), 3 - len(bidder_ids))
+            selected_bots = random.sample(available_bots, num_bids)
+            
+            for bot in selected_bots:
+                # Add some delay between bids to seem more natural
+                time.sleep(random.uniform(1, 5))
+                bot.place_bid(loan, borrower_data)
+    
+    def _load_loan_context(self, loan, bot_ids):
+        """Fetch the borrower and the bots already bidding on a loan"""
+        self._wait_for_read()
+        borrower_data = user_model.get_user_by_id(loan['borrower_id'])
+        if not borrower_data:
+            return None
+        return loan, borrower_data, self._get_loan_bidders(loan['id'], bot_ids)
+    
+    def _get_loan_bidders(self, loan_id, bot_ids):
+        """Bots with a pending or accepted bid on a loan, from the shared order book when one is configured"""
+        if self.order_books:
+            book = self.order_books.get(loan_id)
+            lender_ids = {bid['lender_id'] for bid in book.sorted_bids()} | set(book.filled_lenders)
+        else:
+            self._wait_for_read()
+            lender_ids = {bid['lender_id'] for bid in bid_model.get_bids_for_loan(loan_id)}
+        return lender_ids & set(bot_ids)
+    
+    def _allocate_portfolio(self, open_loans):
+        """Bid on each bot's best set of loans given its capital and diversification caps"""
+        bot_ids = {bot.bot_id for bot in self.bots}
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix='bot-bidder') as executor:
+            contexts = executor.map(lambda loan: self._load_loan_context(loan, bot_ids), open_loans)
+            contexts = [context for context in contexts if context]
+            
+            # Max 3 bot bids per loan, shared by all bots this tick
+            open_slots = {loan['id']: 3 - len(bidder_ids) for loan, _, bidder_ids in contexts}
+            intents = []
+            
+            for bot in self.bots:
+                candidates = []
+                loans_by_id = {}
+                for loan, borrower_data, bidder_ids in contexts:
+                    if open_slots[loan['id']] <= 0 or bot.bot_id in bidder_ids:
+                        continue
+                    if not bot.should_bid_on_loan(loan, borrower_data):
+                        continue
+                    rate = bot.calculate_interest_rate(loan, borrower_data)
+                    bucket = credit_bucket(borrower_data.get('credit_score', 0))
+                    candidates.append(Candidate(
+                        loan_id=loan['id'],
+                        amount=float(loan['amount']),
+                        rate=rate,
+                        expected_yield=expected_yield(rate, bucket),
+                        purpose=loan.get('purpose', ''),
+                        term_months=loan['term_months']
+                    ))
+                    loans_by_id[loan['id']] = (loan, borrower_data)
                 
-                # Check if any of our bots have already bid
-                bot_ids = [bot.bot_id for bot in self.bots]
-                existing_bot_bids = [bid for bid in existing_bids if bid['lender_id'] in bot_ids]
+                chosen = allocate_capital(candidates, bot.available_capital,
+                                          self.max_purpose_share, self.max_term_share)
+                for candidate in chosen:
+                    open_slots[candidate.loan_id] -= 1
+                    loan, borrower_data = loans_by_id[candidate.loan_id]
+                    intents.append((bot, loan, borrower_data, candidate.rate))
                 
-                # Limit bot bids per loan (max 3 bots can bid on same loan)
-                if len(existing_bot_bids) >= 3:
-                    continue
+                if chosen:
+                    logger.info(f"{bot.name}: Allocated ${sum(c.amount for c in chosen):,.0f} "
+                                f"across {len(chosen)} of {len(candidates)} eligible loans")
+            
+            futures = [executor.submit(self._place_intent, *intent) for intent in intents]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Error placing allocated bid: {e}")
+    
+    def _process_sharded(self, open_loans):
+        """Evaluate bots across worker processes and place the merged bid intents"""
+        bot_ids = {bot.bot_id for bot in self.bots}
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix='bot-bidder') as executor:
+            contexts = executor.map(lambda loan: self._load_loan_context(loan, bot_ids), open_loans)
+            contexts = [context for context in contexts if context]
+            if not contexts:
+                return
+            
+            snapshot = LoanSnapshot.create(contexts)
+            try:
+                if self._shard_pool is None:
+                    self._shard_pool = ProcessPoolExecutor(max_workers=self.shard_processes)
+                shards = shard_bots(self.bots, self.shard_processes)
+                futures = [self._shard_pool.submit(evaluate_shard, shard, snapshot.layout) for shard in shards]
                 
-                # Randomly select bots to bid (not all bots bid on every loan)
-                available_bots = [bot for bot in self.bots if bot.bot_id not in [bid['lender_id'] for bid in existing_bot_bids]]
+                # Bot intents per loan index, in bot order so selection is reproducible
+                eligible = {}
+                for future in futures:
+                    shard_intents, decisions = future.result()
+                    decision_log.merge(decisions)
+                    for bot_index, loan_index, rate in shard_intents:
+                        eligible.setdefault(loan_index, []).append((bot_index, rate))
+            finally:
+                snapshot.close()
+            
+            intents = []
+            for loan_index, candidates in sorted(eligible.items()):
+                loan, borrower_data, bidder_ids = contexts[loan_index]
+                candidates.sort()
                 
-                # Each loan gets 1-2 bot bids with some probability
+                # Same selection as _process_loan: 0-2 bids, max 3 bot bids per loan
                 num_bids = random.choices([0, 1, 2], weights=[0.3, 0.5, 0.2])[0]
-                selected_bots = random.sample(available_bots, min(num_bids, len(available_bots)))
-                
-                for bot in selected_bots:
-                    # Add some delay between bids to seem more natural
-                    time.sleep(random.uniform(1, 5))
-                    bot.place_bid(loan, borrower_data)
-                    
-        except Exception as e:
-            logger.error(f"Error processing new loans: {e}")
+                num_bids = min(num_bids, len(candidates), 3 - len(bidder_ids))
+                for bot_index, rate in random.sample(candidates, max(0, num_bids)):
+                    # Workers price off the grid only; reprice here against the market index
+                    if self.market_index:
+                        rate = None
+                    intents.append((self.bots[bot_index], loan, borrower_data, rate))
+            
+            futures = [executor.submit(self._place_intent, *intent) for intent in intents]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Error placing sharded bid: {e}")
     
-    def get_bot_stats(self):
-        """Get statistics about bot performance"""
-        stats = {
-            'total_bots': len(self.bots),
-            'total_capital': sum(bot.capital for bot in self.bots),
-            'available_capital': sum(bot.available_capital for bot in self.bots),
-            'active_bids': sum(len(bot.active_bids) for bot in self.bots),
-            'funded_loans': sum(len(bot.funded_loans) for bot in self.bots),
-            'bots': []
-        }
+    def _place_intent(self, bot, loan, borrower_data, interest_rate):
+        """Place one bid chosen by the allocator or a bot shard"""
+        if not self.is_leader():
+            return None
+        with self._get_loan_lock(loan['id']):
+            return bot.place_bid(loan, borrower_data, interest_rate=interest_rate)
+    
+    def explain_loan(self, loan_id):
+        """Re-evaluate a loan against every bot with tracing on; no bids are placed"""
+        loan = loan_model.get_loan_request(loan_id)
+        if not loan:
+            return None
+        borrower_data = user_model.get_user_by_id(loan['borrower_id']) or {}
         
+        decision_log.start_trace(loan_id)
+        for bot in self.bots:
+            if bot.should_bid_on_loan(loan, borrower_data):
+                decision_log.record(bot.name, loan_id, 'quoted_rate',
+                                    interest_rate=bot.calculate_interest_rate(loan, borrower_data))
+        return decision_log.get_trace(loan_id)
+    
+    def get_bot(self, bot_id):
+        """Look up a managed bot by its user id"""
         for bot in self.bots:
-            bot_stats = {
+            if bot.bot_id == bot_id:
+                return bot
+        return None
+    
+    def get_rate_tables(self):
+        """Get the pricing grid of every bot, keyed by bot id"""
+        return {
+            bot.bot_id: {
                 'name': bot.name,
                 'strategy': bot.strategy,
-                'capital': float(bot.capital),
-                'available_capital': float(bot.available_capital),
-                'utilization': float((bot.capital - bot.available_capital) / bot.capital * 100),
-                'active_bids': len(bot.active_bids),
-                'funded_loans': len(bot.funded_loans)
+                'rates': bot.get_rate_table()
             }
-            stats['bots'].append(bot_stats)
-        
+            for bot in self.bots
+        }
+    
+    def record_bid_status(self, lender_id, bid_id, amount, status, loan_id=None, released=0):
+        """Apply an accepted (possibly partially filled) or rejected bid to the bot that placed it"""
+        if status not in ('accepted', 'rejected'):
+            return False
+        bot = self.get_bot(lender_id)
+        if not bot:
+            return False
+        return bot.settle_bid(bid_id, amount, status == 'accepted', loan_id, released)
+    
+    def get_bot_stats(self):
+        """Get statistics about bot performance"""
+        stats = self.stats.snapshot()
+        stats['leader'] = self.leader.describe() if self.leader else None
+        stats['rate_limiter'] = self.limiter.get_stats() if self.limiter else None
         return stats
+    
+    def get_stats_history(self):
+        """Get the time series of recorded stats snapshots"""
+        return self.stats.get_history()
 
 # Global bot manager instance
 bot_manager = BotLenderManager()
@@ -0,0 +1,171 @@
+import logging
+import sys
+from array import array
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+# Snapshot column name and array typecode; purpose is stored as a vocabulary index
+SNAPSHOT_COLUMNS = [
+    ('amount', 'd'),
+    ('max_interest_rate', 'd'),
+    ('annual_income', 'd'),
+    ('term_months', 'i'),
+    ('credit_score', 'i'),
+    ('purpose', 'i')
+]
+
+class LoanSnapshot:
+    """Open loans packed into one shared-memory block of typed columns.
+
+    The leader writes the block once per tick; shard workers attach to it by
+    name and read the columns without the loans being pickled per worker.
+    Loans are referred to by their index in the snapshot.
+    """
+
+    def __init__(self, shm, layout):
+        self.shm = shm
+        self.layout = layout
+
+    @classmethod
+    def create(cls, contexts):
+        """Pack (loan, borrower, bidder_ids) contexts into shared memory"""
+        purposes = []
+        purpose_codes = {}
+        columns = {name: array(typecode) for name, typecode in SNAPSHOT_COLUMNS}
+        for loan, borrower, _ in contexts:
+            purpose = loan.get('purpose', '')
+            if purpose not in purpose_codes:
+                purpose_codes[purpose] = len(purposes)
+                purposes.append(purpose)
+            columns['amount'].append(float(loan['amount']))
+            columns['max_interest_rate'].append(float(loan['max_interest_rate']))
+            columns['annual_income'].append(float(borrower.get('annual_income', 0) or 0))
+            columns['term_months'].append(int(loan['term_months']))
+            columns['credit_score'].append(int(borrower.get('credit_score', 0) or 0))
+            columns['purpose'].append(purpose_codes[purpose])
+
+        offsets = {}
+        size = 0
+        for name, typecode in SNAPSHOT_COLUMNS:
+            offsets[name] = size
+            size += len(columns[name]) * columns[name].itemsize
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, _ in SNAPSHOT_COLUMNS:
+            data = columns[name].tobytes()
+            shm.buf[offsets[name]:offsets[name] + len(data)] = data
+
+        layout = {
+            'name': shm.name,
+            'count': len(contexts),
+            'offsets': offsets,
+            'purposes': purposes,
+            # Only loans that already have bot bids are listed
+            'bidders': {i: list(bidder_ids) for i, (_, _, bidder_ids) in enumerate(contexts) if bidder_ids}
+        }
+        return cls(shm, layout)
+
+    def close(self):
+        """Release the block; called by the leader once the tick is done"""
+        self.shm.close()
+        self.shm.unlink()
+
+def gevent_patched():
+    """Whether gevent has monkey-patched this process, as gunicorn's gevent workers do.
+
+    Process pools and shared memory are not safe there, so the caller should
+    evaluate bots in-process instead.
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    return bool(monkey and monkey.is_module_patched('threading'))
+
+def _attach(layout):
+    """Attach to a snapshot created by the leader"""
+    # Pool workers share the leader's resource tracker, so attaching does not
+    # hand ownership over; the leader unlinks the block in close()
+    shm = shared_memory.SharedMemory(name=layout['name'])
+
+    count = layout['count']
+    columns = {}
+    for name, typecode in SNAPSHOT_COLUMNS:
+        start = layout['offsets'][name]
+        itemsize = array(typecode).itemsize
+        columns[name] = shm.buf[start:start + count * itemsize].cast(typecode)
+    return shm, columns
+
+def evaluate_shard(bot_configs, layout):
+    """Worker entry point for one shard of bots.
+
+    Returns (bot_index, loan_index, rate) intents and the decision counts
+    recorded while evaluating, which the leader merges into its own log.
+    """
+    from bot_lenders import BotLender, decision_log
+
+    logging.getLogger('bot_lenders').setLevel(logging.WARNING)
+    # Pool workers are reused across ticks, so return only this call's counts
+    before = decision_log.counts()
+
+    bots = []
+    for config in bot_configs:
+        config = dict(config)
+        index = config.pop('index')
+        available_capital = config.pop('available_capital')
+        rate_table = config.pop('rate_table', None)
+        bot = BotLender(**config)
+        bot.available_capital = available_capital
+        if rate_table:
+            bot.rate_table = rate_table
+        bots.append((index, bot))
+
+    shm, columns = _attach(layout)
+    intents = []
+    try:
+        purposes = layout['purposes']
+        bidders = layout['bidders']
+        for loan_index in range(layout['count']):
+            loan = {
+                'id': loan_index,
+                'amount': columns['amount'][loan_index],
+                'max_interest_rate': columns['max_interest_rate'][loan_index],
+                'term_months': columns['term_months'][loan_index],
+                'purpose': purposes[columns['purpose'][loan_index]]
+            }
+            borrower = {
+                'credit_score': columns['credit_score'][loan_index],
+                'annual_income': columns['annual_income'][loan_index]
+            }
+            existing = bidders.get(loan_index, ())
+            for bot_index, bot in bots:
+                if bot.bot_id in existing:
+                    continue
+                if bot.should_bid_on_loan(loan, borrower):
+                    intents.append((bot_index, loan_index, bot.calculate_interest_rate(loan, borrower)))
+    finally:
+        for view in columns.values():
+            view.release()
+        shm.close()
+    return intents, dict(decision_log.counts() - before)
+
+def bot_config(index, bot):
+    """Picklable description of a bot's current state for a shard worker"""
+    return {
+        'index': index,
+        'bot_id': bot.bot_id,
+        'name': bot.name,
+        'strategy': bot.strategy,
+        'capital': bot.capital,
+        'min_credit_score': bot.min_credit_score,
+        'max_loan_amount': bot.max_loan_amount,
+        'preferred_terms': bot.preferred_terms,
+        'risk_tolerance': bot.risk_tolerance,
+        'available_capital': bot.available_capital,
+        'rate_table': bot.rate_table
+    }
+
+def shard_bots(bots, shard_count):
+    """Split bots round-robin into shard_count groups of worker configs"""
+    shards = [[] for _ in range(max(1, shard_count))]
+    for i, bot in enumerate(bots):
+        shards[i % len(shards)].append(bot_config(i, bot))
+    return [shard for shard in shards if shard]
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import deque
+
+# Per-bot fields whose totals are reported under a different name
+TOTAL_FIELDS = {'capital': 'total_capital'}
+
+class RollingCounter:
+    """Event count over a sliding window using fixed one-second buckets"""
+
+    def __init__(self, window_seconds=60):
+        self.window_seconds = window_seconds
+        self.counts = [0] * window_seconds
+        self.stamps = [0] * window_seconds
+
+    def add(self, now=None, count=1):
+        second = int(now if now is not None else time.time())
+        index = second % self.window_seconds
+        if self.stamps[index] != second:
+            self.stamps[index] = second
+            self.counts[index] = 0
+        self.counts[index] += count
+
+    def total(self, now=None):
+        second = int(now if now is not None else time.time())
+        return sum(count for count, stamp in zip(self.counts, self.stamps)
+                   if second - stamp < self.window_seconds)
+
+class BotStatsTracker:
+    """Bot statistics kept up to date on every bid event.
+
+    Totals are adjusted by deltas, so a snapshot never walks bots' bid
+    lists. History is a ring buffer of snapshots for the admin chart.
+    """
+
+    def __init__(self, history_size=1440, history_interval=60):
+        self.history = deque(maxlen=history_size)
+        self.history_interval = history_interval
+        self.last_history = 0
+        self.bid_rate = RollingCounter(60)
+        self._lock = threading.Lock()
+        self.reset([])
+
+    def reset(self, bots):
+        """Rebuild all counters from a new set of bots"""
+        with self._lock:
+            self.per_bot = {}
+            self.totals = {
+                'total_bots': 0,
+                'total_capital': 0.0,
+                'available_capital': 0.0,
+                'active_bids': 0,
+                'funded_loans': 0,
+                'bids_placed': 0,
+                'bids_accepted': 0,
+                'bids_rejected': 0
+            }
+        for bot in bots:
+            self.register(bot)
+
+    def register(self, bot):
+        """Start tracking a bot"""
+        with self._lock:
+            self.per_bot[bot] = {
+                'name': bot.name,
+                'strategy': bot.strategy,
+                'capital': 0.0,
+                'available_capital': 0.0,
+                'utilization': 0.0,
+                'active_bids': 0,
+                'funded_loans': 0,
+                'bids_placed': 0,
+                'bids_accepted': 0,
+                'bids_rejected': 0
+            }
+            self.totals['total_bots'] += 1
+        self.sync(bot)
+
+    def sync(self, bot):
+        """Re-read one bot's capital state after it changed outside of an event"""
+        self._apply(bot, {
+            'capital': float(bot.capital),
+            'available_capital': float(bot.available_capital),
+            'active_bids': len(bot.active_bids),
+            'funded_loans': len(bot.funded_loans)
+        }, absolute=True)
+
+    def on_bid_placed(self, bot, amount):
+        """A bot placed a bid and reserved amount"""
+        self._apply(bot, {'available_capital': -float(amount), 'active_bids': 1, 'bids_placed': 1})
+        self.bid_rate.add()
+
+    def on_bid_settled(self, bot, amount, accepted, released=0):
+        """A bot's bid was accepted (capital committed, any unfilled part released) or rejected"""
+        if accepted:
+            self._apply(bot, {'available_capital': float(released), 'active_bids': -1,
+                              'funded_loans': 1, 'bids_accepted': 1})
+        else:
+            self._apply(bot, {'available_capital': float(amount), 'active_bids': -1, 'bids_rejected': 1})
+
+    def _apply(self, bot, changes, absolute=False):
+        """Apply deltas (or absolute values) to one bot and the totals"""
+        with self._lock:
+            entry = self.per_bot.get(bot)
+            if entry is None:
+                return
+            for field, value in changes.items():
+                delta = value - entry[field] if absolute else value
+                entry[field] += delta
+                self.totals[TOTAL_FIELDS.get(field, field)] += delta
+            capital = entry['capital']
+            entry['utilization'] = (capital - entry['available_capital']) / capital * 100 if capital else 0.0
+
+    def snapshot(self):
+        """Current totals and per-bot figures without iterating any bid lists"""
+        with self._lock:
+            stats = dict(self.totals)
+            stats['bots'] = [dict(entry) for entry in self.per_bot.values()]
+        capital = stats['total_capital']
+        stats['utilization'] = (capital - stats['available_capital']) / capital * 100 if capital else 0.0
+        stats['bid_rate_per_minute'] = self.bid_rate.total()
+        return stats
+
+    def maybe_record_history(self, force=False):
+        """Append a point to the time-series ring buffer once per interval"""
+        now = time.time()
+        if not force and now - self.last_history < self.history_interval:
+            return
+        self.last_history = now
+        with self._lock:
+            point = {
+                'timestamp': now,
+                'available_capital': self.totals['available_capital'],
+                'active_bids': self.totals['active_bids'],
+                'funded_loans': self.totals['funded_loans'],
+                'bids_placed': self.totals['bids_placed']
+            }
+        point['bid_rate_per_minute'] = self.bid_rate.total(now)
+        self.history.append(point)
+
+    def get_history(self):
+        """Recorded snapshots, oldest first"""
+        return list(self.history)
@@ -3,8 +3,13 @@ import uuid
 from datetime import datetime, timedelta
 from decimal import Decimal
 from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.types import TypeSerializer
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import queue
+import threading
+import time
+from collections import namedtuple
 
 # Initialize DynamoDB
 dynamodb = boto3.resource('dynamodb', region_name=os.getenv('AWS_DEFAULT_REGION', 'us-east-1'))
@@ -13,6 +18,223 @@ dynamodb = boto3.resource('dynamodb', region_name=os.getenv('AWS_DEFAULT_REGION'
 USERS_TABLE = 'p2p-lending-users'
 LOAN_REQUESTS_TABLE = 'p2p-lending-loan-requests'
 BIDS_TABLE = 'p2p-lending-bids'
+BOT_LEDGER_TABLE = 'p2p-lending-bot-ledger'
+LEASES_TABLE = 'p2p-lending-leases'
+AUTO_INVEST_RULES_TABLE = 'p2p-lending-auto-invest-rules'
+IDEMPOTENCY_KEYS_TABLE = 'p2p-lending-idempotency-keys'
+
+# How long a loan request stays open for bids
+LOAN_AUCTION_DAYS = 30
+
+# Domain events, published on the event bus after each successful write
+LoanCreated = namedtuple('LoanCreated', ['loan'])
+LoanStatusChanged = namedtuple('LoanStatusChanged', ['loan_id', 'status'])
+BidCreated = namedtuple('BidCreated', ['bid'])
+BidStatusChanged = namedtuple('BidStatusChanged', ['bid_id', 'status', 'loan_request_id', 'filled_amount',
+                                                   'interest_rate'], defaults=(None, None, None))
+
+LOAN_EVENTS = (LoanCreated, LoanStatusChanged)
+BID_EVENTS = (BidCreated, BidStatusChanged)
+DOMAIN_EVENTS = {event_type.__name__: event_type for event_type in LOAN_EVENTS + BID_EVENTS}
+
+# What an asynchronous subscriber does with an event when its queue is full
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+_STOP = object()
+
+def legacy_event(event):
+    """(event, item) pair for listeners registered with add_listener"""
+    if isinstance(event, LoanCreated):
+        return 'created', event.loan
+    if isinstance(event, BidCreated):
+        return 'created', event.bid
+    if isinstance(event, LoanStatusChanged):
+        return 'status', {'id': event.loan_id, 'status': event.status}
+    item = {'id': event.bid_id, 'status': event.status, 'loan_request_id': event.loan_request_id}
+    if event.filled_amount is not None:
+        item['filled_amount'] = event.filled_amount
+    return 'status', item
+
+def batch_put_items(table_name, items, max_attempts=5):
+    """Put items with BatchWriteItem, 25 per request, resending unprocessed ones with backoff.
+    
+    Returns the ids of items still unwritten after max_attempts.
+    """
+    failed = set()
+    for start in range(0, len(items), 25):
+        request_items = {table_name: [{'PutRequest': {'Item': item}} for item in items[start:start + 25]]}
+        attempts = 0
+        while request_items:
+            try:
+                response = dynamodb.batch_write_item(RequestItems=request_items)
+                request_items = response.get('UnprocessedItems') or None
+            except Exception as e:
+                print(f"Error writing batch to {table_name}: {e}")
+            attempts += 1
+            if request_items and attempts >= max_attempts:
+                failed.update(put['PutRequest']['Item']['id'] for put in request_items[table_name])
+                break
+            if request_items:
+                # Unprocessed items mean throttling; back off before resending them
+                time.sleep(min(0.05 * 2 ** attempts, 2))
+    return failed
+
+class EventSubscription:
+    """A handler for some event types; asynchronous ones get a bounded queue and a worker thread.
+    
+    remote=False skips events that arrived from other processes through the
+    bus transport, for handlers whose side effects must happen only once.
+    """
+    
+    def __init__(self, event_types, handler, asynchronous=False, max_queue=1000, overflow='drop_oldest',
+                 block_timeout=1.0, name=None, remote=True):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.event_types = tuple(event_types)
+        self.handler = handler
+        self.asynchronous = asynchronous
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.remote = remote
+        self.name = name or getattr(handler, '__qualname__', repr(handler))
+        self.queue = queue.Queue(max_queue) if asynchronous else None
+        self.stats = {'delivered': 0, 'dropped': 0, 'failed': 0}
+        self._thread = None
+        if asynchronous:
+            self._thread = threading.Thread(target=self._run, daemon=True, name=f'events-{self.name}')
+            self._thread.start()
+    
+    def deliver(self, event):
+        """Handle an event now, or queue it according to the overflow policy"""
+        if not self.asynchronous:
+            self._call(event)
+        elif self.overflow == 'block':
+            # Backpressure: the publisher waits, but never forever
+            try:
+                self.queue.put(event, timeout=self.block_timeout)
+            except queue.Full:
+                self.stats['dropped'] += 1
+        elif self.overflow == 'drop_newest':
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                self.stats['dropped'] += 1
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(event)
+                    return
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.stats['dropped'] += 1
+                    except queue.Empty:
+                        pass
+    
+    def _call(self, event):
+        try:
+            self.handler(event)
+            self.stats['delivered'] += 1
+        except Exception as e:
+            self.stats['failed'] += 1
+            print(f"Error in event subscriber {self.name}: {e}")
+    
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            if event is _STOP:
+                return
+            self._call(event)
+    
+    def stop(self, timeout=5):
+        """Let an asynchronous subscriber finish its queue, then end its thread"""
+        if self._thread:
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass  # Stuck handler; the thread is a daemon
+            self._thread.join(timeout=timeout)
+            self._thread = None
+    
+    def describe(self):
+        return {
+            'name': self.name,
+            'events': [event_type.__name__ for event_type in self.event_types],
+            'asynchronous': self.asynchronous,
+            'overflow': self.overflow if self.asynchronous else None,
+            'queued': self.queue.qsize() if self.asynchronous else 0,
+            **self.stats
+        }
+
+class EventBus:
+    """In-process publish/subscribe for model writes.
+    
+    Synchronous subscribers run in the writer's thread before the model
+    call returns; asynchronous ones get their own bounded queue and thread
+    so a slow consumer never holds up a request. With a transport set,
+    published events also go to other processes, and events arriving from
+    them are dispatched to local subscribers only.
+    """
+    
+    def __init__(self):
+        self.subscriptions = []
+        self.transport = None
+        self.stats = {'published': 0, 'received': 0, 'transport_errors': 0}
+        self._lock = threading.Lock()
+    
+    def subscribe(self, event_types, handler, **options):
+        """Call handler(event) for each event of the given types; see EventSubscription for options"""
+        subscription = EventSubscription(event_types, handler, **options)
+        with self._lock:
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscriptions = [existing for existing in self.subscriptions if existing is not subscription]
+        subscription.stop()
+    
+    def publish(self, event):
+        """Deliver an event here and, through the transport, to other processes"""
+        self.stats['published'] += 1
+        self.dispatch(event)
+        if self.transport is not None:
+            try:
+                self.transport.send(event)
+            except Exception as e:
+                self.stats['transport_errors'] += 1
+                print(f"Error sending event over transport: {e}")
+    
+    def dispatch(self, event, remote=False):
+        """Deliver an event to local subscribers only; remote events skip those that opted out"""
+        for subscription in self.subscriptions:
+            if isinstance(event, subscription.event_types) and (subscription.remote or not remote):
+                subscription.deliver(event)
+    
+    def _receive(self, event):
+        self.stats['received'] += 1
+        self.dispatch(event, remote=True)
+    
+    def set_transport(self, transport):
+        """Start sending and receiving events through transport (start(deliver), send(event), stop())"""
+        if self.transport is not None:
+            self.transport.stop()
+        self.transport = transport
+        if transport is not None:
+            transport.start(self._receive)
+    
+    def close(self):
+        """Stop the transport and drain asynchronous subscribers"""
+        self.set_transport(None)
+        for subscription in self.subscriptions:
+            subscription.stop()
+    
+    def describe(self):
+        return {
+            **self.stats,
+            'transport': type(self.transport).__name__ if self.transport else None,
+            'subscriptions': [subscription.describe() for subscription in self.subscriptions]
+        }
 
 class DynamoDBUser:
     def __init__(self):
@@ -20,8 +242,9 @@ class DynamoDBUser:
     
     def create_user(self, email, password, first_name, last_name, phone, user_type, 
                    credit_score=None, annual_income=None, social_login=False, provider=None, 
-                   provider_id=None, email_verified=False, picture=None):
-        user_id = str(uuid.uuid4())
+                   provider_id=None, email_verified=False, picture=None, user_id=None):
+        """Write a new user; a caller-chosen user_id makes a repeated create a no-op returning None"""
+        user_id = user_id or str(uuid.uuid4())
         
         # Hash password only if provided (not for social login)
         password_hash = None
@@ -92,13 +315,36 @@ class DynamoDBUser:
         except:
             return None
     
+    def get_users(self, user_ids):
+        """Batch read users, returned as a dict keyed by user id"""
+        users = {}
+        user_ids = list(dict.fromkeys(user_ids))
+        
+        # BatchGetItem accepts at most 100 keys per request
+        for start in range(0, len(user_ids), 100):
+            request_items = {
+                USERS_TABLE: {'Keys': [{'id': user_id} for user_id in user_ids[start:start + 100]]}
+            }
+            while request_items:
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(USERS_TABLE, []):
+                    users[item['id']] = item
+                request_items = response.get('UnprocessedKeys') or None
+        
+        return users
+    
     def get_user_by_email(self, email):
         try:
-            response = self.table.scan(
-                FilterExpression=Attr('email').eq(email)
-            )
-            items = response.get('Items', [])
-            return items[0] if items else None
+            kwargs = {'FilterExpression': Attr('email').eq(email)}
+            while True:
+                # Filters apply per 1MB page, so an empty page doesn't mean no match
+                response = self.table.scan(**kwargs)
+                items = response.get('Items', [])
+                if items:
+                    return items[0]
+                if 'LastEvaluatedKey' not in response:
+                    return None
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
         except:
             return None
     
@@ -106,15 +352,21 @@ class DynamoDBUser:
         return check_password_hash(user['password_hash'], password)
 
 class DynamoDBLoanRequest:
-    def __init__(self):
+    def __init__(self, bus=None):
         self.table = dynamodb.Table(LOAN_REQUESTS_TABLE)
+        self.bus = bus or EventBus()
     
-    def create_loan_request(self, borrower_id, amount, purpose, term_months, max_interest_rate, description=''):
-        loan_id = str(uuid.uuid4())
-        expires_at = datetime.utcnow() + timedelta(days=30)  # 30 days to get bids
-        
-        item = {
-            'id': loan_id,
+    def add_listener(self, listener, **options):
+        """Call listener(event, loan) after a loan is created or changes status; options as for EventBus.subscribe"""
+        return self.bus.subscribe(LOAN_EVENTS, lambda event: listener(*legacy_event(event)),
+                                  name=options.pop('name', getattr(listener, '__qualname__', None)), **options)
+    
+    def build_loan_item(self, borrower_id, amount, purpose, term_months, max_interest_rate, description='',
+                        loan_id=None):
+        """A new open loan request item, not yet written"""
+        expires_at = datetime.utcnow() + timedelta(days=LOAN_AUCTION_DAYS)
+        return {
+            'id': loan_id or str(uuid.uuid4()),
             'borrower_id': borrower_id,
             'amount': Decimal(str(amount)),
             'purpose': purpose,
@@ -125,9 +377,20 @@ class DynamoDBLoanRequest:
             'created_at': datetime.utcnow().isoformat(),
             'expires_at': expires_at.isoformat()
         }
-        
+    
+    def create_loan_request(self, borrower_id, amount, purpose, term_months, max_interest_rate, description=''):
+        item = self.build_loan_item(borrower_id, amount, purpose, term_months, max_interest_rate, description)
         self.table.put_item(Item=item)
-        return loan_id
+        self.bus.publish(LoanCreated(item))
+        return item['id']
+    
+    def put_loans(self, items, max_attempts=5):
+        """Write built loan items with BatchWriteItem; returns the ids that could not be written"""
+        failed = batch_put_items(LOAN_REQUESTS_TABLE, items, max_attempts)
+        for item in items:
+            if item['id'] not in failed:
+                self.bus.publish(LoanCreated(item))
+        return failed
     
     def get_loan_request(self, loan_id):
         try:
@@ -136,12 +399,34 @@ class DynamoDBLoanRequest:
         except:
             return None
     
+    def get_loan_requests(self, loan_ids):
+        """Batch read loan requests, returned as a dict keyed by loan id"""
+        loans = {}
+        loan_ids = list(dict.fromkeys(loan_ids))
+        
+        # BatchGetItem accepts at most 100 keys per request
+        for start in range(0, len(loan_ids), 100):
+            request_items = {
+                LOAN_REQUESTS_TABLE: {'Keys': [{'id': loan_id} for loan_id in loan_ids[start:start + 100]]}
+            }
+            while request_items:
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(LOAN_REQUESTS_TABLE, []):
+                    loans[item['id']] = item
+                request_items = response.get('UnprocessedKeys') or None
+        
+        return loans
+    
     def get_all_open_loans(self):
         try:
-            response = self.table.scan(
-                FilterExpression=Attr('status').eq('open')
-            )
-            return response.get('Items', [])
+            kwargs = {'FilterExpression': Attr('status').eq('open')}
+            loans = []
+            while True:
+                response = self.table.scan(**kwargs)
+                loans.extend(response.get('Items', []))
+                if 'LastEvaluatedKey' not in response:
+                    return loans
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
         except:
             return []
     
@@ -162,15 +447,43 @@ class DynamoDBLoanRequest:
                 ExpressionAttributeNames={'#status': 'status'},
                 ExpressionAttributeValues={':status': status}
             )
+            self.bus.publish(LoanStatusChanged(loan_id, status))
             return True
         except:
             return False
 
+    def expire_loan(self, loan_id):
+        """Mark an open loan expired; False if it was already funded or closed"""
+        try:
+            self.table.update_item(
+                Key={'id': loan_id},
+                UpdateExpression='SET #status = :expired',
+                ConditionExpression='#status = :open',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':expired': 'expired', ':open': 'open'}
+            )
+            self.bus.publish(LoanStatusChanged(loan_id, 'expired'))
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception as e:
+            print(f"Error expiring loan: {e}")
+            return False
+
 class DynamoDBBid:
-    def __init__(self):
+    def __init__(self, loan_model=None, bus=None):
         self.table = dynamodb.Table(BIDS_TABLE)
+        # Shares the loan model's bus, so loans funded by accept_allocations are announced there too
+        self.loan_model = loan_model
+        self.bus = bus or (loan_model.bus if loan_model else EventBus())
     
-    def create_bid(self, loan_request_id, lender_id, amount, interest_rate, message=''):
+    def add_listener(self, listener, **options):
+        """Call listener(event, bid) after a bid is created or changes status; options as for EventBus.subscribe"""
+        return self.bus.subscribe(BID_EVENTS, lambda event: listener(*legacy_event(event)),
+                                  name=options.pop('name', getattr(listener, '__qualname__', None)), **options)
+    
+    def create_bid(self, loan_request_id, lender_id, amount, interest_rate, message='', source=None):
+        """Write a new pending bid; source tags machine-placed bids, e.g. 'bot'"""
         bid_id = str(uuid.uuid4())
         
         item = {
@@ -183,10 +496,93 @@ class DynamoDBBid:
             'status': 'pending',
             'created_at': datetime.utcnow().isoformat()
         }
+        if source:
+            item['source'] = source
         
         self.table.put_item(Item=item)
+        self.bus.publish(BidCreated(item))
         return bid_id
     
+    def create_bids(self, lender_id, bids, max_attempts=5):
+        """Write many bids with BatchWriteItem; returns the new ids in order, None where a write failed"""
+        items = []
+        for bid in bids:
+            items.append({
+                'id': str(uuid.uuid4()),
+                'loan_request_id': bid['loan_request_id'],
+                'lender_id': lender_id,
+                'amount': Decimal(str(bid['amount'])),
+                'interest_rate': Decimal(str(bid['interest_rate'])),
+                'message': bid.get('message', ''),
+                'status': 'pending',
+                'created_at': datetime.utcnow().isoformat()
+            })
+        
+        failed = batch_put_items(BIDS_TABLE, items, max_attempts)
+        bid_ids = []
+        for item in items:
+            if item['id'] in failed:
+                bid_ids.append(None)
+            else:
+                self.bus.publish(BidCreated(item))
+                bid_ids.append(item['id'])
+        return bid_ids
+    
+    def accept_allocations(self, loan_id, allocations, expected_funded, new_funded, fully_funded):
+        """Accept a set of (partial) bid fills and advance the loan's funded amount in one transaction"""
+        serializer = TypeSerializer()
+        def serialize(values):
+            return {key: serializer.serialize(value) for key, value in values.items()}
+        
+        items = [
+            {
+                'Update': {
+                    'TableName': BIDS_TABLE,
+                    'Key': serialize({'id': allocation.bid_id}),
+                    'UpdateExpression': 'SET #status = :accepted, filled_amount = :filled',
+                    'ConditionExpression': '#status = :pending',
+                    'ExpressionAttributeNames': {'#status': 'status'},
+                    'ExpressionAttributeValues': serialize({
+                        ':accepted': 'accepted',
+                        ':filled': Decimal(str(allocation.amount)),
+                        ':pending': 'pending'
+                    })
+                }
+            }
+            for allocation in allocations
+        ]
+        items.append({
+            'Update': {
+                'TableName': LOAN_REQUESTS_TABLE,
+                'Key': serialize({'id': loan_id}),
+                'UpdateExpression': 'SET funded_amount = :funded, #status = :status',
+                'ConditionExpression': '#status = :open AND '
+                                       '(attribute_not_exists(funded_amount) OR funded_amount = :expected)',
+                'ExpressionAttributeNames': {'#status': 'status'},
+                'ExpressionAttributeValues': serialize({
+                    ':funded': Decimal(str(new_funded)),
+                    ':expected': Decimal(str(expected_funded)),
+                    ':status': 'funded' if fully_funded else 'open',
+                    ':open': 'open'
+                })
+            }
+        })
+        
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=items)
+        except dynamodb.meta.client.exceptions.TransactionCanceledException:
+            return False  # A bid or the loan changed since the fill was computed
+        except Exception as e:
+            print(f"Error committing bid allocations: {e}")
+            return False
+        
+        for allocation in allocations:
+            self.bus.publish(BidStatusChanged(allocation.bid_id, 'accepted', loan_id, allocation.amount,
+                                              allocation.interest_rate))
+        if fully_funded:
+            self.bus.publish(LoanStatusChanged(loan_id, 'funded'))
+        return True
+    
     def get_bid(self, bid_id):
         try:
             response = self.table.get_item(Key={'id': bid_id})
@@ -203,6 +599,35 @@ class DynamoDBBid:
         except:
             return []
     
+    def get_pending_bids_for_loans(self, loan_ids, statuses=('pending',)):
+        """Bids of several loans with one of the statuses (pending only by default) from one paginated scan, keyed by loan id"""
+        wanted = set(loan_ids)
+        bids = {loan_id: [] for loan_id in wanted}
+        kwargs = {'FilterExpression': Attr('status').is_in(list(statuses))}
+        while True:
+            response = self.table.scan(**kwargs)
+            for item in response.get('Items', []):
+                if item['loan_request_id'] in wanted:
+                    bids[item['loan_request_id']].append(item)
+            if 'LastEvaluatedKey' not in response:
+                return bids
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    def get_bids_since(self, created_after, statuses=('pending', 'accepted')):
+        """Bids created after an ISO timestamp with one of the statuses, from one paginated scan"""
+        kwargs = {'FilterExpression': Attr('created_at').gt(created_after) & Attr('status').is_in(list(statuses))}
+        bids = []
+        try:
+            while True:
+                response = self.table.scan(**kwargs)
+                bids.extend(response.get('Items', []))
+                if 'LastEvaluatedKey' not in response:
+                    return bids
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            print(f"Error scanning recent bids: {e}")
+            return bids
+    
     def get_bids_by_lender(self, lender_id):
         try:
             response = self.table.scan(
@@ -212,16 +637,381 @@ class DynamoDBBid:
         except:
             return []
     
-    def update_bid_status(self, bid_id, status):
+    def update_bid_status(self, bid_id, status, expected_status=None):
+        """Set a bid's status; with expected_status, only if the bid still has it"""
+        kwargs = {}
+        values = {':status': status}
+        if expected_status is not None:
+            kwargs['ConditionExpression'] = '#status = :expected'
+            values[':expected'] = expected_status
         try:
-            self.table.update_item(
+            response = self.table.update_item(
                 Key={'id': bid_id},
                 UpdateExpression='SET #status = :status',
                 ExpressionAttributeNames={'#status': 'status'},
-                ExpressionAttributeValues={':status': status}
+                ExpressionAttributeValues=values,
+                ReturnValues='ALL_NEW',
+                **kwargs
+            )
+            attributes = response.get('Attributes', {})
+            self.bus.publish(BidStatusChanged(bid_id, status, attributes.get('loan_request_id'),
+                                              interest_rate=attributes.get('interest_rate')))
+            return True
+        except:
+            return False
+
+class DynamoDBBotLedger:
+    """Persistent capital accounts for bot lenders, updated with atomic ADDs"""
+    
+    def __init__(self):
+        self.table = dynamodb.Table(BOT_LEDGER_TABLE)
+    
+    def open_account(self, bot_id, capital):
+        """Create a ledger account for a bot unless one already exists"""
+        item = {
+            'id': bot_id,
+            'capital': Decimal(str(capital)),
+            'available_capital': Decimal(str(capital)),
+            'committed_capital': Decimal('0'),
+            'created_at': datetime.utcnow().isoformat()
+        }
+        
+        try:
+            self.table.put_item(
+                Item=item,
+                ConditionExpression='attribute_not_exists(id)'
+            )
+            return item
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return None  # Account already exists
+        except Exception as e:
+            print(f"Error opening bot ledger account: {e}")
+            return None
+    
+    def set_rate_overrides(self, bot_id, overrides):
+        """Persist a bot's pricing grid overrides, {'credit:amount:term': rate}, so every worker applies them"""
+        try:
+            self.table.update_item(
+                Key={'id': bot_id},
+                UpdateExpression='SET rate_overrides = :overrides',
+                ConditionExpression='attribute_exists(id)',
+                ExpressionAttributeValues={':overrides': {key: Decimal(str(rate)) for key, rate in overrides.items()}}
+            )
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception as e:
+            print(f"Error updating bot ledger: {e}")
+            return False
+    
+    def get_accounts(self, bot_ids):
+        """Batch read ledger accounts, returned as a dict keyed by bot id"""
+        accounts = {}
+        bot_ids = list(dict.fromkeys(bot_ids))
+        
+        # BatchGetItem accepts at most 100 keys per request
+        for start in range(0, len(bot_ids), 100):
+            request_items = {
+                BOT_LEDGER_TABLE: {'Keys': [{'id': bot_id} for bot_id in bot_ids[start:start + 100]]}
+            }
+            while request_items:
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(BOT_LEDGER_TABLE, []):
+                    accounts[item['id']] = item
+                request_items = response.get('UnprocessedKeys') or None
+        
+        return accounts
+    
+    def add_capital(self, bot_id, amount):
+        """Deposit more capital into an existing account"""
+        amount = Decimal(str(amount))
+        try:
+            self.table.update_item(
+                Key={'id': bot_id},
+                UpdateExpression='ADD capital :amount, available_capital :amount',
+                ConditionExpression='attribute_exists(id)',
+                ExpressionAttributeValues={':amount': amount}
             )
             return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception as e:
+            print(f"Error updating bot ledger: {e}")
+            return False
+    
+    def reserve_capital(self, bot_id, amount):
+        """Atomically deduct amount from available capital if enough remains"""
+        amount = Decimal(str(amount))
+        try:
+            self.table.update_item(
+                Key={'id': bot_id},
+                UpdateExpression='ADD available_capital :negative',
+                ConditionExpression='attribute_exists(id) AND available_capital >= :amount',
+                ExpressionAttributeValues={':negative': -amount, ':amount': amount}
+            )
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception as e:
+            print(f"Error updating bot ledger: {e}")
+            return False
+    
+    def record_bid(self, bot_id, bid_id):
+        """Track a placed bid against capital that was already reserved"""
+        try:
+            self.table.update_item(
+                Key={'id': bot_id},
+                UpdateExpression='ADD active_bids :bid',
+                ConditionExpression='attribute_exists(id)',
+                ExpressionAttributeValues={':bid': {bid_id}}
+            )
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception as e:
+            print(f"Error updating bot ledger: {e}")
+            return False
+    
+    def release_capital(self, bot_id, amount, bid_id=None):
+        """Return reserved capital; with a bid id this only happens once per bid"""
+        amount = Decimal(str(amount))
+        try:
+            if bid_id is None:
+                self.table.update_item(
+                    Key={'id': bot_id},
+                    UpdateExpression='ADD available_capital :amount',
+                    ConditionExpression='attribute_exists(id)',
+                    ExpressionAttributeValues={':amount': amount}
+                )
+            else:
+                self.table.update_item(
+                    Key={'id': bot_id},
+                    UpdateExpression='ADD available_capital :amount DELETE active_bids :bid',
+                    ConditionExpression='contains(active_bids, :bid_id)',
+                    ExpressionAttributeValues={':amount': amount, ':bid': {bid_id}, ':bid_id': bid_id}
+                )
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False  # Not a bot, or the bid was already settled
+        except Exception as e:
+            print(f"Error updating bot ledger: {e}")
+            return False
+    
+    def commit_capital(self, bot_id, amount, bid_id, loan_id, release=0):
+        """Move an accepted bid's reserved capital into funded loans, returning any unfilled part"""
+        try:
+            self.table.update_item(
+                Key={'id': bot_id},
+                UpdateExpression='ADD committed_capital :amount, available_capital :release, '
+                                 'funded_loans :loan DELETE active_bids :bid',
+                ConditionExpression='contains(active_bids, :bid_id)',
+                ExpressionAttributeValues={
+                    ':amount': Decimal(str(amount)),
+                    ':release': Decimal(str(release)),
+                    ':loan': {loan_id},
+                    ':bid': {bid_id},
+                    ':bid_id': bid_id
+                }
+            )
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False  # Not a bot, or the bid was already settled
+        except Exception as e:
+            print(f"Error updating bot ledger: {e}")
+            return False
+
+class DynamoDBLease:
+    """Named leases for leader election between workers"""
+    
+    def __init__(self):
+        self.table = dynamodb.Table(LEASES_TABLE)
+    
+    def acquire_lease(self, name, owner, ttl_seconds):
+        """Take the lease if it is free, expired or already ours"""
+        now = time.time()
+        try:
+            self.table.put_item(
+                Item={
+                    'id': name,
+                    'owner': owner,
+                    'expires_at': Decimal(str(round(now + ttl_seconds, 3))),
+                    'heartbeat_at': datetime.utcnow().isoformat()
+                },
+                ConditionExpression='attribute_not_exists(id) OR expires_at < :now OR #owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':now': Decimal(str(round(now, 3))), ':owner': owner}
+            )
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False  # Another worker holds a live lease
+    
+    def release_lease(self, name, owner):
+        """Delete the lease if we still own it"""
+        try:
+            self.table.delete_item(
+                Key={'id': name},
+                ConditionExpression='#owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':owner': owner}
+            )
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+    
+    def get_lease(self, name):
+        try:
+            response = self.table.get_item(Key={'id': name})
+            return response.get('Item')
         except:
+            return None
+
+class DynamoDBIdempotencyKey:
+    """Client-supplied request keys, so a retried submission replays instead of writing twice"""
+    
+    def __init__(self):
+        self.table = dynamodb.Table(IDEMPOTENCY_KEYS_TABLE)
+    
+    def claim(self, key_id, fingerprint, ttl_seconds, lease_seconds=60):
+        """Reserve a key for one request: (True, None) if ours, else (False, earlier record).
+        
+        expires_at is the table's TTL attribute. A claim left pending past
+        lease_seconds, by a worker that died mid-request, can be retaken.
+        (None, None) means the table could not be reached (throttling, or
+        not created yet) and the request is not tracked.
+        """
+        now = time.time()
+        try:
+            self.table.put_item(
+                Item={
+                    'id': key_id,
+                    'fingerprint': fingerprint,
+                    'status': 'pending',
+                    'created_at': datetime.utcnow().isoformat(),
+                    'lease_expires_at': Decimal(str(round(now + lease_seconds, 3))),
+                    'expires_at': int(now + ttl_seconds)
+                },
+                ConditionExpression='attribute_not_exists(id) OR expires_at < :now_int '
+                                    'OR (#status = :pending AND lease_expires_at < :now)',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':now': Decimal(str(round(now, 3))), ':now_int': int(now),
+                                           ':pending': 'pending'}
+            )
+            return True, None
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            try:
+                item = self.table.get_item(Key={'id': key_id}, ConsistentRead=True).get('Item')
+            except Exception as e:
+                print(f"Error reading idempotency key: {e}")
+                item = None
+            # Taken by an earlier request; unreadable is answered as still in progress
+            return False, item or {'id': key_id, 'status': 'pending'}
+        except Exception as e:
+            print(f"Error claiming idempotency key: {e}")
+            return None, None
+    
+    def complete(self, key_id, resource_id=None, response=None):
+        """Record what the request created, and optionally its response body, for replays"""
+        expression = 'SET #status = :done, resource_id = :resource_id'
+        values = {':done': 'done', ':resource_id': resource_id}
+        if response is not None:
+            expression += ', response = :response'
+            values[':response'] = response
+        try:
+            self.table.update_item(
+                Key={'id': key_id},
+                UpdateExpression=expression,
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues=values
+            )
+            return True
+        except Exception as e:
+            print(f"Error completing idempotency key: {e}")
+            return False
+    
+    def release(self, key_id):
+        """Forget a key whose request failed, so the client can try again"""
+        try:
+            self.table.delete_item(
+                Key={'id': key_id},
+                ConditionExpression='#status = :pending',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':pending': 'pending'}
+            )
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception as e:
+            print(f"Error releasing idempotency key: {e}")
+            return False
+
+class DynamoDBAutoInvestRule:
+    """Lender auto-invest rules matched against new loan requests"""
+    
+    def __init__(self):
+        self.table = dynamodb.Table(AUTO_INVEST_RULES_TABLE)
+    
+    def create_rule(self, lender_id, interest_rate, min_credit_score=0, terms=None,
+                    min_amount=0, max_amount=None, purposes=None):
+        rule_id = str(uuid.uuid4())
+        
+        item = {
+            'id': rule_id,
+            'lender_id': lender_id,
+            'interest_rate': Decimal(str(interest_rate)),
+            'min_credit_score': int(min_credit_score),
+            'terms': [int(term) for term in terms or []],
+            'min_amount': Decimal(str(min_amount)),
+            'purposes': list(purposes or []),
+            'active': True,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        if max_amount is not None:
+            item['max_amount'] = Decimal(str(max_amount))
+        
+        try:
+            self.table.put_item(Item=item)
+            return item
+        except Exception as e:
+            print(f"Error creating auto-invest rule: {e}")
+            return None
+    
+    def get_rules_by_lender(self, lender_id):
+        try:
+            response = self.table.scan(
+                FilterExpression=Attr('lender_id').eq(lender_id)
+            )
+            return response.get('Items', [])
+        except:
+            return []
+    
+    def get_active_rules(self):
+        """Scan every active rule, following pagination"""
+        rules = []
+        kwargs = {'FilterExpression': Attr('active').eq(True)}
+        try:
+            while True:
+                response = self.table.scan(**kwargs)
+                rules.extend(response.get('Items', []))
+                if 'LastEvaluatedKey' not in response:
+                    return rules
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            print(f"Error scanning auto-invest rules: {e}")
+            return rules
+    
+    def delete_rule(self, rule_id, lender_id):
+        """Delete a rule if it belongs to the lender"""
+        try:
+            self.table.delete_item(
+                Key={'id': rule_id},
+                ConditionExpression='lender_id = :lender_id',
+                ExpressionAttributeValues={':lender_id': lender_id}
+            )
+            return True
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        except Exception as e:
+            print(f"Error deleting auto-invest rule: {e}")
             return False
 
 # User class for Flask-Login compatibility
@@ -258,6 +1048,11 @@ class User:
         return self.id
 
 # Initialize model instances
+event_bus = EventBus()
 user_model = DynamoDBUser()
-loan_model = DynamoDBLoanRequest()
-bid_model = DynamoDBBid()
+loan_model = DynamoDBLoanRequest(event_bus)
+bid_model = DynamoDBBid(loan_model, event_bus)
+bot_ledger_model = DynamoDBBotLedger()
+lease_model = DynamoDBLease()
+auto_invest_rule_model = DynamoDBAutoInvestRule()
+idempotency_model = DynamoDBIdempotencyKey()
@@ -0,0 +1,115 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from dynamodb_models import DOMAIN_EVENTS
+
+def encode_event(event):
+    """JSON bytes for a domain event; Decimals survive the round trip"""
+    def default(value):
+        if isinstance(value, Decimal):
+            return {'__decimal__': str(value)}
+        raise TypeError(f"Cannot encode {type(value).__name__} in an event")
+    return json.dumps({'type': type(event).__name__, 'fields': list(event)}, default=default).encode()
+
+def decode_event(data):
+    """Domain event from encode_event output"""
+    def object_hook(value):
+        if '__decimal__' in value:
+            return Decimal(value['__decimal__'])
+        return value
+    message = json.loads(data, object_hook=object_hook)
+    return DOMAIN_EVENTS[message['type']](*message['fields'])
+
+class UnixSocketTransport:
+    """Fans events out to the other processes on this host, e.g. gunicorn workers.
+
+    Each process binds a Unix datagram socket in a shared directory and
+    sends every event to all the other sockets there. Sends never block:
+    if a peer's buffer is full the event is dropped for that peer and
+    counted, so a stalled worker can't hold up writes elsewhere. Sockets
+    left behind by dead processes are removed when a send is refused.
+    """
+
+    def __init__(self, directory, peer_refresh=1.0):
+        self.directory = directory
+        self.peer_refresh = peer_refresh
+        self.path = os.path.join(directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock')
+        self.peers = []
+        self.peers_at = 0
+        self.stats = {'sent': 0, 'received': 0, 'dropped': 0, 'invalid': 0}
+        self._receiver = None
+        self._sender = None
+        self._thread = None
+        self.running = False
+
+    def start(self, deliver):
+        os.makedirs(self.directory, exist_ok=True)
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.path)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self.running = True
+        self._thread = threading.Thread(target=self._run, args=(deliver,), daemon=True, name='event-transport')
+        self._thread.start()
+
+    def _run(self, deliver):
+        while self.running:
+            try:
+                data = self._receiver.recv(65536)
+            except OSError:
+                return
+            if not self.running:
+                return
+            try:
+                event = decode_event(data)
+            except (ValueError, KeyError, TypeError):
+                self.stats['invalid'] += 1
+                continue
+            self.stats['received'] += 1
+            deliver(event)
+
+    def _peers(self):
+        """Other processes' sockets, re-listed at most every peer_refresh seconds"""
+        if time.time() - self.peers_at > self.peer_refresh:
+            self.peers = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                          if name.endswith('.sock') and os.path.join(self.directory, name) != self.path]
+            self.peers_at = time.time()
+        return self.peers
+
+    def send(self, event):
+        data = encode_event(event)
+        for peer in self._peers():
+            try:
+                self._sender.sendto(data, peer)
+                self.stats['sent'] += 1
+            except BlockingIOError:
+                self.stats['dropped'] += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The process behind it is gone
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+                self.peers_at = 0
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            # A blocked recv doesn't notice the socket closing, so wake it first
+            try:
+                self._sender.sendto(b'', self.path)
+            except OSError:
+                pass
+            self._thread.join(timeout=5)
+        for sock in (self._receiver, self._sender):
+            if sock is not None:
+                sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
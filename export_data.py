@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Analytics export of users, loans and bids
+Streams a parallel scan of each table into gzip or zstd compressed NDJSON
+or CSV part files without holding the table in memory
+"""
+
+import argparse
+import base64
+import csv
+import io
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+from decimal import Decimal
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import zstandard
+except ImportError:
+    # Optional: only needed for --compression zstd
+    zstandard = None
+
+from dynamodb_models import dynamodb, USERS_TABLE, LOAN_REQUESTS_TABLE, BIDS_TABLE
+
+# Export name -> (table, attributes never exported)
+EXPORT_TABLES = {
+    'users': (USERS_TABLE, {'password_hash'}),
+    'loans': (LOAN_REQUESTS_TABLE, set()),
+    'bids': (BIDS_TABLE, set())
+}
+FORMATS = ('ndjson', 'csv')
+COMPRESSIONS = ('gzip', 'zstd', 'none')
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+# CSV columns come from the first rows; attributes first seen later go in this column as JSON
+CSV_SAMPLE_ROWS = 100
+CSV_EXTRA_COLUMN = '_extra'
+
+def plain_value(value):
+    """DynamoDB value as plain JSON types: whole Decimals become ints, sets sorted lists, binary base64"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {key: plain_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain_value(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(plain_value(item) for item in value)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(bytes(value)).decode()
+    if hasattr(value, 'value') and isinstance(value.value, (bytes, bytearray)):
+        # boto3 Binary
+        return base64.b64encode(bytes(value.value)).decode()
+    return value
+
+def compressor(compression, level=None):
+    """An object with compress() and flush() for the chosen codec"""
+    if compression == 'gzip':
+        return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd compression needs the zstandard package')
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    if compression == 'none':
+        return _Identity()
+    raise ValueError(f"compression must be one of {', '.join(COMPRESSIONS)}")
+
+class _Identity:
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+def scan_table(table_name, segments=4, page_size=None, max_pages=None):
+    """Yield every item of a table from a parallel scan.
+
+    Each segment runs on its own thread and hands pages over a queue of
+    max_pages (default two per segment), so a slow consumer pauses the
+    scan instead of letting pages pile up. Closing the generator early
+    stops the segment threads.
+    """
+    table = dynamodb.Table(table_name)
+    pages = queue.Queue(max_pages or segments * 2)
+    stopped = threading.Event()
+    done = object()
+    errors = []
+
+    def put(message):
+        while not stopped.is_set():
+            try:
+                pages.put(message, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(segment):
+        kwargs = {'Segment': segment, 'TotalSegments': segments}
+        if page_size:
+            kwargs['Limit'] = page_size
+        try:
+            while not stopped.is_set():
+                response = table.scan(**kwargs)
+                if not put(response.get('Items', [])):
+                    return
+                if 'LastEvaluatedKey' not in response:
+                    return
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(done)
+
+    threads = [threading.Thread(target=run, args=(segment,), daemon=True, name=f'export-scan-{segment}')
+               for segment in range(segments)]
+    for thread in threads:
+        thread.start()
+    try:
+        remaining = segments
+        while remaining:
+            page = pages.get()
+            if page is done:
+                remaining -= 1
+                if errors:
+                    raise RuntimeError(f"Scan of {table_name} failed: {errors[0]}")
+                continue
+            yield from page
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+def encode_rows(items, fmt, excluded=()):
+    """Yield encoded text, one chunk per item; CSV starts with a header row"""
+    items = (plain_value({key: value for key, value in item.items() if key not in excluded}) for item in items)
+    if fmt == 'ndjson':
+        for item in items:
+            yield json.dumps(item, separators=(',', ':')) + '\n'
+        return
+    if fmt != 'csv':
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+    sample = []
+    for item in items:
+        sample.append(item)
+        if len(sample) == CSV_SAMPLE_ROWS:
+            break
+    columns = sorted({key for item in sample for key in item})
+    known = set(columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def row(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    def cell(value):
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, separators=(',', ':'))
+        return '' if value is None else value
+
+    yield row(columns + [CSV_EXTRA_COLUMN])
+    for item in itertools.chain(sample, items):
+        extra = {key: value for key, value in item.items() if key not in known}
+        yield row([cell(item.get(key)) for key in columns] + [cell(extra) if extra else ''])
+
+def export_stream(name, fmt='ndjson', compression='gzip', segments=4):
+    """Compressed bytes of a whole table export, for streaming over HTTP"""
+    table_name, excluded = EXPORT_TABLES[name]
+    codec = compressor(compression)
+    pending = []
+    size = 0
+    for text in encode_rows(scan_table(table_name, segments), fmt, excluded):
+        pending.append(text)
+        size += len(text)
+        # Hand the codec reasonably sized blocks rather than one row at a time
+        if size >= 65536:
+            data = codec.compress(''.join(pending).encode())
+            pending, size = [], 0
+            if data:
+                yield data
+    data = codec.compress(''.join(pending).encode()) + codec.flush()
+    if data:
+        yield data
+
+def export_table(name, directory, fmt='ndjson', compression='gzip', part_size=256 * 1024 * 1024, segments=4):
+    """Write a table to numbered part files of about part_size uncompressed bytes each.
+
+    Parts are written under a temporary name and renamed when complete,
+    and a manifest listing them is written last, so a reader that sees
+    the manifest sees a finished export.
+    """
+    table_name, excluded = EXPORT_TABLES[name]
+    os.makedirs(directory, exist_ok=True)
+    extension = f".{fmt}{EXTENSIONS[compression]}"
+    parts = []
+    state = {'file': None, 'codec': None, 'path': None, 'rows': 0, 'bytes': 0}
+    header = None
+
+    def close_part():
+        if state['file'] is None:
+            return
+        state['file'].write(state['codec'].flush())
+        state['file'].close()
+        os.replace(state['path'] + '.tmp', state['path'])
+        parts.append({'path': os.path.basename(state['path']), 'rows': state['rows'],
+                      'bytes': os.path.getsize(state['path'])})
+        state['file'] = None
+
+    def open_part():
+        state['path'] = os.path.join(directory, f"{name}-{len(parts):05d}{extension}")
+        state['file'] = open(state['path'] + '.tmp', 'wb')
+        state['codec'] = compressor(compression)
+        state['rows'] = state['bytes'] = 0
+        if header is not None:
+            write(header)
+
+    def write(text):
+        data = state['codec'].compress(text.encode())
+        if data:
+            state['file'].write(data)
+        state['bytes'] += len(text)
+
+    started = time.time()
+    total = 0
+    try:
+        for text in encode_rows(scan_table(table_name, segments), fmt, excluded):
+            if fmt == 'csv' and header is None:
+                # Every CSV part repeats the header so each one loads on its own
+                header = text
+                continue
+            if state['file'] is None or state['bytes'] >= part_size:
+                close_part()
+                open_part()
+            write(text)
+            state['rows'] += 1
+            total += 1
+        if not parts and state['file'] is None:
+            open_part()
+        close_part()
+    finally:
+        if state['file'] is not None:
+            state['file'].close()
+            os.remove(state['path'] + '.tmp')
+
+    manifest = {
+        'table': name,
+        'format': fmt,
+        'compression': compression,
+        'rows': total,
+        'parts': parts,
+        'exported_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'seconds': round(time.time() - started, 1)
+    }
+    with open(os.path.join(directory, f'{name}-manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def main():
+    """Export tables from the command line"""
+    parser = argparse.ArgumentParser(description='Export users, loans and bids for analytics')
+    parser.add_argument('tables', nargs='*', help=f"any of {', '.join(EXPORT_TABLES)} (default: all)")
+    parser.add_argument('--output', default='export', help='directory for part files')
+    parser.add_argument('--format', choices=FORMATS, default='ndjson')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='gzip')
+    parser.add_argument('--part-size', type=int, default=256, help='uncompressed MB per part file')
+    parser.add_argument('--segments', type=int, default=4, help='parallel scan segments')
+    args = parser.parse_args()
+    unknown = set(args.tables) - set(EXPORT_TABLES)
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(sorted(unknown))}")
+
+    for name in args.tables or list(EXPORT_TABLES):
+        print(f"📤 Exporting {name}")
+        manifest = export_table(name, args.output, args.format, args.compression,
+                                args.part_size * 1024 * 1024, args.segments)
+        print(f"   {manifest['rows']:,} rows in {len(manifest['parts'])} parts ({manifest['seconds']}s)")
+    print(f"📄 Export written to {args.output}")
+
+if __name__ == "__main__":
+    main()
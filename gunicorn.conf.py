@@ -0,0 +1,12 @@
+"""Gunicorn settings for the web process"""
+import os
+
+# Live event streams hold a connection for as long as a page is open, so the
+# web workers are gevent workers that serve each stream as a greenlet
+worker_class = 'gevent'
+bind = ':8000'
+
+# Each worker accepts up to SSE_MAX_SUBSCRIBERS streams and still needs
+# connections for ordinary requests on top of those
+worker_connections = (int(os.getenv('SSE_MAX_SUBSCRIBERS', '5000')) +
+                      int(os.getenv('WEB_REQUEST_CONNECTIONS', '500')))
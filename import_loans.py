@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Bulk loan request import for partner originators
+Streams a CSV or NDJSON file, validates each row like the request_loan
+form, and writes loans with parallel BatchWriteItem calls. Progress is
+checkpointed so an interrupted import resumes where it stopped.
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# The same choices and limits as the request_loan form
+TERMS = {6, 12, 18, 24, 36, 48, 60}
+PURPOSES = {'Debt Consolidation', 'Home Improvement', 'Business', 'Education', 'Medical', 'Auto', 'Personal', 'Other'}
+MIN_AMOUNT, MAX_AMOUNT = 100, 100000
+MIN_RATE, MAX_RATE = 1, 30
+
+# Loan ids derive from the file's content and the row's line, so a re-run of
+# the same file, from any path, produces the same ids and nothing twice
+IMPORT_NAMESPACE = uuid.UUID('5f0c7d8e-3b1a-4c55-9d0e-6a2b7c1e4f90')
+
+CHUNK_SIZE = 25  # One BatchWriteItem request
+
+def open_text(path):
+    return gzip.open(path, 'rt', newline='') if path.endswith('.gz') else open(path, newline='')
+
+def source_key(path):
+    """SHA-256 of the file's bytes, read in blocks; two files share it only if identical"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+def read_rows(path, fmt=None):
+    """Yield (line_number, record) one row at a time; unparseable lines yield the error instead"""
+    with open_text(path) as f:
+        if (fmt or detect_format(path)) == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_number, ValueError(f'invalid JSON: {e}')
+                    continue
+                yield line_number, record
+
+def validate_row(record):
+    """Clean loan fields from a row, or raise ValueError naming the problem"""
+    if not isinstance(record, dict):
+        raise ValueError('row is not an object')
+    borrower_id = str(record.get('borrower_id') or '').strip()
+    if not borrower_id:
+        raise ValueError('borrower_id is required')
+    try:
+        amount = float(record.get('amount'))
+        term_months = int(record.get('term_months'))
+        max_interest_rate = float(record.get('max_interest_rate'))
+    except (TypeError, ValueError):
+        raise ValueError('amount, term_months and max_interest_rate must be numbers')
+    if not MIN_AMOUNT <= amount <= MAX_AMOUNT:
+        raise ValueError(f'amount must be between {MIN_AMOUNT} and {MAX_AMOUNT}')
+    if term_months not in TERMS:
+        raise ValueError(f'term_months must be one of {sorted(TERMS)}')
+    if not MIN_RATE <= max_interest_rate <= MAX_RATE:
+        raise ValueError(f'max_interest_rate must be between {MIN_RATE} and {MAX_RATE}')
+    purpose = record.get('purpose')
+    if purpose not in PURPOSES:
+        raise ValueError(f'purpose must be one of {sorted(PURPOSES)}')
+    return {
+        'borrower_id': borrower_id,
+        'amount': round(amount, 2),
+        'purpose': purpose,
+        'term_months': term_months,
+        'max_interest_rate': round(max_interest_rate, 2),
+        'description': str(record.get('description') or '')
+    }
+
+class LoanImporter:
+    """Validates rows and writes them in parallel, with a checkpoint and an error file.
+
+    The reader stays at most two chunks per worker ahead of the writers,
+    so memory does not grow with the file. Chunks can finish out of
+    order; the checkpoint records the last line below which every chunk
+    is done, and a resumed import skips up to it. Rejected rows, and
+    rows still throttled after put_loans' retries, go to the errors file
+    with their original record, so `jq -c .record` turns it back into
+    an importable NDJSON file. Borrower ids are checked with batch reads
+    and the known ones are cached.
+
+    BatchWriteItem puts can't be conditional, so each chunk first reads
+    its loan ids back and leaves any that already exist untouched; a
+    re-run without the checkpoint never resets a loan that has since
+    been bid on or funded.
+    """
+
+    def __init__(self, loan_model, user_model=None, source='', workers=4, checkpoint_path=None,
+                 errors_path=None, progress_interval=5, max_borrowers=100000, out=sys.stdout):
+        self.loan_model = loan_model
+        self.user_model = user_model
+        self.source = source
+        self.workers = workers
+        self.checkpoint_path = checkpoint_path
+        self.errors_path = errors_path
+        self.progress_interval = progress_interval
+        self.max_borrowers = max_borrowers
+        self.out = out
+        self.borrowers = OrderedDict()
+        self.stats = {'rows': 0, 'written': 0, 'existing': 0, 'invalid': 0, 'failed': 0, 'skipped': 0}
+        self.done_through = 0
+        self._finished = {}
+        self._next_chunk = 0
+        self._contiguous = 0
+        self._lock = threading.Lock()
+        self._errors = None
+        self._slots = threading.BoundedSemaphore(workers * 2)
+
+    def load_checkpoint(self):
+        """Last line fully handled by an earlier run of the same import"""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('source') != self.source:
+            raise ValueError(f"Checkpoint {self.checkpoint_path} belongs to {checkpoint.get('source')}")
+        return checkpoint['line']
+
+    def save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'source': self.source, 'line': self.done_through, 'stats': self.stats}, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def record_error(self, line_number, error, record):
+        with self._lock:
+            self.stats['invalid' if not isinstance(error, RuntimeError) else 'failed'] += 1
+            if self._errors is not None:
+                self._errors.write(json.dumps({'line': line_number, 'error': str(error), 'record': record},
+                                              default=str) + '\n')
+
+    def loan_id(self, line_number):
+        return str(uuid.uuid5(IMPORT_NAMESPACE, f'{self.source}:{line_number}'))
+
+    def run(self, rows):
+        """Import every row; returns the counters"""
+        resume_after = self.load_checkpoint()
+        self.done_through = resume_after
+        if self.errors_path:
+            self._errors = open(self.errors_path, 'a')
+        started = last_report = time.time()
+        chunk = []
+        last_line = resume_after
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for line_number, record in rows:
+                    if line_number <= resume_after:
+                        self.stats['skipped'] += 1
+                        continue
+                    self.stats['rows'] += 1
+                    last_line = line_number
+                    try:
+                        if isinstance(record, Exception):
+                            error, record = record, None
+                            raise error
+                        chunk.append((line_number, record, validate_row(record)))
+                    except ValueError as e:
+                        self.record_error(line_number, e, record)
+                    if len(chunk) == CHUNK_SIZE:
+                        self._submit(executor, chunk, last_line)
+                        chunk = []
+                    if self.progress_interval and time.time() - last_report >= self.progress_interval:
+                        last_report = time.time()
+                        self.report(started)
+                self._submit(executor, chunk, last_line)
+        finally:
+            if self._errors is not None:
+                self._errors.close()
+                self._errors = None
+            self.save_checkpoint()
+        self.report(started, final=True)
+        return self.stats
+
+    def _submit(self, executor, chunk, last_line):
+        """Hand a chunk to the writers, waiting while too many are in flight"""
+        self._slots.acquire()
+        sequence = self._next_chunk
+        self._next_chunk += 1
+        future = executor.submit(self._write, chunk)
+        future.add_done_callback(lambda _: self._chunk_done(sequence, last_line))
+
+    def _chunk_done(self, sequence, last_line):
+        with self._lock:
+            self._finished[sequence] = last_line
+            advanced = False
+            while self._contiguous in self._finished:
+                self.done_through = self._finished.pop(self._contiguous)
+                self._contiguous += 1
+                advanced = True
+        self._slots.release()
+        if advanced:
+            with self._lock:
+                self.save_checkpoint()
+
+    def _write(self, chunk):
+        """Check borrowers and write one chunk; runs on a writer thread"""
+        try:
+            missing = self._missing_borrowers({loan['borrower_id'] for _, _, loan in chunk})
+            items = []
+            lines = {}
+            for line_number, record, loan in chunk:
+                if loan['borrower_id'] in missing:
+                    self.record_error(line_number, ValueError(f"unknown borrower {loan['borrower_id']}"), record)
+                    continue
+                item = self.loan_model.build_loan_item(loan_id=self.loan_id(line_number), **loan)
+                items.append(item)
+                lines[item['id']] = (line_number, record)
+            if not items:
+                return
+            existing = self.loan_model.get_loan_requests(list(lines))
+            if existing:
+                items = [item for item in items if item['id'] not in existing]
+                with self._lock:
+                    self.stats['existing'] += len(existing)
+            if not items:
+                return
+            failed = self.loan_model.put_loans(items)
+            for loan_id in failed:
+                line_number, record = lines[loan_id]
+                self.record_error(line_number, RuntimeError('write throttled after retries'), record)
+            with self._lock:
+                self.stats['written'] += len(items) - len(failed)
+        except Exception as e:
+            for line_number, record, _ in chunk:
+                self.record_error(line_number, RuntimeError(f'write failed: {e}'), record)
+
+    def _missing_borrowers(self, borrower_ids):
+        """Borrower ids with no user record, from one batch read of the ids not seen yet"""
+        if self.user_model is None:
+            return set()
+        with self._lock:
+            unknown = [borrower_id for borrower_id in borrower_ids if borrower_id not in self.borrowers]
+        if not unknown:
+            return set()
+        found = self.user_model.get_users(unknown)
+        with self._lock:
+            for borrower_id in found:
+                self.borrowers[borrower_id] = True
+                while len(self.borrowers) > self.max_borrowers:
+                    self.borrowers.popitem(last=False)
+        return set(unknown) - set(found)
+
+    def report(self, started, final=False):
+        elapsed = max(time.time() - started, 1e-9)
+        rate = self.stats['rows'] / elapsed
+        label = 'Done' if final else 'Progress'
+        print(f"{label}: {self.stats['rows']:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/s), "
+              f"{self.stats['written']:,} written, {self.stats['existing']:,} already imported, "
+              f"{self.stats['invalid']:,} invalid, {self.stats['failed']:,} failed", file=self.out, flush=True)
+
+def main():
+    """Import loan requests from the command line"""
+    parser = argparse.ArgumentParser(description='Stream loan requests from CSV or NDJSON into DynamoDB')
+    parser.add_argument('path', help='CSV or NDJSON file, optionally gzipped')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='default: from the file extension')
+    parser.add_argument('--workers', type=int, default=4, help='parallel batch writers')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: PATH.checkpoint)')
+    parser.add_argument('--errors', help='rejected rows as NDJSON (default: PATH.errors.ndjson)')
+    parser.add_argument('--skip-borrower-check', action='store_true', help="don't verify borrower ids exist")
+    parser.add_argument('--progress-interval', type=float, default=5, help='seconds between progress lines')
+    parser.add_argument('--no-auto-invest', action='store_true', help="don't match imported loans against auto-invest rules")
+    args = parser.parse_args()
+
+    from dynamodb_models import loan_model, user_model, auto_invest_rule_model, bot_ledger_model
+
+    subscription = None
+    if not args.no_auto_invest:
+        # Imported loans take auto-invest bids like any other new loan; the
+        # blocking queue slows the import down to the matcher's pace
+        from auto_invest import AutoInvestEngine
+        engine = AutoInvestEngine(auto_invest_rule_model, bot_ledger_model, user_model=user_model)
+        subscription = loan_model.add_listener(engine.on_loan_event, asynchronous=True, max_queue=1000,
+                                               overflow='block', block_timeout=300, name='auto-invest')
+
+    importer = LoanImporter(
+        loan_model,
+        None if args.skip_borrower_check else user_model,
+        source=source_key(args.path),
+        workers=args.workers,
+        checkpoint_path=args.checkpoint or args.path + '.checkpoint',
+        errors_path=args.errors or args.path + '.errors.ndjson',
+        progress_interval=args.progress_interval
+    )
+    print(f"📥 Importing loans from {args.path}")
+    stats = importer.run(read_rows(args.path, args.format))
+    if subscription is not None:
+        subscription.stop(timeout=None)
+    if stats['invalid'] or stats['failed']:
+        print(f"⚠️  Rejected rows written to {importer.errors_path}")
+    sys.exit(1 if stats['failed'] else 0)
+
+if __name__ == "__main__":
+    main()
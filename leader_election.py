@@ -0,0 +1,157 @@
+import os
+import socket
+import threading
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def worker_identity():
+    """Identify this process across hosts and gunicorn workers"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class FileLease:
+    """Leader lease backed by an exclusive flock on a local file"""
+
+    def __init__(self, path, owner=None):
+        self.path = path
+        self.owner = owner or worker_identity()
+        self._fd = None
+
+    def acquire(self):
+        """Take or keep the lock without blocking; True if this process holds it"""
+        import fcntl
+
+        if self._fd is not None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        # Record the holder so other workers can report it
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{self.owner}\n{datetime.utcnow().isoformat()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        """Drop the lock if held"""
+        if self._fd is None:
+            return
+        import fcntl
+
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def holder(self):
+        """Return the worker that last took the lock"""
+        try:
+            with open(self.path) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return {'owner': None}
+        return {
+            'owner': lines[0] if lines else None,
+            'acquired_at': lines[1] if len(lines) > 1 else None
+        }
+
+class DynamoDBLease:
+    """Leader lease stored as a DynamoDB item renewed by conditional writes"""
+
+    def __init__(self, lease_model, name='bot-engine', ttl_seconds=15, owner=None):
+        self.lease_model = lease_model
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.owner = owner or worker_identity()
+
+    def acquire(self):
+        """Take over an expired lease or extend our own"""
+        return self.lease_model.acquire_lease(self.name, self.owner, self.ttl_seconds)
+
+    def release(self):
+        """Give up the lease so another worker can take over immediately"""
+        self.lease_model.release_lease(self.name, self.owner)
+
+    def holder(self):
+        """Return the current lease item"""
+        lease = self.lease_model.get_lease(self.name) or {}
+        return {
+            'owner': lease.get('owner'),
+            'expires_at': float(lease['expires_at']) if 'expires_at' in lease else None
+        }
+
+class LeaderElector:
+    """Heartbeats a lease on a background thread and tracks leadership"""
+
+    def __init__(self, lease, heartbeat_interval=5):
+        self.lease = lease
+        self.heartbeat_interval = heartbeat_interval
+        self.is_leader = False
+        self.last_heartbeat = None
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Start heartbeating; leadership is attempted immediately"""
+        if self._running:
+            return
+        self._running = True
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop heartbeating and release the lease"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=self.heartbeat_interval + 1)
+        if self.is_leader:
+            try:
+                self.lease.release()
+            except Exception as e:
+                logger.error(f"Error releasing leader lease: {e}")
+        self.is_leader = False
+
+    def heartbeat(self):
+        """Acquire or renew the lease once"""
+        try:
+            leader = bool(self.lease.acquire())
+        except Exception as e:
+            logger.error(f"Leader heartbeat failed: {e}")
+            leader = False
+
+        if leader != self.is_leader:
+            state = "acquired" if leader else "lost"
+            logger.info(f"Worker {self.lease.owner} {state} bot engine leadership")
+        self.is_leader = leader
+        self.last_heartbeat = time.time()
+        return leader
+
+    def _heartbeat_loop(self):
+        """Renew the lease until stopped"""
+        while self._running:
+            time.sleep(self.heartbeat_interval)
+            if self._running:
+                self.heartbeat()
+
+    def describe(self):
+        """Report this worker's view of the leader for admin routes"""
+        try:
+            holder = self.lease.holder()
+        except Exception as e:
+            holder = {'owner': None, 'error': str(e)}
+        return {
+            'worker_id': self.lease.owner,
+            'is_leader': self.is_leader,
+            'leader': holder.get('owner'),
+            'lease': holder,
+            'last_heartbeat': self.last_heartbeat
+        }
@@ -0,0 +1,196 @@
+import itertools
+import json
+import queue
+import threading
+import uuid
+from collections import deque
+
+# Stream marker telling the client to reload: it missed events it cannot replay
+RESET = (0, 'reset', {})
+
+class HubFull(Exception):
+    """Raised when this worker already serves max_subscribers streams"""
+
+class Subscription:
+    """One client stream: a set of topics and a bounded queue of pending events"""
+
+    def __init__(self, hub, topics, max_queue):
+        self.hub = hub
+        self.topics = set(topics)
+        self.queue = queue.Queue(max_queue)
+        self.overflowed = False
+
+    def get(self, timeout):
+        """Next (id, event, data), or None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class EventHub:
+    """In-process pub/sub behind the Server-Sent Events streams.
+
+    Model listeners publish bid and loan changes to 'loan:<id>' and
+    'borrower:<id>' topics, and each open stream holds a Subscription.
+    Publishing only touches the subscribers of that topic and never
+    blocks: a client too slow to drain max_queue events is cut off and
+    told to reload. The last replay_size events are kept so a client
+    reconnecting with Last-Event-ID picks up where it left off; ids carry
+    a per-process epoch, so an id from a restarted or different worker
+    gets a reset instead of a silent gap. Nothing
+    here runs a thread per subscriber; run the app under an async
+    gunicorn worker (see Procfile) so idle streams don't hold one either.
+    """
+
+    def __init__(self, max_subscribers=5000, max_queue=100, replay_size=1000):
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self.topics = {}
+        self.subscribers = 0
+        self.replay = deque(maxlen=replay_size)
+        self.sequence = itertools.count(1)
+        self.epoch = uuid.uuid4().hex[:8]
+        self.stats = {'published': 0, 'delivered': 0, 'dropped': 0}
+        self._lock = threading.Lock()
+
+    def parse_event_id(self, value):
+        """Sequence number of a Last-Event-ID from this hub, -1 if from elsewhere, None if absent"""
+        if not value:
+            return None
+        epoch, _, sequence = value.partition('-')
+        if epoch != self.epoch or not sequence.isdigit():
+            return -1
+        return int(sequence)
+
+    def subscribe(self, topics, last_event_id=None):
+        """Open a subscription; with last_event_id, missed events are queued first"""
+        last_event_id = self.parse_event_id(last_event_id)
+        with self._lock:
+            if self.subscribers >= self.max_subscribers:
+                raise HubFull(f"{self.subscribers} streams already open")
+            subscription = Subscription(self, topics, self.max_queue)
+            for topic in subscription.topics:
+                self.topics.setdefault(topic, set()).add(subscription)
+            self.subscribers += 1
+
+            if last_event_id is not None:
+                missed = [message[:3] for message in self.replay
+                          if message[0] > last_event_id and message[3] in subscription.topics]
+                lost = last_event_id < 0 or (self.replay and self.replay[0][0] > last_event_id + 1)
+                if lost or len(missed) >= self.max_queue:
+                    subscription.queue.put_nowait(RESET)
+                else:
+                    for message in missed:
+                        subscription.queue.put_nowait(message)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._detach(subscription)
+
+    def _detach(self, subscription):
+        """Remove a subscription from its topics; caller holds the lock"""
+        if subscription.topics is None:
+            return
+        for topic in subscription.topics:
+            subscribers = self.topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.topics[topic]
+        subscription.topics = None
+        self.subscribers -= 1
+
+    def publish(self, topic, event, data, follow=None):
+        """Queue an event for the topic's subscribers; follow adds a topic to each of them"""
+        with self._lock:
+            event_id = next(self.sequence)
+            self.replay.append((event_id, event, data, topic))
+            self.stats['published'] += 1
+            for subscription in list(self.topics.get(topic, ())):
+                if follow is not None and follow not in subscription.topics:
+                    subscription.topics.add(follow)
+                    self.topics.setdefault(follow, set()).add(subscription)
+                try:
+                    subscription.queue.put_nowait((event_id, event, data))
+                    self.stats['delivered'] += 1
+                except queue.Full:
+                    # Never block the writer on a stalled client
+                    subscription.overflowed = True
+                    self._detach(subscription)
+                    self.stats['dropped'] += 1
+        return event_id
+
+    def on_bid_event(self, event, bid):
+        """Listener for DynamoDBBid"""
+        loan_id = bid.get('loan_request_id')
+        if not loan_id:
+            return
+        if event == 'created':
+            self.publish(f'loan:{loan_id}', 'bid_placed', {
+                'id': bid['id'],
+                'loan_request_id': loan_id,
+                'amount': float(bid['amount']),
+                'interest_rate': float(bid['interest_rate']),
+                'status': bid.get('status', 'pending'),
+                'created_at': bid.get('created_at', '')
+            })
+        elif event == 'status':
+            data = {'id': bid['id'], 'loan_request_id': loan_id, 'status': bid['status']}
+            if bid.get('filled_amount') is not None:
+                data['filled_amount'] = float(bid['filled_amount'])
+            self.publish(f'loan:{loan_id}', 'bid_status', data)
+
+    def on_loan_event(self, event, loan):
+        """Listener for DynamoDBLoanRequest"""
+        if event == 'created':
+            # Borrower streams start following the new loan's bids too
+            self.publish(f"borrower:{loan['borrower_id']}", 'loan_created', {
+                'id': loan['id'],
+                'amount': float(loan['amount']),
+                'purpose': loan.get('purpose', ''),
+                'term_months': int(loan.get('term_months', 0)),
+                'max_interest_rate': float(loan.get('max_interest_rate', 0)),
+                'status': loan.get('status', 'open'),
+                'created_at': loan.get('created_at', '')
+            }, follow=f"loan:{loan['id']}")
+        elif event == 'status':
+            self.publish(f"loan:{loan['id']}", 'loan_status', {'id': loan['id'], 'status': loan['status']})
+
+    def stream(self, subscription, heartbeat=15, retry_ms=5000):
+        """SSE body for a subscription; comment lines keep idle proxies from closing it"""
+        try:
+            yield f'retry: {retry_ms}\n\n'
+            while True:
+                if subscription.overflowed and subscription.queue.empty():
+                    yield format_event(*RESET, epoch=self.epoch)
+                    return
+                message = subscription.get(heartbeat)
+                if message is None:
+                    yield ': ping\n\n'
+                    continue
+                yield format_event(*message, epoch=self.epoch)
+                if message is RESET:
+                    return
+        finally:
+            subscription.close()
+
+    def describe(self):
+        with self._lock:
+            return {'subscribers': self.subscribers, 'topics': len(self.topics), **self.stats}
+
+def format_event(event_id, event, data, epoch=''):
+    """One SSE frame; the reset marker carries no id so it doesn't move Last-Event-ID"""
+    lines = [] if event_id == 0 else [f'id: {epoch}-{event_id}']
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,435 @@
+import heapq
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+from auto_invest import normalize_purpose
+from portfolio import CREDIT_BANDS, credit_band
+
+INF = float('inf')
+
+def rows_to_mask(rows, size):
+    """Bitmap with the given row bits set; built in a bytearray so cost is per row, not per bit"""
+    bits = bytearray((size >> 3) + 1)
+    for row in rows:
+        bits[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(bits, 'little')
+
+NONZERO_BYTE = re.compile(b'[^\x00]')
+
+def mask_rows(bits):
+    """Row numbers set in a little-endian bitmap, found by scanning for non-zero bytes"""
+    rows = []
+    for match in NONZERO_BYTE.finditer(bits):
+        byte = bits[match.start()]
+        base = match.start() << 3
+        while byte:
+            low = byte & -byte
+            rows.append(base + low.bit_length() - 1)
+            byte ^= low
+    return rows
+
+class RangeColumn:
+    """One numeric attribute as sorted bins of (value, row), each with a row bitmap.
+
+    A range query ORs the bitmaps of the bins it covers completely (or
+    the complement when that is fewer bins) and only bisects inside the
+    two boundary bins. Bins split when they grow past twice bin_size and
+    are dropped when they empty.
+    """
+
+    def __init__(self, bin_size=4096):
+        self.bin_size = bin_size
+        self.splits = []
+        self.bins = [[]]
+        self.masks = [0]
+
+    def bulk_load(self, pairs, size):
+        """Replace the contents with (value, row) pairs"""
+        pairs = sorted(pairs)
+        self.splits, self.bins, self.masks = [], [], []
+        start = 0
+        while start < len(pairs):
+            end = min(start + self.bin_size, len(pairs))
+            # Equal values never straddle a split
+            while end < len(pairs) and pairs[end][0] == pairs[end - 1][0]:
+                end += 1
+            if self.bins:
+                self.splits.append(pairs[start][0])
+            chunk = pairs[start:end]
+            self.bins.append(chunk)
+            self.masks.append(rows_to_mask((row for _, row in chunk), size))
+            start = end
+        if not self.bins:
+            self.bins, self.masks = [[]], [0]
+
+    def add(self, value, row):
+        index = bisect_right(self.splits, value)
+        insort(self.bins[index], (value, row))
+        self.masks[index] |= 1 << row
+        if len(self.bins[index]) > 2 * self.bin_size:
+            self._split(index)
+
+    def remove(self, value, row):
+        index = bisect_right(self.splits, value)
+        entries = self.bins[index]
+        position = bisect_left(entries, (value, row))
+        if position < len(entries) and entries[position] == (value, row):
+            del entries[position]
+            self.masks[index] ^= 1 << row
+            if not entries and len(self.bins) > 1:
+                del self.bins[index]
+                del self.masks[index]
+                del self.splits[max(0, index - 1)]
+
+    def _split(self, index):
+        entries = self.bins[index]
+        middle = len(entries) // 2
+        while middle < len(entries) and entries[middle][0] == entries[middle - 1][0]:
+            middle += 1
+        if middle >= len(entries):
+            return  # One repeated value; nothing to split on
+        size = max(row for _, row in entries) + 1
+        low, high = entries[:middle], entries[middle:]
+        self.bins[index:index + 1] = [low, high]
+        self.masks[index:index + 1] = [rows_to_mask((row for _, row in low), size),
+                                       rows_to_mask((row for _, row in high), size)]
+        self.splits.insert(index, high[0][0])
+
+    def select(self, low, high, alive, size):
+        """Bitmap of rows with low <= value <= high; either bound may be None"""
+        first = 0 if low is None else bisect_right(self.splits, low)
+        last = len(self.bins) - 1 if high is None else bisect_right(self.splits, high)
+        if first > last:
+            return 0
+
+        inner = range(first + 1, last)
+        if len(inner) * 2 > len(self.bins):
+            outer = 0
+            for index in range(first):
+                outer |= self.masks[index]
+            for index in range(last + 1, len(self.bins)):
+                outer |= self.masks[index]
+            mask = alive & ~outer & ~self.masks[first] & ~self.masks[last]
+        else:
+            mask = 0
+            for index in inner:
+                mask |= self.masks[index]
+        mask |= self._edge(first, low, high if first == last else None, size)
+        if last != first:
+            mask |= self._edge(last, None, high, size)
+        return mask
+
+    def _edge(self, index, low, high, size):
+        """Rows of one boundary bin inside the bounds"""
+        entries = self.bins[index]
+        start = 0 if low is None else bisect_left(entries, (low, -1))
+        end = len(entries) if high is None else bisect_right(entries, (high, INF))
+        if start == 0 and end == len(entries):
+            return self.masks[index]
+        if (end - start) * 2 > len(entries):
+            outside = [row for _, row in entries[:start]] + [row for _, row in entries[end:]]
+            return self.masks[index] ^ rows_to_mask(outside, size)
+        return rows_to_mask((row for _, row in entries[start:end]), size)
+
+    def ordered_rows(self, reverse=False):
+        """Rows in value order"""
+        bins = reversed(self.bins) if reverse else self.bins
+        for entries in bins:
+            for _, row in (reversed(entries) if reverse else entries):
+                yield row
+
+class ValueBitmaps:
+    """One categorical attribute as a row bitmap per value"""
+
+    def __init__(self):
+        self.masks = {}
+
+    def bulk_load(self, pairs, size):
+        rows = {}
+        for value, row in pairs:
+            rows.setdefault(value, []).append(row)
+        self.masks = {value: rows_to_mask(value_rows, size) for value, value_rows in rows.items()}
+
+    def add(self, value, row):
+        self.masks[value] = self.masks.get(value, 0) | (1 << row)
+
+    def remove(self, value, row):
+        mask = self.masks.get(value, 0) & ~(1 << row)
+        if mask:
+            self.masks[value] = mask
+        else:
+            self.masks.pop(value, None)
+
+    def select(self, values):
+        mask = 0
+        for value in values:
+            mask |= self.masks.get(value, 0)
+        return mask
+
+    def counts(self, mask):
+        """Facet counts of the values within mask"""
+        return {value: count for value, count in
+                ((value, (bits & mask).bit_count()) for value, bits in self.masks.items()) if count}
+
+# Sort keys accepted by search(), with the column each one walks
+SORTS = {
+    'amount': ('amount', False),
+    '-amount': ('amount', True),
+    'rate': ('rate', False),
+    '-rate': ('rate', True),
+    'dti': ('dti', False),
+    'newest': ('created', True),
+    'oldest': ('created', False)
+}
+
+class LoanSearchIndex:
+    """Columnar in-memory index of open loans for lender discovery.
+
+    Each loan owns a row. Amount, max rate, DTI and creation time are
+    RangeColumns; term, purpose and credit band are ValueBitmaps. A query
+    ANDs one bitmap per filter, counts facets with popcounts and walks the
+    sort column in order, skipping rows outside the result, until it has
+    a page. Rows of closed loans are recycled.
+    """
+
+    def __init__(self, borrower_loader=None, bin_size=4096):
+        self.borrower_loader = borrower_loader
+        self.bin_size = bin_size
+        # Set by rebuild(); events are ignored until the first load
+        self.loaded_at = None
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.rows = {}
+        self.ids = []
+        self.free = []
+        self.alive = 0
+        self.amounts = array('d')
+        self.rates = array('d')
+        self.dtis = array('d')
+        self.terms = array('i')
+        self.bands = array('b')
+        self.bid_counts = array('i')
+        self.created = []
+        self.purposes = []
+        self.borrower_ids = []
+        self.purpose_labels = {}
+        self.columns = {name: RangeColumn(self.bin_size) for name in ('amount', 'rate', 'dti', 'created')}
+        self.categories = {name: ValueBitmaps() for name in ('term', 'purpose', 'credit_band')}
+        self.bid_loans = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def _attributes(loan, borrower):
+        amount = float(loan['amount'])
+        income = float((borrower or {}).get('annual_income', 0) or 0)
+        return {
+            'amount': amount,
+            'rate': float(loan['max_interest_rate']),
+            'dti': round(amount / income, 4) if income > 0 else INF,
+            'created': loan.get('created_at', ''),
+            'term': int(loan['term_months']),
+            'purpose': normalize_purpose(loan.get('purpose')),
+            'credit_band': CREDIT_BANDS.index(credit_band((borrower or {}).get('credit_score', 0)))
+        }
+
+    def rebuild(self, loans, borrowers, pending_bids=None):
+        """Load every open loan at once; borrowers is keyed by id, pending_bids by loan id"""
+        with self._lock:
+            self._reset()
+            records = []
+            for loan in loans:
+                if loan.get('status', 'open') != 'open':
+                    continue
+                row = len(self.ids)
+                self._store(row, loan, self._attributes(loan, borrowers.get(loan['borrower_id'])))
+                records.append(row)
+            size = len(self.ids)
+            for name, column in self.columns.items():
+                values = self._column_values(name)
+                column.bulk_load(((values[row], row) for row in records), size)
+            self.categories['term'].bulk_load(((self.terms[row], row) for row in records), size)
+            self.categories['purpose'].bulk_load(((self.purposes[row], row) for row in records), size)
+            self.categories['credit_band'].bulk_load(((self.bands[row], row) for row in records), size)
+            self.alive = rows_to_mask(records, size)
+            for loan_id, bids in (pending_bids or {}).items():
+                row = self.rows.get(loan_id)
+                if row is None:
+                    continue
+                for bid in bids:
+                    self.bid_loans[bid['id']] = loan_id
+                self.bid_counts[row] = len(bids)
+            self.loaded_at = time.time()
+
+    def _column_values(self, name):
+        return {'amount': self.amounts, 'rate': self.rates, 'dti': self.dtis, 'created': self.created}[name]
+
+    def _store(self, row, loan, attributes):
+        """Write a loan's attributes into its row of every column array"""
+        self.rows[loan['id']] = row
+        values = (loan['id'], attributes['amount'], attributes['rate'], attributes['dti'], attributes['term'],
+                  attributes['credit_band'], 0, attributes['created'], attributes['purpose'], loan['borrower_id'])
+        columns = (self.ids, self.amounts, self.rates, self.dtis, self.terms, self.bands, self.bid_counts,
+                   self.created, self.purposes, self.borrower_ids)
+        if row == len(self.ids):
+            for column, value in zip(columns, values):
+                column.append(value)
+        else:
+            for column, value in zip(columns, values):
+                column[row] = value
+        self.purpose_labels.setdefault(attributes['purpose'], loan.get('purpose') or 'Other')
+
+    def add(self, loan, borrower=None):
+        """Index one open loan"""
+        if borrower is None and self.borrower_loader:
+            borrower = self.borrower_loader(loan['borrower_id'])
+        attributes = self._attributes(loan, borrower)
+        with self._lock:
+            if loan['id'] in self.rows:
+                self.remove(loan['id'])
+            row = self.free.pop() if self.free else len(self.ids)
+            self._store(row, loan, attributes)
+            for name, column in self.columns.items():
+                column.add(attributes[name], row)
+            for name, bitmaps in self.categories.items():
+                bitmaps.add(attributes[name], row)
+            self.alive |= 1 << row
+
+    def remove(self, loan_id):
+        """Drop a loan that is no longer open"""
+        with self._lock:
+            row = self.rows.pop(loan_id, None)
+            if row is None:
+                return
+            for name, column in self.columns.items():
+                column.remove(self._column_values(name)[row], row)
+            self.categories['term'].remove(self.terms[row], row)
+            self.categories['purpose'].remove(self.purposes[row], row)
+            self.categories['credit_band'].remove(self.bands[row], row)
+            self.alive ^= 1 << row
+            self.ids[row] = None
+            self.bid_counts[row] = 0
+            self.free.append(row)
+
+    def on_loan_event(self, event, loan):
+        """Listener for DynamoDBLoanRequest: 'created' with the item, 'status' with id and status"""
+        if self.loaded_at is None:
+            return
+        if event == 'created' and loan.get('status', 'open') == 'open':
+            self.add(loan)
+        elif event == 'status' and loan['status'] != 'open':
+            self.remove(loan['id'])
+
+    def on_bid_event(self, event, bid):
+        """Listener for DynamoDBBid; keeps the pending bid count of each loan"""
+        if self.loaded_at is None:
+            return
+        with self._lock:
+            if event == 'created' and bid.get('status', 'pending') == 'pending':
+                row = self.rows.get(bid['loan_request_id'])
+                if row is not None:
+                    self.bid_loans[bid['id']] = bid['loan_request_id']
+                    self.bid_counts[row] += 1
+            elif event == 'status' and bid['status'] != 'pending':
+                row = self.rows.get(self.bid_loans.pop(bid['id'], None))
+                if row is not None and self.bid_counts[row] > 0:
+                    self.bid_counts[row] -= 1
+
+    def search(self, min_amount=None, max_amount=None, terms=None, purposes=None, min_rate=None,
+               max_rate=None, credit_bands=None, max_dti=None, sort='newest', limit=20, offset=0):
+        """Filtered, sorted page of open loans with facet counts.
+
+        Facet counts for a dimension apply every filter except that
+        dimension's own, so they show what widening it would add.
+        """
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort {sort!r}")
+        with self._lock:
+            size = len(self.ids)
+            alive = self.alive
+            mask = alive
+            for name, low, high in (('amount', min_amount, max_amount), ('rate', min_rate, max_rate),
+                                    ('dti', None, max_dti)):
+                if low is not None or high is not None:
+                    mask &= self.columns[name].select(low, high, alive, size)
+
+            selected = {
+                'term': [int(term) for term in terms] if terms else None,
+                'purpose': [normalize_purpose(purpose) for purpose in purposes] if purposes else None,
+                'credit_band': [CREDIT_BANDS.index(band) for band in credit_bands if band in CREDIT_BANDS]
+                               if credit_bands else None
+            }
+            category_masks = {name: self.categories[name].select(values)
+                              for name, values in selected.items() if values is not None}
+
+            result = mask
+            for category_mask in category_masks.values():
+                result &= category_mask
+
+            facets = {}
+            for name, bitmaps in self.categories.items():
+                base = mask
+                for other, category_mask in category_masks.items():
+                    if other != name:
+                        base &= category_mask
+                facets[name] = bitmaps.counts(base)
+
+            page = self._page(result, size, sort, limit, offset)
+            return {
+                'total': result.bit_count(),
+                'loans': [self._loan(row) for row in page],
+                'facets': {
+                    'term': {str(term): count for term, count in sorted(facets['term'].items())},
+                    'purpose': {self.purpose_labels.get(key, key): count
+                                for key, count in sorted(facets['purpose'].items())},
+                    'credit_band': {CREDIT_BANDS[band]: count for band, count in sorted(facets['credit_band'].items())}
+                }
+            }
+
+    def _page(self, result, size, sort, limit, offset):
+        """Walk the sort column and keep rows in result until the page is full"""
+        if not result or limit <= 0:
+            return []
+        bits = result.to_bytes((size >> 3) + 1, 'little')
+        column, reverse = SORTS[sort]
+        total = result.bit_count()
+        # Walking visits about (offset + limit) / selectivity rows; when that
+        # is more than the matches themselves, pick the top rows directly
+        if total * total < (offset + limit) * len(self.rows):
+            values = self._column_values(column)
+            keyed = [(values[row], row) for row in mask_rows(bits)]
+            top = (heapq.nlargest if reverse else heapq.nsmallest)(offset + limit, keyed)
+            return [row for _, row in top[offset:]]
+        page = []
+        skipped = 0
+        for row in self.columns[column].ordered_rows(reverse):
+            if bits[row >> 3] >> (row & 7) & 1:
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                page.append(row)
+                if len(page) >= limit:
+                    break
+        return page
+
+    def _loan(self, row):
+        """Result record for one row, read from the column arrays"""
+        dti = self.dtis[row]
+        return {
+            'id': self.ids[row],
+            'borrower_id': self.borrower_ids[row],
+            'amount': self.amounts[row],
+            'term_months': self.terms[row],
+            'purpose': self.purpose_labels.get(self.purposes[row], self.purposes[row]),
+            'max_interest_rate': self.rates[row],
+            'credit_band': CREDIT_BANDS[self.bands[row]],
+            'dti': dti if dti != INF else None,
+            'bid_count': self.bid_counts[row],
+            'created_at': self.created[row]
+        }
@@ -0,0 +1,211 @@
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from bot_lenders import credit_bucket, amount_bucket, term_bucket
+from dynamodb_models import BidCreated, BidStatusChanged
+
+BID_STATUSES = ('pending', 'accepted')
+
+class RateSketch:
+    """Rolling rate histogram over the last window samples.
+
+    Rates fall into fixed-width bins and a ring buffer remembers which bin
+    each sample went to, so adding a sample (and evicting the oldest) is
+    O(1) and memory never grows. Percentiles are read off the bin counts.
+    """
+
+    def __init__(self, window=500, bin_width=0.05, max_rate=40.0):
+        self.window = window
+        self.bin_width = bin_width
+        self.counts = [0] * (int(max_rate / bin_width) + 1)
+        self.ring = [None] * window
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, rate):
+        """Add one rate, evicting the oldest sample once the window is full"""
+        index = min(len(self.counts) - 1, max(0, int(rate / self.bin_width)))
+        oldest = self.ring[self.position]
+        if oldest is not None:
+            self.counts[oldest[0]] -= 1
+            self.total -= oldest[1]
+        else:
+            self.count += 1
+        self.ring[self.position] = (index, rate)
+        self.position = (self.position + 1) % self.window
+        self.counts[index] += 1
+        self.total += rate
+
+    def percentile(self, p):
+        """Approximate p-th percentile (bin midpoint); None when empty"""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return round((index + 0.5) * self.bin_width, 2)
+        return None
+
+    def mean(self):
+        return round(self.total / self.count, 2) if self.count else None
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'p25': self.percentile(25),
+            'p50': self.percentile(50),
+            'p75': self.percentile(75)
+        }
+
+class MarketRateIndex:
+    """Rolling bid rates per (term, credit, amount) bucket.
+
+    Placed bids are recorded as pending and filled bids again as
+    accepted; MarketIndexFeed does the recording. Quotes prefer accepted
+    rates and fall back to pending ones, and return None until a bucket
+    has min_samples rates.
+    """
+
+    def __init__(self, window=500, min_samples=20, bin_width=0.05, max_rate=40.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.bin_width = bin_width
+        self.max_rate = max_rate
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bucket_key(credit_score, amount, term_months):
+        """Index bucket for a loan, using the bot pricing grid's bands"""
+        return (term_bucket(int(term_months)), credit_bucket(int(credit_score or 0)), amount_bucket(float(amount)))
+
+    def record(self, credit_score, amount, term_months, rate, status='pending'):
+        """Add a bid rate to its bucket"""
+        if status not in BID_STATUSES:
+            return
+        key = self.bucket_key(credit_score, amount, term_months)
+        with self._lock:
+            sketches = self.buckets.get(key)
+            if sketches is None:
+                sketches = {s: RateSketch(self.window, self.bin_width, self.max_rate) for s in BID_STATUSES}
+                self.buckets[key] = sketches
+            sketches[status].add(float(rate))
+
+    def quote(self, credit_score, amount, term_months, percentile=50):
+        """Market rate at a percentile for a loan, or None without enough data"""
+        key = self.bucket_key(credit_score, amount, term_months)
+        with self._lock:
+            sketches = self.buckets.get(key)
+            if sketches is None:
+                return None
+            for status in ('accepted', 'pending'):
+                if sketches[status].count >= self.min_samples:
+                    return sketches[status].percentile(percentile)
+        return None
+
+    def snapshot(self):
+        """Summary of every bucket for the API"""
+        with self._lock:
+            return [
+                {
+                    'term_bucket': key[0],
+                    'credit_bucket': key[1],
+                    'amount_bucket': key[2],
+                    **{status: sketches[status].summary() for status in BID_STATUSES}
+                }
+                for key, sketches in sorted(self.buckets.items())
+            ]
+
+    def reset(self):
+        """Forget all recorded rates"""
+        with self._lock:
+            self.buckets = {}
+
+class MarketIndexFeed:
+    """Keeps a MarketRateIndex current from bid events and seeds it from the bids table.
+
+    New bids are recorded as pending, except the bots' own: bots price
+    off this index, so feeding their quotes back would pull it toward
+    itself. Fills from every path (matching, auction close, a borrower's
+    accept) arrive as BidStatusChanged with a filled_amount and count as
+    accepted. A bucket needs the loan and its borrower, so those are
+    looked up once per loan and kept in a bounded cache.
+    """
+
+    def __init__(self, index, loan_model, user_model, max_loans=10000):
+        self.index = index
+        self.loan_model = loan_model
+        self.user_model = user_model
+        self.max_loans = max_loans
+        self.loans = OrderedDict()
+        self.seeded = False
+        self._lock = threading.Lock()
+
+    def on_event(self, event):
+        """Event bus handler for BID_EVENTS"""
+        if isinstance(event, BidCreated):
+            bid = event.bid
+            if bid.get('source') != 'bot':
+                self._record(bid['loan_request_id'], bid['interest_rate'], 'pending')
+        elif isinstance(event, BidStatusChanged):
+            if event.status == 'accepted' and event.filled_amount and event.interest_rate is not None:
+                self._record(event.loan_request_id, event.interest_rate, 'accepted')
+
+    def _record(self, loan_id, rate, status):
+        profile = self._loan_profile(loan_id)
+        if profile is not None:
+            self.index.record(*profile, rate, status=status)
+
+    def _loan_profile(self, loan_id):
+        """(credit_score, amount, term_months) of a loan, or None if it can't be found"""
+        with self._lock:
+            if loan_id in self.loans:
+                self.loans.move_to_end(loan_id)
+                return self.loans[loan_id]
+        loan = self.loan_model.get_loan_request(loan_id) if loan_id else None
+        if not loan:
+            return None
+        borrower = self.user_model.get_user_by_id(loan['borrower_id']) or {}
+        profile = (borrower.get('credit_score', 0), loan['amount'], loan['term_months'])
+        with self._lock:
+            self.loans[loan_id] = profile
+            while len(self.loans) > self.max_loans:
+                self.loans.popitem(last=False)
+        return profile
+
+    def seed(self, bid_model, days=30):
+        """Replay the last days of bids into the index, oldest first; returns how many were recorded"""
+        since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        bids = [bid for bid in bid_model.get_bids_since(since)
+                if bid['status'] == 'accepted' or bid.get('source') != 'bot']
+        bids.sort(key=lambda bid: bid.get('created_at', ''))
+        loans = self.loan_model.get_loan_requests({bid['loan_request_id'] for bid in bids})
+        borrowers = self.user_model.get_users({loan['borrower_id'] for loan in loans.values()})
+
+        recorded = 0
+        for bid in bids:
+            loan = loans.get(bid['loan_request_id'])
+            if not loan:
+                continue
+            borrower = borrowers.get(loan['borrower_id']) or {}
+            self.index.record(borrower.get('credit_score', 0), loan['amount'], loan['term_months'],
+                              bid['interest_rate'], status=bid['status'])
+            recorded += 1
+        return recorded
+
+    def seed_in_background(self, bid_model, days=30):
+        """Seed once per process without holding up the caller"""
+        with self._lock:
+            if self.seeded:
+                return
+            self.seeded = True
+        threading.Thread(target=self.seed, args=(bid_model, days), daemon=True, name='market-index-seed').start()
+
+# Shared by the web app and the bots in this process
+market_index = MarketRateIndex()
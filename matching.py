@@ -0,0 +1,286 @@
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, ROUND_DOWN
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+# DynamoDB transactions take at most 100 items; one is the loan update
+MAX_ALLOCATIONS_PER_COMMIT = 99
+
+Allocation = namedtuple('Allocation', ['bid_id', 'lender_id', 'amount', 'bid_amount', 'interest_rate'])
+
+def to_cents(value):
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_DOWN)
+
+def match_bids(loan_amount, bids):
+    """Fill loan_amount from bids in rate priority.
+
+    bids must already be in (rate, created_at) order, as returned by
+    OrderBook.sorted_bids(). Bids at a better rate fill completely; when
+    the bids tied at the marginal rate offer more than is left, each gets
+    a pro-rata share rounded down to the cent and the leftover cents go
+    to the earliest bids. Returns (allocations, remaining).
+    """
+    remaining = to_cents(loan_amount)
+    allocations = []
+    start = 0
+    while start < len(bids) and remaining > 0:
+        rate = Decimal(str(bids[start]['interest_rate']))
+        end = start
+        level_total = Decimal('0')
+        while end < len(bids) and Decimal(str(bids[end]['interest_rate'])) == rate:
+            level_total += to_cents(bids[end]['amount'])
+            end += 1
+        level = bids[start:end]
+        start = end
+
+        if level_total <= remaining:
+            shares = [to_cents(bid['amount']) for bid in level]
+        else:
+            shares = [(to_cents(bid['amount']) * remaining / level_total).quantize(CENT, rounding=ROUND_DOWN)
+                      for bid in level]
+            leftover = int((remaining - sum(shares)) / CENT)
+            for i in range(len(level)):
+                if not leftover:
+                    break
+                if shares[i] < to_cents(level[i]['amount']):
+                    shares[i] += CENT
+                    leftover -= 1
+
+        for bid, share in zip(level, shares):
+            if share > 0:
+                allocations.append(Allocation(bid['id'], bid['lender_id'], share,
+                                              to_cents(bid['amount']), rate))
+                remaining -= share
+    return allocations, remaining
+
+def single_best(loan_amount, bids):
+    """The one best-priority bid big enough to fund loan_amount on its own.
+
+    Same (allocations, remaining) result as match_bids, so the two are
+    interchangeable as winner rules.
+    """
+    remaining = to_cents(loan_amount)
+    for bid in bids:
+        if to_cents(bid['amount']) >= remaining:
+            return [Allocation(bid['id'], bid['lender_id'], remaining, to_cents(bid['amount']),
+                               Decimal(str(bid['interest_rate'])))], Decimal('0')
+    return [], remaining
+
+# How winners are picked when an auction closes. Both walk the order book,
+# so priority is always lowest rate first, then earliest bid.
+WINNER_RULES = {
+    'fill': match_bids,
+    'single': single_best
+}
+
+class MatchingEngine:
+    """Fills loans from their order books and commits the fills atomically.
+
+    Each commit is one DynamoDB transaction that accepts the filled bids and
+    advances the loan's funded_amount, conditional on no other fill having
+    moved it in the meantime. Loans needing more than 99 bids are filled in
+    several such commits.
+    """
+
+    def __init__(self, loan_model, bid_model, ledger, order_books, on_settled=None, max_workers=4):
+        self.loan_model = loan_model
+        self.bid_model = bid_model
+        self.ledger = ledger
+        self.order_books = order_books
+        # Called as on_settled(lender_id, bid_id, filled, released, status, loan_id)
+        self.on_settled = on_settled
+        self.max_workers = max_workers
+
+    def fill_loan(self, loan_id):
+        """Fill as much of an open loan as its pending bids allow"""
+        loan = self.loan_model.get_loan_request(loan_id)
+        if not loan or loan['status'] != 'open':
+            return None
+        return self._fill(loan)
+
+    def accept_bid(self, loan, bid):
+        """Fund a loan from one bid the borrower picked, and close it.
+
+        The fill is capped at what earlier partial fills left, and commits
+        through the same conditional transaction as any other fill, so a
+        bid that is no longer pending or a loan that moved in the meantime
+        makes this return None instead of over-funding.
+        """
+        if loan['status'] != 'open' or bid['status'] != 'pending' or bid['loan_request_id'] != loan['id']:
+            return None
+        loan_id = loan['id']
+        amount = to_cents(loan['amount'])
+        funded = to_cents(loan.get('funded_amount', 0))
+        bid_amount = to_cents(bid['amount'])
+        fill = min(bid_amount, amount - funded)
+        if fill <= 0:
+            return None
+
+        allocation = Allocation(bid['id'], bid['lender_id'], fill, bid_amount, Decimal(str(bid['interest_rate'])))
+        if not self.bid_model.accept_allocations(loan_id, [allocation], funded, funded + fill, True):
+            self.order_books.close(loan_id)
+            return None
+        self._settle(allocation.lender_id, allocation.bid_id, fill, bid_amount - fill, 'accepted', loan_id)
+        self._reject_remaining(loan_id)
+        return {'loan_id': loan_id, 'amount': float(amount), 'funded': True,
+                'allocations': [{'bid_id': allocation.bid_id, 'lender_id': allocation.lender_id,
+                                 'amount': float(fill), 'bid_amount': float(bid_amount),
+                                 'interest_rate': float(allocation.interest_rate)}],
+                'funded_amount': float(funded + fill), 'remaining': float(amount - funded - fill)}
+
+    def close_loan(self, loan_id, rule='fill', min_fill_ratio=1, loan=None, reject=True):
+        """Settle an expired auction.
+
+        Winners are picked from the order book by the named rule and the
+        loan is closed as funded, even short of its full amount, if they
+        reach min_fill_ratio of it. Otherwise the loan is marked expired.
+        Either way every losing bid is rejected and its capital released.
+        Fills committed before the close stand, so a loan that already has
+        some funding is never expired. With reject=False the losing bids
+        are left for the caller to reject in bulk.
+        """
+        select = WINNER_RULES[rule]
+        if loan is None:
+            loan = self.loan_model.get_loan_request(loan_id)
+        if not loan or loan['status'] != 'open':
+            self.order_books.close(loan_id)
+            return None
+
+        amount = to_cents(loan['amount'])
+        funded = to_cents(loan.get('funded_amount', 0))
+        _, remaining = select(amount - funded, self.order_books.get(loan_id).sorted_bids())
+        if not funded and amount - remaining < amount * Decimal(str(min_fill_ratio)):
+            return self._expire(loan_id, amount, reject)
+        return self._fill(loan, select, closing=True, reject=reject)
+
+    def _fill(self, loan, select=match_bids, closing=False, reject=True):
+        """Commit fills chosen by select until the loan is funded or out of bids.
+
+        When closing, the commit carrying the last winner also closes the
+        loan, and a loan with no new winners is closed at what it has.
+        """
+        loan_id = loan['id']
+        amount = to_cents(loan['amount'])
+        funded = to_cents(loan.get('funded_amount', 0))
+        result = {'loan_id': loan_id, 'amount': float(amount), 'allocations': [], 'funded': False}
+        conflicts = 0
+
+        while funded < amount and conflicts < 3:
+            book = self.order_books.get(loan_id)
+            winners, _ = select(amount - funded, book.sorted_bids())
+            allocations = winners[:MAX_ALLOCATIONS_PER_COMMIT]
+            if not allocations and not (closing and funded > 0):
+                break
+
+            new_funded = funded + sum(allocation.amount for allocation in allocations)
+            fully_funded = new_funded >= amount or (closing and len(winners) <= MAX_ALLOCATIONS_PER_COMMIT)
+            if not self.bid_model.accept_allocations(loan_id, allocations, funded, new_funded, fully_funded):
+                # Another fill got there first or a bid changed; start over from fresh state
+                logger.warning(f"Fill of loan {loan_id} conflicted; reloading")
+                conflicts += 1
+                self.order_books.close(loan_id)
+                loan = self.loan_model.get_loan_request(loan_id)
+                if not loan or loan['status'] != 'open':
+                    break
+                funded = to_cents(loan.get('funded_amount', 0))
+                continue
+
+            for allocation in allocations:
+                self._settle(allocation.lender_id, allocation.bid_id, allocation.amount,
+                             allocation.bid_amount - allocation.amount, 'accepted', loan_id)
+            result['allocations'].extend(
+                {'bid_id': a.bid_id, 'lender_id': a.lender_id, 'amount': float(a.amount),
+                 'bid_amount': float(a.bid_amount), 'interest_rate': float(a.interest_rate)}
+                for a in allocations
+            )
+            funded = new_funded
+            if fully_funded:
+                result['funded'] = True
+                break
+
+        if result['funded'] and reject:
+            self._reject_remaining(loan_id)
+
+        result['funded_amount'] = float(funded)
+        result['remaining'] = float(max(amount - funded, Decimal('0')))
+        return result
+
+    def _expire(self, loan_id, amount, reject=True):
+        """Close an auction that drew too little funding"""
+        result = {'loan_id': loan_id, 'amount': float(amount), 'allocations': [], 'funded': False,
+                  'funded_amount': 0.0, 'remaining': float(amount), 'expired': False}
+        if self.loan_model.expire_loan(loan_id):
+            result['expired'] = True
+            if reject:
+                self._reject_remaining(loan_id)
+        else:
+            self.order_books.close(loan_id)
+        return result
+
+    def _settle(self, lender_id, bid_id, filled, released, status, loan_id):
+        """Move a bid's reserved capital in the ledger and tell the bot manager"""
+        if status == 'accepted':
+            self.ledger.commit_capital(lender_id, filled, bid_id, loan_id, release=released)
+        else:
+            self.ledger.release_capital(lender_id, released, bid_id)
+        if self.on_settled:
+            self.on_settled(lender_id, bid_id, filled, released, status, loan_id)
+
+    def _reject_remaining(self, loan_id):
+        """Reject the bids left over once a loan is closed.
+
+        Read from the table rather than the order book, which may not yet
+        have the bids other workers placed in the last few seconds.
+        """
+        bids = [bid for bid in self.bid_model.get_bids_for_loan(loan_id) if bid.get('status') == 'pending']
+        self._reject_bids(loan_id, bids)
+
+    def _reject_bids(self, loan_id, bids):
+        for bid in bids:
+            # Conditional, so a bid accepted by a concurrent fill is never flipped to rejected
+            if self.bid_model.update_bid_status(bid['id'], 'rejected', expected_status='pending'):
+                self._settle(bid['lender_id'], bid['id'], 0, bid['amount'], 'rejected', loan_id)
+        self.order_books.close(loan_id)
+
+    def fill_loans(self, loan_ids):
+        """Batch fill; loans are independent so they run on a worker pool"""
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='loan-matcher') as executor:
+            results = list(executor.map(self._fill_safely, loan_ids))
+        return [result for result in results if result]
+
+    def close_loans(self, loans, rule='fill', min_fill_ratio=1):
+        """Batch close of expired auctions, given the loan items.
+
+        Losing bids of every closed loan are rejected afterwards from one
+        fresh read of the pending bids, not one scan per loan.
+        """
+        def close(loan):
+            try:
+                return self.close_loan(loan['id'], rule, min_fill_ratio, loan=loan, reject=False)
+            except Exception as e:
+                logger.error(f"Error closing loan {loan['id']}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='loan-closer') as executor:
+            results = list(executor.map(close, loans))
+
+        closed = [result['loan_id'] for result in results if result and (result['funded'] or result.get('expired'))]
+        if closed:
+            pending = self.bid_model.get_pending_bids_for_loans(closed)
+            for loan_id in closed:
+                try:
+                    self._reject_bids(loan_id, pending.get(loan_id, []))
+                except Exception as e:
+                    logger.error(f"Error rejecting bids of loan {loan_id}: {e}")
+        return results
+
+    def _fill_safely(self, loan_id):
+        try:
+            return self.fill_loan(loan_id)
+        except Exception as e:
+            logger.error(f"Error filling loan {loan_id}: {e}")
+            return None
@@ -0,0 +1,237 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+class SortedKeys:
+    """Sorted keys held as a list of chunks of at most 2 * load keys.
+
+    insort into one flat list shifts every later key, which is O(n) per add
+    on a deep book. Here add and remove bisect the chunk maxima and then a
+    single chunk, so they shift at most 2 * load keys, and a chunk that
+    grows past that is split in two. A split replaces the chunk with new
+    lists, so a reader holding the old chunk list still sees every key once.
+    """
+
+    def __init__(self, keys=(), load=512):
+        self.load = load
+        keys = sorted(keys)
+        self.chunks = [keys[i:i + load] for i in range(0, len(keys), load)]
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+        self.size = len(keys)
+
+    def add(self, key):
+        if not self.chunks:
+            self.chunks.append([key])
+            self.maxes.append(key)
+        else:
+            i = min(bisect_left(self.maxes, key), len(self.maxes) - 1)
+            chunk = self.chunks[i]
+            insort(chunk, key)
+            self.maxes[i] = chunk[-1]
+            if len(chunk) > 2 * self.load:
+                self.chunks[i:i + 1] = [chunk[:self.load], chunk[self.load:]]
+                self.maxes[i:i + 1] = [chunk[self.load - 1], chunk[-1]]
+        self.size += 1
+
+    def remove(self, key):
+        """Remove a key that is present"""
+        i = bisect_left(self.maxes, key)
+        chunk = self.chunks[i]
+        del chunk[bisect_left(chunk, key)]
+        self.size -= 1
+        if chunk:
+            self.maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i]
+            del self.maxes[i]
+
+    def first(self):
+        return self.chunks[0][0] if self.chunks else None
+
+    def head(self, limit=None):
+        """The first limit keys (all of them if limit is None) as a list"""
+        keys = []
+        for chunk in list(self.chunks):
+            if limit is not None and len(keys) >= limit:
+                break
+            keys.extend(chunk[:None if limit is None else limit - len(keys)])
+        return keys
+
+    def __len__(self):
+        return self.size
+
+class OrderBook:
+    """Bids on one loan kept sorted by (rate, created_at) with running totals.
+
+    Keys live in a SortedKeys, so adding or removing a bid costs a bisection
+    and a shift within one chunk. The best bid is the first key, and count,
+    total amount and the rate sums are adjusted on every add and remove, so
+    reading the aggregates never walks the bids.
+    """
+
+    def __init__(self, loan_id, bids=(), filled_lenders=()):
+        self.loan_id = loan_id
+        # Lenders whose bids on the loan were already accepted, e.g. by a partial fill
+        self.filled_lenders = set(filled_lenders)
+        # A later copy of a bid replaces an earlier one, as with add()
+        self.bids = {bid['id']: bid for bid in bids}
+        self.keys = SortedKeys(self._key(bid) for bid in self.bids.values())
+        self.total_amount = 0.0
+        self.rate_sum = 0.0
+        self.weighted_rate_sum = 0.0
+        self.loaded_at = time.time()
+        for bid in self.bids.values():
+            self._tally(bid, 1)
+
+    @staticmethod
+    def _key(bid):
+        return (float(bid['interest_rate']), bid.get('created_at', ''), bid['id'])
+
+    def _tally(self, bid, sign):
+        amount = float(bid['amount'])
+        rate = float(bid['interest_rate'])
+        self.total_amount += sign * amount
+        self.rate_sum += sign * rate
+        self.weighted_rate_sum += sign * amount * rate
+
+    def add(self, bid):
+        """Insert a bid, replacing any earlier copy of it"""
+        if bid['id'] in self.bids:
+            self.remove(bid['id'])
+        self.keys.add(self._key(bid))
+        self.bids[bid['id']] = bid
+        self._tally(bid, 1)
+
+    def remove(self, bid_id):
+        """Drop a bid; returns it, or None if it was not in the book"""
+        bid = self.bids.pop(bid_id, None)
+        if bid is None:
+            return None
+        self.keys.remove(self._key(bid))
+        self._tally(bid, -1)
+        if not self.keys:
+            # Clear float drift once the book empties
+            self.total_amount = self.rate_sum = self.weighted_rate_sum = 0.0
+        return bid
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, bid_id):
+        return bid_id in self.bids
+
+    def best(self):
+        """Lowest-rate bid, earliest first on ties"""
+        key = self.keys.first()
+        return self.bids[key[2]] if key else None
+
+    @property
+    def best_rate(self):
+        key = self.keys.first()
+        return key[0] if key else None
+
+    @property
+    def avg_rate(self):
+        return self.rate_sum / len(self.keys) if self.keys else None
+
+    @property
+    def weighted_avg_rate(self):
+        return self.weighted_rate_sum / self.total_amount if self.total_amount else None
+
+    def sorted_bids(self, limit=None):
+        """Bids in priority order"""
+        keys = self.keys.head(limit)
+        bids = self.bids
+        # Tolerate a concurrent remove between reading a key and its bid
+        return [bid for bid in (bids.get(key[2]) for key in keys) if bid is not None]
+
+    def lender_ids(self):
+        return {bid['lender_id'] for bid in self.bids.values()}
+
+    def summary(self):
+        """Aggregates for templates and the API"""
+        return {
+            'loan_id': self.loan_id,
+            'count': len(self.keys),
+            'best_rate': self.best_rate,
+            'avg_rate': self.avg_rate,
+            'weighted_avg_rate': self.weighted_avg_rate,
+            'total_amount': self.total_amount
+        }
+
+class OrderBookRegistry:
+    """Pending-bid order books for open loans.
+
+    Books are loaded from the bids table on first use and then kept in sync
+    by bid events from DynamoDBBid. Each book also remembers the lenders of
+    accepted bids, so a partly filled loan still counts them as bidders. A book older than max_age is reloaded so
+    bids written by other processes show up; max_books bounds memory by
+    evicting the least recently used book.
+    """
+
+    def __init__(self, loader, max_age=30, max_books=10000):
+        self.loader = loader
+        self.max_age = max_age
+        self.max_books = max_books
+        self.books = OrderedDict()
+        self.bid_loans = {}
+        self._lock = threading.RLock()
+
+    def get(self, loan_id):
+        """Order book of a loan's pending bids"""
+        with self._lock:
+            book = self.books.get(loan_id)
+            if book is not None and (not self.max_age or time.time() - book.loaded_at < self.max_age):
+                self.books.move_to_end(loan_id)
+                return book
+
+        return self._install(loan_id, self.loader(loan_id))
+
+    def preload(self, bids_by_loan):
+        """Install fresh books from bids fetched in bulk, e.g. one scan for many loans"""
+        for loan_id, bids in bids_by_loan.items():
+            self._install(loan_id, bids)
+
+    def _install(self, loan_id, bids):
+        filled = {bid['lender_id'] for bid in bids if bid.get('status') == 'accepted'}
+        bids = [bid for bid in bids if bid.get('status', 'pending') == 'pending']
+        book = OrderBook(loan_id, bids, filled)
+        with self._lock:
+            stale = self.books.pop(loan_id, None)
+            if stale is not None:
+                self._unindex(stale)
+            self.books[loan_id] = book
+            for bid in bids:
+                self.bid_loans[bid['id']] = loan_id
+            while len(self.books) > self.max_books:
+                _, evicted = self.books.popitem(last=False)
+                self._unindex(evicted)
+        return book
+
+    def _unindex(self, book):
+        """Forget which loan a dropped book's bids belong to; caller holds the lock"""
+        for bid_id in book.bids:
+            self.bid_loans.pop(bid_id, None)
+
+    def on_bid_event(self, event, bid):
+        """Listener for DynamoDBBid: 'created' with the new item, 'status' with id and status"""
+        with self._lock:
+            if event == 'created':
+                book = self.books.get(bid['loan_request_id'])
+                if book is not None and bid.get('status', 'pending') == 'pending':
+                    book.add(bid)
+                    self.bid_loans[bid['id']] = bid['loan_request_id']
+            elif event == 'status' and bid['status'] != 'pending':
+                loan_id = self.bid_loans.pop(bid['id'], None)
+                book = self.books.get(loan_id)
+                removed = book.remove(bid['id']) if book is not None else None
+                if removed is not None and bid['status'] == 'accepted':
+                    book.filled_lenders.add(removed['lender_id'])
+
+    def close(self, loan_id):
+        """Drop the book of a loan that is no longer open"""
+        with self._lock:
+            book = self.books.pop(loan_id, None)
+            if book is not None:
+                self._unindex(book)
@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import OrderedDict
+
+from amortization import amortize, to_lists
+from bot_lenders import credit_bucket
+
+BID_STATUSES = ('pending', 'accepted', 'rejected')
+
+# Labels for the bot pricing grid's credit buckets
+CREDIT_BANDS = ['<650', '650-699', '700-749', '750-799', '800+']
+
+EXPOSURE_DIMENSIONS = ('purpose', 'term', 'credit_band')
+
+def credit_band(credit_score):
+    return CREDIT_BANDS[credit_bucket(int(credit_score or 0))]
+
+def expected_interest(amount, rate, term_months):
+    """Interest earned if a position is repaid on schedule"""
+    if not term_months:
+        return 0.0
+    return to_lists(amortize([amount], [rate], [int(term_months)]))['total_interest'][0]
+
+class LenderPortfolio:
+    """One lender's bids with aggregates adjusted by deltas on every change.
+
+    Each position adds its amount and rate to the totals of its status,
+    and accepted positions also add to the exposure and expected-interest
+    totals. A status change subtracts the old contribution and adds the
+    new one, so summary() never walks the positions.
+    """
+
+    def __init__(self, lender_id):
+        self.lender_id = lender_id
+        self.positions = {}
+        self.counts = dict.fromkeys(BID_STATUSES, 0)
+        self.amounts = dict.fromkeys(BID_STATUSES, 0.0)
+        self.weighted_rates = dict.fromkeys(BID_STATUSES, 0.0)
+        self.exposure = {dimension: {} for dimension in EXPOSURE_DIMENSIONS}
+        self.expected_interest = 0.0
+        self.loaded_at = time.time()
+
+    def _apply(self, position, sign):
+        status = position['status']
+        if status not in self.counts:
+            return
+        amount = position['amount']
+        self.counts[status] += sign
+        self.amounts[status] += sign * amount
+        self.weighted_rates[status] += sign * amount * position['interest_rate']
+        if status == 'accepted':
+            for dimension in EXPOSURE_DIMENSIONS:
+                totals = self.exposure[dimension]
+                key = position[dimension]
+                totals[key] = totals.get(key, 0.0) + sign * amount
+                if abs(totals[key]) < 0.005:
+                    del totals[key]
+            self.expected_interest += sign * position['expected_interest']
+
+    def add(self, bid, loan_info):
+        """Track a bid; loan_info is (purpose, term_months, credit_band)"""
+        old = self.positions.get(bid['id'])
+        if old is not None:
+            self._apply(old, -1)
+        purpose, term, band = loan_info
+        position = {
+            'id': bid['id'],
+            'loan_request_id': bid['loan_request_id'],
+            'amount': float(bid.get('filled_amount') or bid['amount']),
+            'interest_rate': float(bid['interest_rate']),
+            'status': bid.get('status', 'pending'),
+            'created_at': bid.get('created_at', ''),
+            'purpose': purpose,
+            'term': term,
+            'credit_band': band,
+            'expected_interest': 0.0
+        }
+        if position['status'] == 'accepted':
+            position['expected_interest'] = expected_interest(position['amount'], position['interest_rate'], term)
+        self.positions[bid['id']] = position
+        self._apply(position, 1)
+
+    def set_status(self, bid_id, status, filled_amount=None):
+        """Move a position to a new status; False if the bid is not in this portfolio"""
+        position = self.positions.get(bid_id)
+        if position is None:
+            return False
+        self._apply(position, -1)
+        position['status'] = status
+        if filled_amount is not None:
+            position['amount'] = float(filled_amount)
+        if status == 'accepted':
+            position['expected_interest'] = expected_interest(position['amount'], position['interest_rate'],
+                                                              position['term'])
+        self._apply(position, 1)
+        return True
+
+    def recent(self, limit=5):
+        """Latest positions first"""
+        return sorted(self.positions.values(), key=lambda position: position['created_at'], reverse=True)[:limit]
+
+    def summary(self):
+        """Aggregates for the dashboard and the API"""
+        total_amount = sum(self.amounts.values())
+        invested = self.amounts['accepted']
+        decided = self.counts['accepted'] + self.counts['rejected']
+        return {
+            'lender_id': self.lender_id,
+            'total_bids': sum(self.counts.values()),
+            'counts': dict(self.counts),
+            'amounts': {status: round(amount, 2) for status, amount in self.amounts.items()},
+            'total_bid_amount': round(total_amount, 2),
+            'invested': round(invested, 2),
+            'avg_bid_rate': round(sum(self.weighted_rates.values()) / total_amount, 2) if total_amount > 0 else None,
+            'weighted_avg_rate': round(self.weighted_rates['accepted'] / invested, 2) if invested > 0 else None,
+            'expected_interest': round(self.expected_interest, 2),
+            'acceptance_ratio': round(self.counts['accepted'] / decided, 4) if decided else None,
+            'exposure': {
+                dimension: {str(key): round(amount, 2) for key, amount in sorted(totals.items())}
+                for dimension, totals in self.exposure.items()
+            }
+        }
+
+class PortfolioRegistry:
+    """Lender portfolios loaded on first use and then kept current by bid events.
+
+    Loading costs one bids read for the lender plus one batch read of the
+    loans involved; after that, bid events from DynamoDBBid adjust the
+    aggregates in place. As with the order books, a portfolio older than
+    max_age is reloaded to pick up bids written by other processes.
+    """
+
+    def __init__(self, bid_loader, loans_loader, user_loader, max_age=300, max_portfolios=10000,
+                 max_loans=50000):
+        self.bid_loader = bid_loader
+        self.loans_loader = loans_loader
+        self.user_loader = user_loader
+        self.max_age = max_age
+        self.max_portfolios = max_portfolios
+        self.max_loans = max_loans
+        self.portfolios = OrderedDict()
+        self.bid_lenders = {}
+        self.loan_info = OrderedDict()
+        self.credit_bands = {}
+        self._lock = threading.RLock()
+
+    def get(self, lender_id):
+        """A lender's portfolio"""
+        with self._lock:
+            portfolio = self.portfolios.get(lender_id)
+            if portfolio is not None and (not self.max_age or time.time() - portfolio.loaded_at < self.max_age):
+                self.portfolios.move_to_end(lender_id)
+                return portfolio
+
+        bids = self.bid_loader(lender_id)
+        self._load_loans({bid['loan_request_id'] for bid in bids})
+        portfolio = LenderPortfolio(lender_id)
+        for bid in bids:
+            portfolio.add(bid, self._info(bid['loan_request_id']))
+
+        with self._lock:
+            stale = self.portfolios.pop(lender_id, None)
+            if stale is not None:
+                self._unindex(stale)
+            self.portfolios[lender_id] = portfolio
+            for bid_id in portfolio.positions:
+                self.bid_lenders[bid_id] = lender_id
+            while len(self.portfolios) > self.max_portfolios:
+                _, evicted = self.portfolios.popitem(last=False)
+                self._unindex(evicted)
+        return portfolio
+
+    def _unindex(self, portfolio):
+        """Forget a dropped portfolio's bids; caller holds the lock"""
+        for bid_id in portfolio.positions:
+            self.bid_lenders.pop(bid_id, None)
+
+    def _load_loans(self, loan_ids):
+        """Cache purpose, term and borrower credit band for loans not seen yet"""
+        missing = [loan_id for loan_id in loan_ids if loan_id not in self.loan_info]
+        if not missing:
+            return
+        for loan_id, loan in self.loans_loader(missing).items():
+            borrower_id = loan.get('borrower_id')
+            if borrower_id not in self.credit_bands:
+                borrower = self.user_loader(borrower_id) or {}
+                self.credit_bands[borrower_id] = credit_band(borrower.get('credit_score', 0))
+            info = (loan.get('purpose', 'Other'), int(loan.get('term_months', 0)), self.credit_bands[borrower_id])
+            with self._lock:
+                self.loan_info[loan_id] = info
+                while len(self.loan_info) > self.max_loans:
+                    self.loan_info.popitem(last=False)
+
+    def _info(self, loan_id):
+        return self.loan_info.get(loan_id, ('Other', 0, CREDIT_BANDS[0]))
+
+    def on_bid_event(self, event, bid):
+        """Listener for DynamoDBBid; only portfolios already loaded are updated"""
+        if event == 'created':
+            if bid['lender_id'] not in self.portfolios:
+                return
+            self._load_loans([bid['loan_request_id']])
+            with self._lock:
+                portfolio = self.portfolios.get(bid['lender_id'])
+                if portfolio is not None:
+                    portfolio.add(bid, self._info(bid['loan_request_id']))
+                    self.bid_lenders[bid['id']] = bid['lender_id']
+        elif event == 'status':
+            with self._lock:
+                portfolio = self.portfolios.get(self.bid_lenders.get(bid['id']))
+                if portfolio is not None:
+                    portfolio.set_status(bid['id'], bid['status'], bid.get('filled_amount'))
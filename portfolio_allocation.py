@@ -0,0 +1,49 @@
+from collections import defaultdict, namedtuple
+
+# Expected annual loss (percentage points) per credit bucket, lowest bucket first.
+# Buckets match bot_lenders.credit_bucket.
+EXPECTED_LOSS_RATES = [6.0, 4.0, 2.5, 1.5, 0.8]
+
+Candidate = namedtuple('Candidate', ['loan_id', 'amount', 'rate', 'expected_yield', 'purpose', 'term_months'])
+
+def expected_yield(rate, credit_bucket):
+    """Net annual yield of a bid after expected credit losses"""
+    return rate - EXPECTED_LOSS_RATES[min(credit_bucket, len(EXPECTED_LOSS_RATES) - 1)]
+
+def allocate_capital(candidates, budget, max_purpose_share=0.4, max_term_share=0.6):
+    """Pick the set of loans to fund from a fixed budget.
+
+    Greedy by expected yield per dollar: every bid funds the whole loan, so the
+    yield is also the value density and highest-density-first is the classic
+    knapsack approximation. Purpose and term exposure are each capped at a
+    share of the budget so one bucket cannot absorb all the capital. Runs in
+    O(n log n) for n candidates.
+    """
+    budget = float(budget)
+    if budget <= 0:
+        return []
+
+    purpose_cap = budget * max_purpose_share
+    term_cap = budget * max_term_share
+    purpose_exposure = defaultdict(float)
+    term_exposure = defaultdict(float)
+
+    chosen = []
+    remaining = budget
+    for candidate in sorted(candidates, key=lambda c: (-c.expected_yield, c.amount)):
+        if candidate.expected_yield <= 0:
+            break  # Sorted, so nothing after this earns a positive return
+        amount = float(candidate.amount)
+        if amount > remaining:
+            continue
+        if purpose_exposure[candidate.purpose] + amount > purpose_cap:
+            continue
+        if term_exposure[candidate.term_months] + amount > term_cap:
+            continue
+
+        chosen.append(candidate)
+        remaining -= amount
+        purpose_exposure[candidate.purpose] += amount
+        term_exposure[candidate.term_months] += amount
+
+    return chosen
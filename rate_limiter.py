@@ -0,0 +1,172 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# DynamoDB error codes that mean the table is out of capacity
+THROTTLE_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded'
+}
+
+class TokenBucket:
+    """Blocking token bucket; rate is tokens per second"""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.waiting = 0
+        self.waits = 0
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate):
+        """Change the refill rate, keeping tokens earned so far"""
+        with self._condition:
+            self._refill()
+            self.rate = float(rate)
+            self._condition.notify_all()
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now"""
+        with self._condition:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until tokens are available; False if the timeout passes first"""
+        deadline = None if timeout is None else self.clock() + timeout
+        with self._condition:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+
+            self.waiting += 1
+            self.waits += 1
+            try:
+                while True:
+                    wait = (tokens - self.tokens) / self.rate if self.rate > 0 else 1.0
+                    if deadline is not None:
+                        remaining = deadline - self.clock()
+                        if remaining <= 0:
+                            return False
+                        wait = min(wait, remaining)
+                    self._condition.wait(wait)
+                    self._refill()
+                    if self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return True
+            finally:
+                self.waiting -= 1
+
+class AdaptiveRateLimiter:
+    """Separate read and write budgets that back off when DynamoDB throttles.
+
+    A throttle halves both rates (down to a floor); once no throttle has been
+    seen for recovery_interval seconds the rates climb back linearly to the
+    configured maximum.
+    """
+
+    def __init__(self, read_rate=20, write_rate=10, min_rate=1, recovery_interval=10,
+                 recovery_step=0.1, clock=time.monotonic):
+        self.max_read_rate = float(read_rate)
+        self.max_write_rate = float(write_rate)
+        self.min_rate = float(min_rate)
+        self.recovery_interval = recovery_interval
+        self.recovery_step = recovery_step
+        self.clock = clock
+        self.read_bucket = TokenBucket(read_rate, clock=clock)
+        self.write_bucket = TokenBucket(write_rate, clock=clock)
+        self.throttle_count = 0
+        self.last_throttle = None
+        self.last_adjust = clock()
+        self._lock = threading.Lock()
+
+    def acquire_read(self, tokens=1, timeout=None):
+        """Wait for read capacity"""
+        self._recover()
+        return self.read_bucket.acquire(tokens, timeout)
+
+    def acquire_write(self, tokens=1, timeout=None):
+        """Wait for write capacity"""
+        self._recover()
+        return self.write_bucket.acquire(tokens, timeout)
+
+    def on_throttle(self):
+        """Multiplicative decrease after DynamoDB reports a throttle"""
+        with self._lock:
+            self.throttle_count += 1
+            self.last_throttle = self.last_adjust = self.clock()
+            read_rate = max(self.min_rate, self.read_bucket.rate / 2)
+            write_rate = max(self.min_rate, self.write_bucket.rate / 2)
+        self.read_bucket.set_rate(read_rate)
+        self.write_bucket.set_rate(write_rate)
+        logger.warning("DynamoDB throttled; bot rates reduced to read=%.1f/s write=%.1f/s", read_rate, write_rate)
+
+    def _recover(self):
+        """Additive increase back toward the configured rates"""
+        now = self.clock()
+        with self._lock:
+            if self.last_throttle is None or now - self.last_throttle < self.recovery_interval:
+                return
+            elapsed = now - self.last_adjust
+            self.last_adjust = now
+            if elapsed <= 0:
+                return
+            read_rate = min(self.max_read_rate,
+                            self.read_bucket.rate + self.max_read_rate * self.recovery_step * elapsed)
+            write_rate = min(self.max_write_rate,
+                             self.write_bucket.rate + self.max_write_rate * self.recovery_step * elapsed)
+            if read_rate == self.max_read_rate and write_rate == self.max_write_rate:
+                self.last_throttle = None
+        self.read_bucket.set_rate(read_rate)
+        self.write_bucket.set_rate(write_rate)
+
+    def get_stats(self):
+        """Current budgets, queue depth and throttle counts"""
+        return {
+            'read_rate': self.read_bucket.rate,
+            'write_rate': self.write_bucket.rate,
+            'max_read_rate': self.max_read_rate,
+            'max_write_rate': self.max_write_rate,
+            'read_queue_depth': self.read_bucket.waiting,
+            'write_queue_depth': self.write_bucket.waiting,
+            'read_waits': self.read_bucket.waits,
+            'write_waits': self.write_bucket.waits,
+            'throttle_count': self.throttle_count,
+            'last_throttle': self.last_throttle
+        }
+
+def install_throttle_listener(client, limiter):
+    """Feed throttles seen by any call on a boto3 DynamoDB client into the limiter.
+
+    Hooks botocore's needs-retry event, so throttles that botocore retries
+    internally (and that the model layer would otherwise swallow) still
+    slow the bot engine down.
+    """
+    def on_needs_retry(response=None, **kwargs):
+        if not response:
+            return None
+        parsed = response[1] if isinstance(response, tuple) and len(response) > 1 else {}
+        code = (parsed or {}).get('Error', {}).get('Code')
+        if code in THROTTLE_ERROR_CODES:
+            limiter.on_throttle()
+        return None  # Leave the retry decision to botocore
+
+    # Replace any listener from an earlier limiter instead of stacking them
+    client.meta.events.unregister('needs-retry.dynamodb', unique_id='bot-rate-limiter')
+    client.meta.events.register('needs-retry.dynamodb', on_needs_retry, unique_id='bot-rate-limiter')
+    return on_needs_retry
@@ -88,6 +88,118 @@ def create_dynamodb_tables():
         else:
             print(f"Error creating Bids table: {e}")
     
+    # Bot capital ledger table
+    try:
+        ledger_table = dynamodb.create_table(
+            TableName='p2p-lending-bot-ledger',
+            KeySchema=[
+                {
+                    'AttributeName': 'id',
+                    'KeyType': 'HASH'
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': 'id',
+                    'AttributeType': 'S'
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        print("Creating Bot Ledger table...")
+        ledger_table.wait_until_exists()
+        print("Bot Ledger table created successfully!")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            print("Bot Ledger table already exists")
+        else:
+            print(f"Error creating Bot Ledger table: {e}")
+    
+    # Leader lease table
+    try:
+        leases_table = dynamodb.create_table(
+            TableName='p2p-lending-leases',
+            KeySchema=[
+                {
+                    'AttributeName': 'id',
+                    'KeyType': 'HASH'
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': 'id',
+                    'AttributeType': 'S'
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        print("Creating Leases table...")
+        leases_table.wait_until_exists()
+        print("Leases table created successfully!")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            print("Leases table already exists")
+        else:
+            print(f"Error creating Leases table: {e}")
+    
+    # Auto-invest rules table
+    try:
+        rules_table = dynamodb.create_table(
+            TableName='p2p-lending-auto-invest-rules',
+            KeySchema=[
+                {
+                    'AttributeName': 'id',
+                    'KeyType': 'HASH'
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': 'id',
+                    'AttributeType': 'S'
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        print("Creating Auto-Invest Rules table...")
+        rules_table.wait_until_exists()
+        print("Auto-Invest Rules table created successfully!")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            print("Auto-Invest Rules table already exists")
+        else:
+            print(f"Error creating Auto-Invest Rules table: {e}")
+    
+    # Idempotency keys table; DynamoDB's TTL sweeps expired keys
+    try:
+        keys_table = dynamodb.create_table(
+            TableName='p2p-lending-idempotency-keys',
+            KeySchema=[
+                {
+                    'AttributeName': 'id',
+                    'KeyType': 'HASH'
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': 'id',
+                    'AttributeType': 'S'
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        print("Creating Idempotency Keys table...")
+        keys_table.wait_until_exists()
+        dynamodb.meta.client.update_time_to_live(
+            TableName='p2p-lending-idempotency-keys',
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'expires_at'}
+        )
+        print("Idempotency Keys table created successfully!")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            print("Idempotency Keys table already exists")
+        else:
+            print(f"Error creating Idempotency Keys table: {e}")
+    
     print("All DynamoDB tables are ready!")
 
 if __name__ == '__main__':
@@ -335,10 +335,11 @@ class TestDynamoDBModels(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures"""
         try:
-            from dynamodb_models import DynamoDBUser, DynamoDBLoanRequest, DynamoDBBid
+            from dynamodb_models import DynamoDBUser, DynamoDBLoanRequest, DynamoDBBid, DynamoDBBotLedger
             self.DynamoDBUser = DynamoDBUser
             self.DynamoDBLoanRequest = DynamoDBLoanRequest
             self.DynamoDBBid = DynamoDBBid
+            self.DynamoDBBotLedger = DynamoDBBotLedger
         except ImportError:
             self.skipTest("DynamoDB models not available")
     
@@ -405,6 +406,151 @@ class TestDynamoDBModels(unittest.TestCase):
         
         self.assertIsNotNone(bid_id)
         mock_table.put_item.assert_called_once()
+    
+    @patch('dynamodb_models.dynamodb')
+    def test_bid_listeners_notified(self, mock_dynamodb):
+        """Test bid listeners see creations and status changes"""
+        mock_dynamodb.Table.return_value = Mock()
+        events = []
+        
+        bid_model = self.DynamoDBBid()
+        bid_model.add_listener(lambda event, bid: events.append((event, bid['id'], bid['status'])))
+        
+        bid_id = bid_model.create_bid('loan-123', 'lender-456', 15000, 5.5)
+        bid_model.update_bid_status(bid_id, 'accepted')
+        
+        self.assertEqual(events, [('created', bid_id, 'pending'), ('status', bid_id, 'accepted')])
+    
+    @patch('dynamodb_models.dynamodb')
+    def test_loan_listeners_notified(self, mock_dynamodb):
+        """Test loan listeners see creations, status changes and paginated scans return every page"""
+        mock_table = Mock()
+        mock_dynamodb.Table.return_value = mock_table
+        events = []
+        
+        loan_model = self.DynamoDBLoanRequest()
+        loan_model.add_listener(lambda event, loan: events.append((event, loan['id'], loan['status'])))
+        
+        loan_id = loan_model.create_loan_request('borrower-123', 25000, 'debt_consolidation', 36, 8.5)
+        loan_model.update_loan_status(loan_id, 'funded')
+        self.assertEqual(events, [('created', loan_id, 'open'), ('status', loan_id, 'funded')])
+        
+        mock_table.scan.side_effect = [
+            {'Items': [{'id': 'a'}], 'LastEvaluatedKey': {'id': 'a'}},
+            {'Items': [{'id': 'b'}]}
+        ]
+        self.assertEqual([loan['id'] for loan in loan_model.get_all_open_loans()], ['a', 'b'])
+        self.assertEqual(mock_table.scan.call_args.kwargs['ExclusiveStartKey'], {'id': 'a'})
+    
+    @patch('dynamodb_models.dynamodb')
+    def test_models_publish_typed_events(self, mock_dynamodb):
+        """Test loan and bid writes publish typed events on a shared bus"""
+        from dynamodb_models import EventBus, LoanCreated, LoanStatusChanged, BidCreated, BidStatusChanged
+        mock_table = Mock()
+        mock_table.update_item.return_value = {'Attributes': {'loan_request_id': 'loan-1'}}
+        mock_dynamodb.Table.return_value = mock_table
+        bus = EventBus()
+        events = []
+        bus.subscribe((LoanCreated, LoanStatusChanged, BidCreated, BidStatusChanged), events.append)
+        
+        loan_model = self.DynamoDBLoanRequest(bus)
+        bid_model = self.DynamoDBBid(loan_model)
+        loan_id = loan_model.create_loan_request('borrower-1', 1000, 'Auto', 12, 9.0)
+        bid_id = bid_model.create_bid(loan_id, 'lender-1', 500, 8.0)
+        bid_model.update_bid_status(bid_id, 'rejected')
+        loan_model.update_loan_status(loan_id, 'cancelled')
+        
+        self.assertEqual([type(event) for event in events], [LoanCreated, BidCreated, BidStatusChanged, LoanStatusChanged])
+        self.assertEqual(events[1].bid['amount'], Decimal('500'))
+        self.assertEqual(events[2], BidStatusChanged(bid_id, 'rejected', 'loan-1'))
+        self.assertEqual(mock_table.update_item.call_args_list[0].kwargs['ReturnValues'], 'ALL_NEW')
+    
+    @patch('dynamodb_models.dynamodb')
+    def test_idempotency_key_claim(self, mock_dynamodb):
+        """Test idempotency keys are claimed with one conditional put and replayed from a consistent read"""
+        from dynamodb_models import DynamoDBIdempotencyKey
+        mock_table = Mock()
+        mock_dynamodb.Table.return_value = mock_table
+        conflict = type('ConditionalCheckFailedException', (Exception,), {})
+        mock_dynamodb.meta.client.exceptions.ConditionalCheckFailedException = conflict
+        keys = DynamoDBIdempotencyKey()
+        
+        self.assertEqual(keys.claim('place_bid:u1:k', 'abc', 3600), (True, None))
+        put = mock_table.put_item.call_args.kwargs
+        self.assertIn('attribute_not_exists(id)', put['ConditionExpression'])
+        self.assertEqual(put['Item']['status'], 'pending')
+        self.assertIsInstance(put['Item']['expires_at'], int)
+        
+        mock_table.put_item.side_effect = conflict()
+        mock_table.get_item.return_value = {'Item': {'id': 'place_bid:u1:k', 'status': 'done', 'resource_id': 'bid-1'}}
+        claimed, earlier = keys.claim('place_bid:u1:k', 'abc', 3600)
+        self.assertFalse(claimed)
+        self.assertEqual(earlier['resource_id'], 'bid-1')
+        self.assertTrue(mock_table.get_item.call_args.kwargs['ConsistentRead'])
+        
+        mock_table.delete_item.side_effect = conflict()
+        self.assertFalse(keys.release('place_bid:u1:k'))  # Completed keys are kept
+    
+    @patch('dynamodb_models.time.sleep')
+    @patch('dynamodb_models.dynamodb')
+    def test_create_bids_batches_and_retries(self, mock_dynamodb, mock_sleep):
+        """Test bulk bids go out 25 per BatchWriteItem and unprocessed puts are resent"""
+        mock_dynamodb.Table.return_value = Mock()
+        calls = []
+        def batch_write_item(RequestItems):
+            puts = RequestItems['p2p-lending-bids']
+            calls.append(len(puts))
+            if len(calls) == 1:
+                return {'UnprocessedItems': {'p2p-lending-bids': puts[-3:]}}
+            if any(put['PutRequest']['Item']['loan_request_id'] == 'stuck' for put in puts):
+                return {'UnprocessedItems': {'p2p-lending-bids': puts}}
+            return {}
+        mock_dynamodb.batch_write_item.side_effect = batch_write_item
+        bid_model = self.DynamoDBBid()
+        created = []
+        bid_model.add_listener(lambda event, bid: created.append(bid['id']))
+        
+        bids = [{'loan_request_id': f'loan-{i}', 'amount': 100, 'interest_rate': 7.5} for i in range(60)]
+        bid_ids = bid_model.create_bids('lender-1', bids)
+        self.assertEqual(calls, [25, 3, 25, 10])
+        self.assertEqual(len(set(bid_ids)), 60)
+        self.assertEqual(created, bid_ids)
+        self.assertEqual(mock_sleep.call_count, 1)
+        
+        calls.clear()
+        bid_ids = bid_model.create_bids('lender-1', [{'loan_request_id': 'stuck', 'amount': 1, 'interest_rate': 1}],
+                                        max_attempts=3)
+        self.assertEqual(bid_ids, [None])
+        self.assertEqual(calls, [1, 1, 1])
+    
+    @patch('dynamodb_models.dynamodb')
+    def test_bot_ledger_reserve(self, mock_dynamodb):
+        """Test capital reservation is a single conditional ADD"""
+        mock_table = Mock()
+        mock_dynamodb.Table.return_value = mock_table
+        
+        ledger = self.DynamoDBBotLedger()
+        
+        self.assertTrue(ledger.reserve_capital('bot-1', 15000))
+        mock_table.get_item.assert_not_called()
+        kwargs = mock_table.update_item.call_args.kwargs
+        self.assertEqual(kwargs['UpdateExpression'], 'ADD available_capital :negative')
+        self.assertIn('available_capital >= :amount', kwargs['ConditionExpression'])
+        self.assertEqual(kwargs['ExpressionAttributeValues'][':negative'], Decimal('-15000'))
+    
+    @patch('dynamodb_models.dynamodb')
+    def test_bot_ledger_batch_read(self, mock_dynamodb):
+        """Test ledger accounts are loaded with batched reads"""
+        mock_dynamodb.batch_get_item.return_value = {
+            'Responses': {'p2p-lending-bot-ledger': [{'id': 'bot-1', 'available_capital': Decimal('10')}]},
+            'UnprocessedKeys': {}
+        }
+        
+        ledger = self.DynamoDBBotLedger()
+        accounts = ledger.get_accounts(['bot-1', 'bot-2'])
+        
+        self.assertEqual(list(accounts), ['bot-1'])
+        mock_dynamodb.batch_get_item.assert_called_once()
 
 
 class TestFlaskRoutes(unittest.TestCase):
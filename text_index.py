@@ -0,0 +1,234 @@
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+
+FORMAT_VERSION = 1
+
+TOKEN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i if in into is it its me my of on or our so
+that the their them they this to was we were will with you your
+""".split())
+
+# Longest description excerpt returned with results
+SUMMARY_LENGTH = 160
+
+def tokenize(text):
+    """Lowercased alphanumeric tokens without stopwords; underscores split words"""
+    return [token for token in TOKEN.findall((text or '').lower().replace('_', ' ')) if token not in STOPWORDS]
+
+class TextIndex:
+    """Inverted index with BM25 ranking over open loans' purpose and description.
+
+    Postings map each term to {loan_id: term frequency}; purpose terms
+    count purpose_weight times so a match on the purpose outranks a
+    passing mention. The vocabulary is kept sorted so the last query term
+    can match as a prefix. The index saves to a gzipped JSON snapshot and
+    sync() brings a loaded snapshot up to date from the open loans
+    without re-tokenizing the ones it already has.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, purpose_weight=2, max_expansions=50):
+        self.k1 = k1
+        self.b = b
+        self.purpose_weight = purpose_weight
+        self.max_expansions = max_expansions
+        self.postings = {}
+        self.doc_lengths = {}
+        self.docs = {}
+        self.vocabulary = []
+        self.total_length = 0
+        self.loaded_at = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def _term_counts(self, doc):
+        counts = Counter(tokenize(doc['description']))
+        for token in tokenize(doc['purpose']):
+            counts[token] += self.purpose_weight
+        return counts
+
+    def add(self, loan):
+        """Index one loan, replacing any earlier version of it"""
+        doc = {
+            'purpose': loan.get('purpose') or '',
+            'description': loan.get('description') or '',
+            'amount': float(loan.get('amount', 0)),
+            'term_months': int(loan.get('term_months', 0))
+        }
+        counts = self._term_counts(doc)
+        with self._lock:
+            if loan['id'] in self.doc_lengths:
+                self.remove(loan['id'])
+            self._insert(loan['id'], counts, doc)
+
+    def _insert(self, loan_id, counts, doc):
+        """Add postings for one document; caller holds the lock"""
+        for term, count in counts.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                insort(self.vocabulary, term)
+            postings[loan_id] = count
+        length = sum(counts.values())
+        self.doc_lengths[loan_id] = length
+        self.total_length += length
+        self.docs[loan_id] = doc
+
+    def remove(self, loan_id):
+        """Drop a loan; its terms come from re-tokenizing the stored text"""
+        with self._lock:
+            length = self.doc_lengths.pop(loan_id, None)
+            if length is None:
+                return
+            self.total_length -= length
+            for term in self._term_counts(self.docs.pop(loan_id)):
+                postings = self.postings[term]
+                del postings[loan_id]
+                if not postings:
+                    del self.postings[term]
+                    del self.vocabulary[bisect_left(self.vocabulary, term)]
+
+    def rebuild(self, loans):
+        """Index every open loan from scratch"""
+        with self._lock:
+            self.postings = {}
+            self.doc_lengths = {}
+            self.docs = {}
+            self.vocabulary = []
+            self.total_length = 0
+            for loan in loans:
+                if loan.get('status', 'open') == 'open':
+                    self.add(loan)
+            self.loaded_at = time.time()
+
+    def sync(self, loans):
+        """Match the index to the current open loans; returns (added, removed)"""
+        open_loans = {loan['id']: loan for loan in loans if loan.get('status', 'open') == 'open'}
+        with self._lock:
+            closed = [loan_id for loan_id in self.doc_lengths if loan_id not in open_loans]
+            for loan_id in closed:
+                self.remove(loan_id)
+            added = [loan for loan_id, loan in open_loans.items() if loan_id not in self.doc_lengths]
+            for loan in added:
+                self.add(loan)
+            self.loaded_at = time.time()
+        return len(added), len(closed)
+
+    def on_loan_event(self, event, loan):
+        """Listener for DynamoDBLoanRequest"""
+        if self.loaded_at is None:
+            return
+        if event == 'created' and loan.get('status', 'open') == 'open':
+            self.add(loan)
+        elif event == 'status' and loan['status'] != 'open':
+            self.remove(loan['id'])
+
+    def _expand(self, prefix):
+        """Vocabulary terms starting with prefix, up to max_expansions"""
+        start = bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:start + self.max_expansions]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query, limit=20, prefix=True):
+        """Loans ranked by BM25; with prefix, the last query term also matches as a prefix"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            count = len(self.doc_lengths)
+            if not count:
+                return []
+            average_length = self.total_length / count
+            scores = {}
+            for position, token in enumerate(tokens):
+                if prefix and position == len(tokens) - 1:
+                    terms = self._expand(token)
+                else:
+                    terms = [token] if token in self.postings else []
+                # A query term scores once per loan, through its best expansion
+                best = {}
+                for term in terms:
+                    postings = self.postings[term]
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for loan_id, frequency in postings.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[loan_id] / average_length)
+                        score = idf * frequency * (self.k1 + 1) / (frequency + norm)
+                        if score > best.get(loan_id, 0):
+                            best[loan_id] = score
+                for loan_id, score in best.items():
+                    scores[loan_id] = scores.get(loan_id, 0) + score
+
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+            return [self._result(loan_id, score) for loan_id, score in top]
+
+    def _result(self, loan_id, score):
+        doc = self.docs[loan_id]
+        return {
+            'id': loan_id,
+            'score': round(score, 4),
+            'purpose': doc['purpose'],
+            'summary': doc['description'][:SUMMARY_LENGTH],
+            'amount': doc['amount'],
+            'term_months': doc['term_months']
+        }
+
+    def save(self, path):
+        """Write a snapshot atomically, so a crash never leaves a half-written file"""
+        with self._lock:
+            snapshot = {
+                'version': FORMAT_VERSION,
+                'saved_at': time.time(),
+                'settings': {'k1': self.k1, 'b': self.b, 'purpose_weight': self.purpose_weight},
+                'docs': {loan_id: [self.doc_lengths[loan_id], doc] for loan_id, doc in self.docs.items()},
+                'postings': self.postings
+            }
+            data = json.dumps(snapshot, separators=(',', ':')).encode()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                # Fast compression: snapshots are rewritten often and read once
+                handle.write(gzip.compress(data, compresslevel=1))
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, max_age=None):
+        """Index from a snapshot; None if it is missing, unreadable, from another version or too old"""
+        try:
+            with open(path, 'rb') as handle:
+                snapshot = json.loads(gzip.decompress(handle.read()))
+        except (OSError, ValueError, EOFError):
+            return None
+        if snapshot.get('version') != FORMAT_VERSION:
+            return None
+        if max_age is not None and time.time() - snapshot.get('saved_at', 0) > max_age:
+            return None
+
+        index = cls(**snapshot['settings'])
+        index.postings = snapshot['postings']
+        index.vocabulary = sorted(index.postings)
+        for loan_id, (length, doc) in snapshot['docs'].items():
+            index.doc_lengths[loan_id] = length
+            index.docs[loan_id] = doc
+            index.total_length += length
+        index.loaded_at = snapshot['saved_at']
+        return index
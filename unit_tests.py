@@ -9,6 +9,9 @@ import sys
 import os
 from decimal import Decimal
 from datetime import datetime, timedelta
+from time import time_ns
+from collections import deque
+from unittest.mock import Mock, patch
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -229,6 +232,2647 @@ class TestBotLenderLogic(unittest.TestCase):
         self.assertFalse(self.conservative_bot.should_bid_on_loan(large_loan, borrower))
 
 
+class TestRateTableUnit(unittest.TestCase):
+    """Unit tests for the precomputed bot pricing grid"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            import bot_lenders
+            self.bot_lenders = bot_lenders
+        except ImportError:
+            self.skipTest("Bot lenders module not available")
+        
+        self.bot = bot_lenders.BotLender(
+            bot_id='test-rates',
+            name='Rate Test Bot',
+            strategy='aggressive',
+            capital=100000
+        )
+    
+    def test_bucket_boundaries(self):
+        """Test inputs map to the same buckets as the original thresholds"""
+        self.assertEqual(self.bot_lenders.credit_bucket(649), 0)
+        self.assertEqual(self.bot_lenders.credit_bucket(650), 1)
+        self.assertEqual(self.bot_lenders.credit_bucket(800), 4)
+        self.assertEqual(self.bot_lenders.amount_bucket(10000), 0)
+        self.assertEqual(self.bot_lenders.amount_bucket(25000), 1)
+        self.assertEqual(self.bot_lenders.amount_bucket(25001), 2)
+        self.assertEqual(self.bot_lenders.term_bucket(24), 0)
+        self.assertEqual(self.bot_lenders.term_bucket(48), 1)
+        self.assertEqual(self.bot_lenders.term_bucket(60), 2)
+    
+    def test_table_lookup_matches_adjustments(self):
+        """Test table pricing equals base rate plus all adjustments"""
+        loan = {'id': 'rate-loan', 'amount': 30000, 'term_months': 60, 'max_interest_rate': 20.0}
+        borrower = {'credit_score': 660}
+        
+        with patch('bot_lenders.random.uniform', return_value=0.0):
+            rate = self.bot.calculate_interest_rate(loan, borrower)
+        
+        # 5.0 base + 1.0 credit + 0.5 amount + 0.5 term + 1.0 aggressive
+        self.assertEqual(rate, 8.0)
+        self.assertEqual(len(self.bot.rate_table), 5 * 3 * 3)
+    
+    def test_override_and_reset(self):
+        """Test admins can override a grid cell and restore defaults"""
+        loan = {'id': 'rate-loan', 'amount': 5000, 'term_months': 12, 'max_interest_rate': 20.0}
+        borrower = {'credit_score': 820}
+        
+        self.assertTrue(self.bot.set_rate_override(4, 0, 0, 9.5))
+        self.assertFalse(self.bot.set_rate_override(9, 0, 0, 9.5))
+        for rate in (float('nan'), float('inf'), 0, -2.0, 36.5):
+            self.assertFalse(self.bot.set_rate_override(4, 0, 0, rate))
+        self.assertEqual(self.bot.rate_overrides, {'4:0:0': 9.5})
+        
+        with patch('bot_lenders.random.uniform', return_value=0.0):
+            self.assertEqual(self.bot.calculate_interest_rate(loan, borrower), 9.5)
+            self.bot.reset_rate_table()
+            self.assertEqual(self.bot.calculate_interest_rate(loan, borrower), 4.5)
+        
+        rows = self.bot.get_rate_table()
+        self.assertEqual(len(rows), len(self.bot.rate_table))
+        self.assertEqual(rows[0]['strategy'], 'aggressive')
+
+
+class TestConcurrentBiddingUnit(unittest.TestCase):
+    """Unit tests for thread-pool bid placement"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from bot_lenders import BotLender, BotLenderManager
+            self.BotLender = BotLender
+            self.BotLenderManager = BotLenderManager
+        except ImportError:
+            self.skipTest("Bot lenders module not available")
+        
+        self.loan = {
+            'id': 'concurrent-loan',
+            'borrower_id': 'borrower-1',
+            'amount': 10000,
+            'term_months': 36,
+            'max_interest_rate': 15.0,
+            'purpose': 'debt_consolidation'
+        }
+        self.borrower = {'credit_score': 800, 'annual_income': 200000}
+    
+    @patch('bot_lenders.bid_model')
+    def test_capital_never_overspent(self, mock_bid_model):
+        """Test concurrent bids cannot reserve more capital than the bot has"""
+        import threading
+        mock_bid_model.create_bid.side_effect = lambda **kwargs: f"bid-{threading.get_ident()}-{time_ns()}"
+        bot = self.BotLender('bot-1', 'Concurrent Bot', 'aggressive', 50000)
+        
+        threads = [threading.Thread(target=bot.place_bid, args=(self.loan, self.borrower)) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(bot.active_bids), 5)
+        self.assertEqual(bot.available_capital, Decimal('0'))
+    
+    @patch('bot_lenders.bid_model')
+    def test_failed_bid_releases_capital(self, mock_bid_model):
+        """Test capital reserved for a failed bid is returned"""
+        mock_bid_model.create_bid.side_effect = Exception('write failed')
+        bot = self.BotLender('bot-1', 'Concurrent Bot', 'aggressive', 50000)
+        
+        self.assertIsNone(bot.place_bid(self.loan, self.borrower))
+        self.assertEqual(bot.available_capital, Decimal('50000'))
+    
+    @patch('bot_lenders.time.sleep')
+    @patch('bot_lenders.user_model')
+    @patch('bot_lenders.loan_model')
+    @patch('bot_lenders.bid_model')
+    def test_bot_bid_cap_per_loan(self, mock_bid_model, mock_loan_model, mock_user_model, mock_sleep):
+        """Test the worker pool respects the three bot bids per loan cap"""
+        manager = self.BotLenderManager(max_workers=4)
+        manager.bots = [self.BotLender(f'bot-{i}', f'Bot {i}', 'aggressive', 1000000) for i in range(5)]
+        
+        mock_loan_model.get_all_open_loans.return_value = [dict(self.loan, id=f'loan-{i}') for i in range(8)]
+        mock_user_model.get_user_by_id.return_value = self.borrower
+        mock_bid_model.get_bids_for_loan.return_value = [
+            {'lender_id': 'bot-0'}, {'lender_id': 'bot-1'}
+        ]
+        mock_bid_model.create_bid.return_value = 'bid-id'
+        
+        with patch('bot_lenders.random.choices', return_value=[2]):
+            manager._process_new_loans()
+        
+        # Two bot bids already exist on every loan, so only one more is allowed
+        self.assertEqual(mock_bid_model.create_bid.call_count, 8)
+        bidders = {call.kwargs['lender_id'] for call in mock_bid_model.create_bid.call_args_list}
+        self.assertFalse(bidders & {'bot-0', 'bot-1'})
+        self.assertEqual(len(manager._loan_locks), 8)
+        
+        # Locks of loans that left the open set are dropped on the next tick
+        mock_loan_model.get_all_open_loans.return_value = [dict(self.loan, id='loan-7')]
+        with patch('bot_lenders.random.choices', return_value=[0]):
+            manager._process_new_loans()
+        self.assertEqual(set(manager._loan_locks), {'loan-7'})
+        mock_loan_model.get_all_open_loans.return_value = []
+        manager._process_new_loans()
+        self.assertEqual(manager._loan_locks, {})
+    
+    @patch('bot_lenders.time.sleep')
+    @patch('bot_lenders.user_model')
+    @patch('bot_lenders.loan_model')
+    @patch('bot_lenders.bid_model')
+    def test_partial_fill_keeps_bot_counted(self, mock_bid_model, mock_loan_model, mock_user_model, mock_sleep):
+        """Test a bot whose bid was accepted by a partial fill neither rebids nor frees a slot"""
+        from order_book import OrderBookRegistry
+        bids = [{'id': f'bid-{i}', 'loan_request_id': self.loan['id'], 'lender_id': f'bot-{i}',
+                 'interest_rate': Decimal('7.0'), 'amount': Decimal('1000'), 'status': 'pending'}
+                for i in range(2)]
+        registry = OrderBookRegistry(lambda loan_id: [dict(bid) for bid in bids], max_age=0)
+        manager = self.BotLenderManager(max_workers=2, order_books=registry)
+        manager.bots = [self.BotLender(f'bot-{i}', f'Bot {i}', 'aggressive', 1000000) for i in range(5)]
+        mock_loan_model.get_all_open_loans.return_value = [dict(self.loan, funded_amount=Decimal('1000'))]
+        mock_user_model.get_user_by_id.return_value = self.borrower
+        mock_bid_model.create_bid.return_value = 'bid-new'
+        
+        # bot-0's bid is filled; the loan stays open with one bot bid pending
+        registry.get(self.loan['id'])
+        bids[0]['status'] = 'accepted'
+        registry.on_bid_event('status', {'id': 'bid-0', 'status': 'accepted', 'loan_request_id': self.loan['id']})
+        
+        with patch('bot_lenders.random.choices', return_value=[2]):
+            manager._process_new_loans()
+        
+        # Two bots still hold the loan, so only one more may bid, and never bot-0 or bot-1
+        self.assertEqual(mock_bid_model.create_bid.call_count, 1)
+        self.assertNotIn(mock_bid_model.create_bid.call_args.kwargs['lender_id'], {'bot-0', 'bot-1'})
+        
+        # A book reloaded from the table keeps counting the accepted bid
+        registry.close(self.loan['id'])
+        self.assertEqual(registry.get(self.loan['id']).filled_lenders, {'bot-0'})
+
+
+class FakeBotLedger:
+    """In-memory stand-in for DynamoDBBotLedger"""
+    
+    def __init__(self, accounts=None):
+        self.accounts = accounts or {}
+    
+    def open_account(self, bot_id, capital):
+        self.accounts[bot_id] = {'id': bot_id, 'capital': Decimal(str(capital)),
+                                 'available_capital': Decimal(str(capital))}
+        return self.accounts[bot_id]
+    
+    def get_accounts(self, bot_ids):
+        return {bot_id: dict(self.accounts[bot_id]) for bot_id in bot_ids if bot_id in self.accounts}
+    
+    def reserve_capital(self, bot_id, amount):
+        account = self.accounts[bot_id]
+        if account['available_capital'] < Decimal(str(amount)):
+            return False
+        account['available_capital'] -= Decimal(str(amount))
+        return True
+    
+    def record_bid(self, bot_id, bid_id):
+        self.accounts[bot_id].setdefault('active_bids', set()).add(bid_id)
+        return True
+    
+    def release_capital(self, bot_id, amount, bid_id=None):
+        self.accounts[bot_id]['available_capital'] += Decimal(str(amount))
+        return True
+    
+    def set_rate_overrides(self, bot_id, overrides):
+        self.accounts[bot_id]['rate_overrides'] = {key: Decimal(str(rate)) for key, rate in overrides.items()}
+        return True
+
+
+class TestBotLedgerUnit(unittest.TestCase):
+    """Unit tests for ledger-backed bot capital"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from bot_lenders import BotLender, BotLenderManager
+            self.BotLender = BotLender
+            self.BotLenderManager = BotLenderManager
+        except ImportError:
+            self.skipTest("Bot lenders module not available")
+        
+        self.loan = {
+            'id': 'ledger-loan',
+            'amount': 20000,
+            'term_months': 36,
+            'max_interest_rate': 15.0,
+            'purpose': 'debt_consolidation'
+        }
+        self.borrower = {'credit_score': 800, 'annual_income': 200000}
+    
+    @patch('bot_lenders.bid_model')
+    def test_reservation_goes_through_ledger(self, mock_bid_model):
+        """Test a bid only succeeds when the ledger grants the capital"""
+        mock_bid_model.create_bid.return_value = 'bid-1'
+        ledger = FakeBotLedger({'bot-1': {'id': 'bot-1', 'capital': Decimal('100000'),
+                                          'available_capital': Decimal('30000')}})
+        bot = self.BotLender('bot-1', 'Ledger Bot', 'aggressive', 100000, ledger=ledger)
+        
+        # In-memory capital says yes, but the persisted ledger only has room for one bid
+        self.assertEqual(bot.place_bid(self.loan, self.borrower), 'bid-1')
+        self.assertIsNone(bot.place_bid(self.loan, self.borrower))
+        self.assertEqual(ledger.accounts['bot-1']['available_capital'], Decimal('10000'))
+        self.assertEqual(ledger.accounts['bot-1']['active_bids'], {'bid-1'})
+    
+    def test_manager_rehydrates_from_ledger(self):
+        """Test bots pick up persisted capital state on load"""
+        ledger = FakeBotLedger({'bot-1': {'id': 'bot-1', 'capital': Decimal('100000'),
+                                          'available_capital': Decimal('40000'),
+                                          'active_bids': {'bid-1', 'bid-2'},
+                                          'funded_loans': {'loan-9'}}})
+        manager = self.BotLenderManager(ledger=ledger)
+        manager.bots = [
+            self.BotLender('bot-1', 'Known Bot', 'balanced', 100000, ledger=ledger),
+            self.BotLender('bot-2', 'New Bot', 'balanced', 50000, ledger=ledger)
+        ]
+        
+        manager.load_ledger(open_missing=True)
+        
+        self.assertEqual(manager.bots[0].available_capital, Decimal('40000'))
+        self.assertEqual(len(manager.bots[0].active_bids), 2)
+        self.assertEqual(manager.bots[0].funded_loans, ['loan-9'])
+        self.assertIn('bot-2', ledger.accounts)
+        self.assertEqual(manager.bots[1].available_capital, Decimal('50000'))
+    
+    def test_workers_share_one_set_of_bot_users(self):
+        """Test workers seeding bots at the same time converge on one user and ledger account per bot"""
+        import threading
+        users = {}
+        lock = threading.Lock()
+        def create_user(user_id=None, **fields):
+            with lock:
+                if user_id in users:
+                    return None
+                users[user_id] = dict(fields, id=user_id)
+                return user_id
+        user_model = Mock()
+        user_model.get_user_by_id.side_effect = lambda user_id: users.get(user_id)
+        user_model.get_user_by_email.return_value = None
+        user_model.create_user.side_effect = create_user
+        ledger = FakeBotLedger()
+        
+        managers = [self.BotLenderManager(ledger=ledger) for _ in range(4)]
+        with patch('bot_lenders.user_model', user_model):
+            threads = [threading.Thread(target=manager.create_bot_lenders) for manager in managers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        bot_ids = [sorted(bot.bot_id for bot in manager.bots) for manager in managers]
+        self.assertEqual(len(users), len(bot_ids[0]))
+        self.assertTrue(all(ids == bot_ids[0] for ids in bot_ids))
+        self.assertEqual(set(ledger.accounts), set(users))
+    
+    def test_followers_follow_the_ledger(self):
+        """Test rate overrides made on any worker reach the leader, and followers refresh their stats"""
+        import threading
+        import time
+        ledger = FakeBotLedger({'bot-1': {'id': 'bot-1', 'capital': Decimal('100000'),
+                                          'available_capital': Decimal('100000')}})
+        leader = self.BotLenderManager(ledger=ledger)
+        leader.bots = [self.BotLender('bot-1', 'Bot', 'balanced', 100000, ledger=ledger)]
+        follower = self.BotLenderManager(ledger=ledger, leader=Mock(is_leader=False, heartbeat_interval=0.01))
+        follower.bots = [self.BotLender('bot-1', 'Bot', 'balanced', 100000, ledger=ledger)]
+        
+        self.assertTrue(follower.set_rate_override('bot-1', 4, 0, 0, 9.5))
+        leader.load_ledger()
+        self.assertEqual(leader.bots[0].rate_table[(4, 0, 0, 'balanced')], 9.5)
+        follower.reset_rate_table('bot-1')
+        leader.load_ledger()
+        self.assertEqual(leader.bots[0].rate_overrides, {})
+        
+        # A failed ledger write leaves the grid as it was instead of diverging from the ledger
+        from bot_lenders import LedgerWriteFailed
+        follower.set_rate_override('bot-1', 4, 0, 0, 9.5)
+        bot = follower.bots[0]
+        table = dict(bot.rate_table)
+        with patch.object(ledger, 'set_rate_overrides', return_value=False):
+            with self.assertRaises(LedgerWriteFailed):
+                follower.set_rate_override('bot-1', 3, 0, 0, 8.0)
+            with self.assertRaises(LedgerWriteFailed):
+                follower.reset_rate_table('bot-1')
+        self.assertEqual(bot.rate_table, table)
+        self.assertEqual(bot.rate_overrides, {'4:0:0': 9.5})
+        follower.reset_rate_table('bot-1')
+        
+        # The leader spends capital; the follower's bidding loop picks it up without bidding itself
+        ledger.accounts['bot-1']['available_capital'] = Decimal('60000')
+        follower.running = True
+        thread = threading.Thread(target=follower._bidding_loop, args=(0.01,))
+        with patch.object(follower, '_process_new_loans') as process:
+            thread.start()
+            time.sleep(0.1)
+            follower.running = False
+            thread.join()
+        process.assert_not_called()
+        self.assertEqual(follower.get_bot_stats()['available_capital'], 60000)
+
+
+class TestLeaderElectionUnit(unittest.TestCase):
+    """Unit tests for single-leader bot scheduling"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from leader_election import FileLease, LeaderElector
+            from bot_lenders import BotLenderManager
+            self.FileLease = FileLease
+            self.LeaderElector = LeaderElector
+            self.BotLenderManager = BotLenderManager
+        except ImportError:
+            self.skipTest("Leader election module not available")
+        
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.lock_path = os.path.join(self.tmpdir.name, 'leader.lock')
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_only_one_file_lease_holder(self):
+        """Test exactly one worker holds the lock and the other fails over"""
+        first = self.LeaderElector(self.FileLease(self.lock_path, owner='worker-1'))
+        second = self.LeaderElector(self.FileLease(self.lock_path, owner='worker-2'))
+        
+        self.assertTrue(first.heartbeat())
+        self.assertFalse(second.heartbeat())
+        self.assertEqual(second.describe()['leader'], 'worker-1')
+        
+        first.stop()
+        self.assertTrue(second.heartbeat())
+        self.assertEqual(first.describe()['leader'], 'worker-2')
+        second.stop()
+    
+    @patch('bot_lenders.user_model')
+    def test_follower_does_not_bid(self, mock_user_model):
+        """Test a worker without the lease skips loan processing"""
+        holder = self.FileLease(self.lock_path, owner='worker-1')
+        holder.acquire()
+        
+        follower = self.LeaderElector(self.FileLease(self.lock_path, owner='worker-2'))
+        follower.heartbeat()
+        manager = self.BotLenderManager(leader=follower)
+        
+        self.assertFalse(manager.is_leader())
+        manager._process_loan({'id': 'loan-1', 'borrower_id': 'b-1'}, [])
+        mock_user_model.get_user_by_id.assert_not_called()
+        self.assertEqual(manager.get_bot_stats()['leader']['worker_id'], 'worker-2')
+        holder.release()
+
+
+class TestPortfolioAllocationUnit(unittest.TestCase):
+    """Unit tests for the per-tick capital allocator"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from portfolio_allocation import Candidate, allocate_capital
+            from bot_lenders import BotLender, BotLenderManager
+            self.Candidate = Candidate
+            self.allocate_capital = allocate_capital
+            self.BotLender = BotLender
+            self.BotLenderManager = BotLenderManager
+        except ImportError:
+            self.skipTest("Portfolio allocation module not available")
+    
+    def test_highest_yield_first_within_budget(self):
+        """Test the allocator funds the best yields that fit the budget"""
+        candidates = [
+            self.Candidate('low', 10000, 6.0, 2.0, 'auto', 36),
+            self.Candidate('high', 10000, 9.0, 5.0, 'medical', 24),
+            self.Candidate('mid', 10000, 8.0, 4.0, 'home_improvement', 48),
+            self.Candidate('loss', 5000, 4.0, -1.0, 'auto', 12)
+        ]
+        
+        chosen = self.allocate_capital(candidates, 20000, max_purpose_share=1.0, max_term_share=1.0)
+        
+        self.assertEqual([c.loan_id for c in chosen], ['high', 'mid'])
+    
+    def test_diversification_caps(self):
+        """Test purpose and term exposure stay under their caps"""
+        candidates = [self.Candidate(f'loan-{i}', 10000, 9.0, 5.0 - i * 0.1, 'auto', 36) for i in range(10)]
+        candidates.append(self.Candidate('other', 10000, 7.0, 3.0, 'medical', 24))
+        
+        chosen = self.allocate_capital(candidates, 100000, max_purpose_share=0.4, max_term_share=0.5)
+        
+        auto_exposure = sum(c.amount for c in chosen if c.purpose == 'auto')
+        self.assertLessEqual(auto_exposure, 40000)
+        self.assertIn('other', [c.loan_id for c in chosen])
+    
+    def test_thousands_of_candidates(self):
+        """Test the allocator handles a large tick quickly"""
+        import random as rng
+        import time as clock
+        candidates = [
+            self.Candidate(f'loan-{i}', rng.randint(1, 50) * 1000, 8.0, rng.uniform(-1, 6),
+                           rng.choice(['auto', 'medical', 'education']), rng.choice([12, 24, 36, 48, 60]))
+            for i in range(5000)
+        ]
+        
+        start = clock.perf_counter()
+        chosen = self.allocate_capital(candidates, 500000)
+        elapsed = clock.perf_counter() - start
+        
+        self.assertLessEqual(sum(c.amount for c in chosen), 500000)
+        self.assertLess(elapsed, 0.5)
+    
+    @patch('bot_lenders.user_model')
+    @patch('bot_lenders.loan_model')
+    @patch('bot_lenders.bid_model')
+    def test_portfolio_mode_places_allocated_bids(self, mock_bid_model, mock_loan_model, mock_user_model):
+        """Test portfolio mode bids on the allocated set without random sampling"""
+        manager = self.BotLenderManager(allocation_mode='portfolio')
+        manager.bots = [self.BotLender('bot-1', 'Portfolio Bot', 'aggressive', 30000)]
+        
+        mock_loan_model.get_all_open_loans.return_value = [
+            {'id': f'loan-{i}', 'borrower_id': 'b-1', 'amount': 10000, 'term_months': term,
+             'max_interest_rate': 15.0, 'purpose': purpose}
+            for i, (purpose, term) in enumerate([('auto', 24), ('medical', 36), ('education', 48), ('travel', 36)])
+        ]
+        mock_user_model.get_user_by_id.return_value = {'credit_score': 720, 'annual_income': 100000}
+        mock_bid_model.get_bids_for_loan.return_value = []
+        mock_bid_model.create_bid.return_value = 'bid-id'
+        
+        with patch('bot_lenders.random.sample') as mock_sample:
+            manager._process_new_loans()
+            mock_sample.assert_not_called()
+        
+        self.assertEqual(mock_bid_model.create_bid.call_count, 3)
+        self.assertEqual(manager.bots[0].available_capital, Decimal('0'))
+
+
+class TestBacktestUnit(unittest.TestCase):
+    """Unit tests for the strategy backtesting harness"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            import backtest
+            self.backtest = backtest
+        except ImportError:
+            self.skipTest("Backtest module not available")
+        
+        self.config = {'name': 'bt-aggressive', 'strategy': 'aggressive', 'capital': 250000}
+    
+    def test_seeded_runs_are_reproducible(self):
+        """Test the same seed replays to identical metrics"""
+        first = self.backtest.run_backtest(self.config, num_loans=3000, seed=7, loans_per_month=100)
+        second = self.backtest.run_backtest(self.config, num_loans=3000, seed=7, loans_per_month=100)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(first['loans_seen'], 3000)
+        self.assertGreater(first['bids'], 0)
+        self.assertLessEqual(first['accepted'], first['bids'])
+        self.assertLessEqual(first['capital_utilization'], 100)
+    
+    def test_parallel_sweep_matches_serial(self):
+        """Test a process pool sweep reports the same results as a serial one"""
+        configs = self.backtest.parameter_grid(self.config, min_credit_score=[650, 750])
+        self.assertEqual(len(configs), 2)
+        
+        serial = self.backtest.run_sweep(configs, processes=1, num_loans=1000, seed=3)
+        parallel = self.backtest.run_sweep(configs, processes=2, num_loans=1000, seed=3)
+        
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial[1]['config']['min_credit_score'], 750)
+
+
+class TestDecisionLogUnit(unittest.TestCase):
+    """Unit tests for sampled structured bot decision logging"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from bot_decisions import DecisionLog
+            from bot_lenders import BotLender
+            self.DecisionLog = DecisionLog
+            self.BotLender = BotLender
+        except ImportError:
+            self.skipTest("Bot decisions module not available")
+        
+        self.loan = {'id': 'log-loan', 'amount': 15000, 'term_months': 36,
+                     'max_interest_rate': 12.0, 'purpose': 'debt_consolidation'}
+    
+    def test_rejections_are_counted_not_logged(self):
+        """Test unsampled rejections only bump per-reason counters"""
+        log = self.DecisionLog(sample_rate=0.0)
+        bot = self.BotLender('bot-1', 'Strict Bot', 'balanced', 100000, min_credit_score=750)
+        
+        with patch('bot_lenders.decision_log', log), patch('bot_decisions.logger') as mock_logger:
+            for _ in range(5):
+                bot.should_bid_on_loan(self.loan, {'credit_score': 700, 'annual_income': 90000})
+            mock_logger.info.assert_not_called()
+        
+        self.assertEqual(log.summary()['window'], {'Strict Bot': {'credit_score': 5}})
+    
+    def test_summary_resets_window_and_keeps_totals(self):
+        """Test the periodic summary replaces per-loan lines"""
+        log = self.DecisionLog(summary_interval=3600)
+        log.record('Bot A', 'loan-1', 'term')
+        log.record('Bot A', 'loan-2', 'term')
+        
+        self.assertIsNone(log.maybe_log_summary())
+        with patch('bot_decisions.logger') as mock_logger:
+            self.assertEqual(log.maybe_log_summary(force=True), {'Bot A': {'term': 2}})
+            self.assertEqual(mock_logger.info.call_count, 1)
+        
+        summary = log.summary()
+        self.assertEqual(summary['window'], {})
+        self.assertEqual(summary['totals'], {'Bot A': {'term': 2}})
+    
+    def test_trace_single_loan(self):
+        """Test full events are kept only for traced loans"""
+        log = self.DecisionLog()
+        log.start_trace('loan-1')
+        log.record('Bot A', 'loan-1', 'credit_score', credit_score=640, minimum=700)
+        log.record('Bot A', 'loan-2', 'credit_score', credit_score=640, minimum=700)
+        
+        trace = log.get_trace('loan-1')
+        self.assertEqual(len(trace), 1)
+        self.assertEqual(trace[0]['credit_score'], 640)
+        self.assertEqual(log.get_trace('loan-2'), [])
+
+
+class TestIncrementalStatsUnit(unittest.TestCase):
+    """Unit tests for incrementally maintained bot statistics"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from bot_lenders import BotLender, BotLenderManager
+            from bot_stats import RollingCounter
+            self.BotLender = BotLender
+            self.BotLenderManager = BotLenderManager
+            self.RollingCounter = RollingCounter
+        except ImportError:
+            self.skipTest("Bot stats module not available")
+        
+        self.manager = self.BotLenderManager()
+        self.manager.bots = [
+            self.BotLender('bot-1', 'Stats Bot 1', 'aggressive', 100000),
+            self.BotLender('bot-2', 'Stats Bot 2', 'balanced', 50000)
+        ]
+        self.loan = {'id': 'stats-loan', 'amount': 20000, 'term_months': 36,
+                     'max_interest_rate': 15.0, 'purpose': 'auto'}
+        self.borrower = {'credit_score': 800, 'annual_income': 200000}
+    
+    @patch('bot_lenders.bid_model')
+    def test_counters_follow_bid_lifecycle(self, mock_bid_model):
+        """Test placement, acceptance and rejection update the snapshot"""
+        mock_bid_model.create_bid.side_effect = ['bid-1', 'bid-2']
+        bot = self.manager.bots[0]
+        bot.place_bid(self.loan, self.borrower)
+        bot.place_bid(self.loan, self.borrower)
+        
+        stats = self.manager.get_bot_stats()
+        self.assertEqual(stats['available_capital'], 110000)
+        self.assertEqual(stats['active_bids'], 2)
+        self.assertEqual(stats['bid_rate_per_minute'], 2)
+        
+        self.assertTrue(self.manager.record_bid_status('bot-1', 'bid-1', 20000, 'accepted', 'stats-loan'))
+        self.assertTrue(self.manager.record_bid_status('bot-1', 'bid-2', 20000, 'rejected'))
+        self.assertFalse(self.manager.record_bid_status('bot-1', 'bid-2', 20000, 'rejected'))
+        
+        stats = self.manager.get_bot_stats()
+        self.assertEqual(stats['available_capital'], 130000)
+        self.assertEqual(stats['active_bids'], 0)
+        self.assertEqual(stats['funded_loans'], 1)
+        self.assertEqual(stats['bots'][0]['bids_rejected'], 1)
+        self.assertAlmostEqual(stats['bots'][0]['utilization'], 20.0)
+        self.assertEqual(bot.available_capital, Decimal('80000'))
+    
+    def test_snapshot_does_not_walk_bid_lists(self):
+        """Test snapshots come from counters, not from bots' bid lists"""
+        self.manager.bots[0].active_bids = Mock(side_effect=AssertionError('iterated'))
+        stats = self.manager.get_bot_stats()
+        self.assertEqual(stats['total_bots'], 2)
+        self.assertEqual(stats['total_capital'], 150000)
+    
+    def test_rolling_rate_and_history(self):
+        """Test the rolling window expires old events and history is bounded"""
+        counter = self.RollingCounter(60)
+        counter.add(now=1000)
+        counter.add(now=1030, count=2)
+        self.assertEqual(counter.total(now=1030), 3)
+        self.assertEqual(counter.total(now=1075), 2)
+        
+        self.manager.stats.history = deque(maxlen=3)
+        for _ in range(5):
+            self.manager.stats.maybe_record_history(force=True)
+        self.assertEqual(len(self.manager.get_stats_history()), 3)
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiterUnit(unittest.TestCase):
+    """Unit tests for the bot DynamoDB rate limiter"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from rate_limiter import TokenBucket, AdaptiveRateLimiter, install_throttle_listener
+            self.TokenBucket = TokenBucket
+            self.AdaptiveRateLimiter = AdaptiveRateLimiter
+            self.install_throttle_listener = install_throttle_listener
+        except ImportError:
+            self.skipTest("Rate limiter module not available")
+        self.clock = FakeClock()
+    
+    def test_bucket_refills_at_rate(self):
+        """Test tokens are spent and refilled at the configured rate"""
+        bucket = self.TokenBucket(rate=5, capacity=5, clock=self.clock)
+        
+        self.assertTrue(all(bucket.try_acquire() for _ in range(5)))
+        self.assertFalse(bucket.try_acquire())
+        self.clock.now = 0.4
+        self.assertTrue(bucket.try_acquire(2))
+        self.assertFalse(bucket.try_acquire())
+    
+    def test_throttle_backs_off_and_recovers(self):
+        """Test throttles halve budgets and quiet periods restore them"""
+        limiter = self.AdaptiveRateLimiter(read_rate=20, write_rate=10, recovery_interval=10,
+                                           recovery_step=0.1, clock=self.clock)
+        
+        limiter.on_throttle()
+        limiter.on_throttle()
+        stats = limiter.get_stats()
+        self.assertEqual(stats['read_rate'], 5)
+        self.assertEqual(stats['write_rate'], 2.5)
+        self.assertEqual(stats['throttle_count'], 2)
+        
+        # Still inside the recovery interval: no change
+        self.clock.now = 5
+        limiter._recover()
+        self.assertEqual(limiter.get_stats()['read_rate'], 5)
+        
+        self.clock.now = 30
+        limiter._recover()
+        self.assertEqual(limiter.get_stats()['read_rate'], 20)
+        self.assertEqual(limiter.get_stats()['write_rate'], 10)
+    
+    def test_throttle_listener_reads_botocore_responses(self):
+        """Test throttled responses retried by botocore still reach the limiter"""
+        limiter = Mock()
+        client = Mock()
+        handler = self.install_throttle_listener(client, limiter)
+        
+        handler(response=(Mock(), {'Error': {'Code': 'ProvisionedThroughputExceededException'}}))
+        handler(response=(Mock(), {'Error': {'Code': 'ConditionalCheckFailedException'}}))
+        handler(response=None)
+        
+        self.assertEqual(limiter.on_throttle.call_count, 1)
+        client.meta.events.register.assert_called_once()
+    
+    @patch('bot_lenders.user_model')
+    @patch('bot_lenders.loan_model')
+    @patch('bot_lenders.bid_model')
+    def test_manager_routes_traffic_through_limiter(self, mock_bid_model, mock_loan_model, mock_user_model):
+        """Test bot reads and writes draw from separate budgets"""
+        from bot_lenders import BotLender, BotLenderManager
+        limiter = Mock()
+        limiter.get_stats.return_value = {'throttle_count': 0}
+        manager = BotLenderManager(limiter=limiter)
+        manager.bots = [BotLender('bot-1', 'Limited Bot', 'aggressive', 100000)]
+        
+        mock_loan_model.get_all_open_loans.return_value = [
+            {'id': 'loan-1', 'borrower_id': 'b-1', 'amount': 10000, 'term_months': 36,
+             'max_interest_rate': 15.0, 'purpose': 'auto'}
+        ]
+        mock_user_model.get_user_by_id.return_value = {'credit_score': 800, 'annual_income': 100000}
+        mock_bid_model.get_bids_for_loan.return_value = []
+        mock_bid_model.create_bid.return_value = 'bid-1'
+        
+        with patch('bot_lenders.random.choices', return_value=[1]), patch('bot_lenders.time.sleep'):
+            manager._process_new_loans()
+        
+        self.assertEqual(limiter.acquire_read.call_count, 3)
+        self.assertEqual(limiter.acquire_write.call_count, 1)
+        self.assertEqual(manager.get_bot_stats()['rate_limiter'], {'throttle_count': 0})
+
+
+class TestBotShardingUnit(unittest.TestCase):
+    """Unit tests for evaluating bots across worker processes"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from bot_lenders import BotLender, BotLenderManager
+            from bot_sharding import LoanSnapshot, evaluate_shard, shard_bots
+            self.BotLender = BotLender
+            self.BotLenderManager = BotLenderManager
+            self.LoanSnapshot = LoanSnapshot
+            self.evaluate_shard = evaluate_shard
+            self.shard_bots = shard_bots
+        except ImportError:
+            self.skipTest("Bot sharding module not available")
+        
+        self.bots = [
+            self.BotLender('bot-safe', 'Safe', 'conservative', 100000, min_credit_score=750),
+            self.BotLender('bot-mid', 'Mid', 'balanced', 100000, min_credit_score=680),
+            self.BotLender('bot-risk', 'Risk', 'aggressive', 100000, min_credit_score=600)
+        ]
+        self.contexts = [
+            ({'id': 'loan-a', 'borrower_id': 'b', 'amount': 10000, 'term_months': 36,
+              'max_interest_rate': 15.0, 'purpose': 'medical'},
+             {'credit_score': 780, 'annual_income': 100000}, set()),
+            ({'id': 'loan-b', 'borrower_id': 'b', 'amount': 20000, 'term_months': 24,
+              'max_interest_rate': 18.0, 'purpose': 'business'},
+             {'credit_score': 690, 'annual_income': 60000}, {'bot-risk'})
+        ]
+    
+    def test_shards_match_in_process_evaluation(self):
+        """Test shard workers find the same eligible bots as evaluating in-process"""
+        from collections import Counter
+        snapshot = self.LoanSnapshot.create(self.contexts)
+        try:
+            intents = []
+            decisions = Counter()
+            for shard in self.shard_bots(self.bots, 2):
+                shard_intents, counts = self.evaluate_shard(shard, snapshot.layout)
+                intents.extend(shard_intents)
+                decisions.update(counts)
+        finally:
+            snapshot.close()
+        
+        expected = set()
+        for loan_index, (loan, borrower, bidder_ids) in enumerate(self.contexts):
+            for bot_index, bot in enumerate(self.bots):
+                if bot.bot_id not in bidder_ids and bot.should_bid_on_loan(loan, borrower):
+                    expected.add((bot_index, loan_index))
+        
+        self.assertEqual({(bot_index, loan_index) for bot_index, loan_index, _ in intents}, expected)
+        # loan-b already has a bid from bot-risk, and nobody else qualifies for it
+        self.assertNotIn(1, {loan_index for _, loan_index, _ in intents})
+        for bot_index, loan_index, rate in intents:
+            self.assertLess(rate, self.contexts[loan_index][0]['max_interest_rate'])
+        # Every decision made in the shards is counted and handed back
+        self.assertEqual(decisions[('Safe', 'eligible')] + decisions[('Mid', 'eligible')] +
+                         decisions[('Risk', 'eligible')], len(intents))
+        self.assertEqual(sum(count for (name, _), count in decisions.items() if name == 'Risk'), 1)
+    
+    def test_shards_use_rate_overrides(self):
+        """Test rate table overrides reach the worker processes"""
+        from bot_lenders import credit_bucket, amount_bucket, term_bucket
+        bot = self.bots[0]
+        bot.set_rate_override(credit_bucket(780), amount_bucket(10000), term_bucket(36), 4.0)
+        snapshot = self.LoanSnapshot.create(self.contexts[:1])
+        try:
+            intents, _ = self.evaluate_shard(self.shard_bots([bot], 1)[0], snapshot.layout)
+        finally:
+            snapshot.close()
+        
+        self.assertEqual(len(intents), 1)
+        self.assertAlmostEqual(intents[0][2], 4.0, delta=0.3)
+    
+    @patch('bot_lenders.user_model')
+    @patch('bot_lenders.loan_model')
+    @patch('bot_lenders.bid_model')
+    def test_sharded_manager_respects_cap(self, mock_bid_model, mock_loan_model, mock_user_model):
+        """Test the leader places merged intents within the per-loan cap"""
+        manager = self.BotLenderManager(max_workers=4, shard_processes=2)
+        manager.bots = [self.BotLender(f'bot-{i}', f'Bot {i}', 'aggressive', 1000000) for i in range(5)]
+        
+        loan = dict(self.contexts[0][0])
+        mock_loan_model.get_all_open_loans.return_value = [dict(loan, id=f'loan-{i}') for i in range(6)]
+        mock_user_model.get_user_by_id.return_value = {'credit_score': 800, 'annual_income': 200000}
+        mock_bid_model.get_bids_for_loan.return_value = [
+            {'lender_id': 'bot-0'}, {'lender_id': 'bot-1'}
+        ]
+        mock_bid_model.create_bid.return_value = 'bid-id'
+        
+        from bot_decisions import DecisionLog
+        decisions = DecisionLog()
+        try:
+            with patch('bot_lenders.random.choices', return_value=[2]), \
+                 patch('bot_lenders.decision_log', decisions):
+                manager._process_new_loans()
+        finally:
+            manager.stop_automated_bidding()
+        
+        # Two bot bids already exist on every loan, so only one more is allowed
+        self.assertEqual(mock_bid_model.create_bid.call_count, 6)
+        bidders = {call.kwargs['lender_id'] for call in mock_bid_model.create_bid.call_args_list}
+        self.assertFalse(bidders & {'bot-0', 'bot-1'})
+        # Decisions made in the worker processes reach the leader's log: bots 2-4 were
+        # evaluated on all six loans there, and each placed bid is re-checked in place_bid
+        eligible = sum(reasons.get('eligible', 0) for reasons in decisions.summary()['window'].values())
+        self.assertEqual(eligible, 3 * 6 + 6)
+    
+    def test_gevent_worker_evaluates_in_process(self):
+        """Test sharding is turned off when gevent has patched the process"""
+        manager = self.BotLenderManager(shard_processes=2)
+        with patch('bot_lenders.gevent_patched', return_value=True), \
+             patch.object(manager, '_bidding_loop'):
+            manager.start_automated_bidding()
+            manager.stop_automated_bidding()
+        
+        self.assertEqual(manager.shard_processes, 0)
+        self.assertIsNone(manager._shard_pool)
+
+class TestMarketIndexUnit(unittest.TestCase):
+    """Unit tests for the market rate index"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from market_index import RateSketch, MarketRateIndex
+            from bot_lenders import BotLender
+            self.RateSketch = RateSketch
+            self.MarketRateIndex = MarketRateIndex
+            self.BotLender = BotLender
+        except ImportError:
+            self.skipTest("Market index module not available")
+        
+        self.loan = {
+            'id': 'market-loan',
+            'amount': 15000,
+            'term_months': 36,
+            'max_interest_rate': 20.0,
+            'purpose': 'debt_consolidation'
+        }
+        self.borrower = {'credit_score': 720, 'annual_income': 90000}
+    
+    def test_sketch_percentiles_roll(self):
+        """Test percentiles track only the most recent window of rates"""
+        sketch = self.RateSketch(window=100, bin_width=0.1)
+        for i in range(100):
+            sketch.add(5.0 + i * 0.05)
+        
+        self.assertEqual(sketch.count, 100)
+        self.assertAlmostEqual(sketch.percentile(50), 7.45, delta=0.1)
+        self.assertAlmostEqual(sketch.mean(), 7.475, delta=0.01)
+        
+        # A new window of high rates fully replaces the old one
+        for _ in range(100):
+            sketch.add(12.0)
+        self.assertEqual(sketch.count, 100)
+        self.assertAlmostEqual(sketch.percentile(25), 12.05, delta=0.01)
+        self.assertEqual(sum(sketch.counts), 100)
+    
+    def test_quote_prefers_accepted_rates(self):
+        """Test quotes need min_samples and use accepted rates over pending ones"""
+        index = self.MarketRateIndex(min_samples=5)
+        for _ in range(4):
+            index.record(720, 15000, 36, 9.0)
+        self.assertIsNone(index.quote(720, 15000, 36))
+        
+        index.record(720, 15000, 36, 9.0)
+        self.assertAlmostEqual(index.quote(720, 15000, 36), 9.0, delta=0.05)
+        
+        for _ in range(5):
+            index.record(710, 12000, 30, 7.0, status='accepted')
+        self.assertAlmostEqual(index.quote(720, 15000, 36), 7.0, delta=0.05)
+        # A different credit band has its own bucket
+        self.assertIsNone(index.quote(790, 15000, 36))
+        
+        buckets = index.snapshot()
+        self.assertEqual(len(buckets), 1)
+        self.assertEqual(buckets[0]['pending']['count'], 5)
+        self.assertEqual(buckets[0]['accepted']['count'], 5)
+    
+    def test_bot_prices_against_market(self):
+        """Test bots quote around the market rate and keep their overrides' offset"""
+        index = self.MarketRateIndex(min_samples=5)
+        bot = self.BotLender('bot-1', 'Market Bot', 'balanced', 100000)
+        bot.market_index = index
+        
+        # Without data the grid price is used
+        grid_price = bot.calculate_interest_rate(self.loan, self.borrower)
+        self.assertAlmostEqual(grid_price, 5.0, delta=0.3)
+        
+        for _ in range(10):
+            index.record(720, 15000, 36, 11.0, status='accepted')
+        self.assertAlmostEqual(bot.calculate_interest_rate(self.loan, self.borrower), 11.0, delta=0.35)
+        
+        from bot_lenders import credit_bucket, amount_bucket, term_bucket
+        key = (credit_bucket(720), amount_bucket(15000), term_bucket(36))
+        bot.set_rate_override(*key, bot.rate_table[key + ('balanced',)] + 1.0)
+        self.assertAlmostEqual(bot.calculate_interest_rate(self.loan, self.borrower), 12.0, delta=0.35)
+    
+    def test_feed_from_bid_events(self):
+        """Test the feed records human quotes and fills from any path, skips bot quotes and seeds from the table"""
+        from market_index import MarketIndexFeed
+        from dynamodb_models import BidCreated, BidStatusChanged
+        loan = dict(self.loan, borrower_id='b1')
+        loan_model = Mock()
+        loan_model.get_loan_request.return_value = loan
+        loan_model.get_loan_requests.side_effect = lambda ids: {i: loan for i in ids if i == 'market-loan'}
+        user_model = Mock()
+        user_model.get_user_by_id.return_value = self.borrower
+        user_model.get_users.return_value = {'b1': self.borrower}
+        index = self.MarketRateIndex(min_samples=1)
+        feed = MarketIndexFeed(index, loan_model, user_model)
+        
+        bid = {'id': 'x', 'loan_request_id': 'market-loan', 'interest_rate': Decimal('9.0')}
+        feed.on_event(BidCreated(bid))
+        feed.on_event(BidCreated(dict(bid, interest_rate=Decimal('4.0'), source='bot')))
+        feed.on_event(BidStatusChanged('x', 'accepted', 'market-loan', Decimal('500'), Decimal('8.0')))
+        feed.on_event(BidStatusChanged('y', 'rejected', 'market-loan', None, Decimal('8.0')))
+        bucket = index.snapshot()[0]
+        self.assertEqual((bucket['pending']['count'], bucket['accepted']['count']), (1, 1))
+        self.assertEqual(loan_model.get_loan_request.call_count, 1)
+        
+        bid_model = Mock()
+        bid_model.get_bids_since.return_value = [
+            dict(bid, status='pending', created_at='2024-01-02'),
+            dict(bid, status='pending', source='bot', created_at='2024-01-01'),
+            dict(bid, status='accepted', source='bot', created_at='2024-01-03'),
+            dict(bid, loan_request_id='gone', status='accepted', created_at='2024-01-04'),
+        ]
+        self.assertEqual(feed.seed(bid_model), 2)
+        bucket = index.snapshot()[0]
+        self.assertEqual((bucket['pending']['count'], bucket['accepted']['count']), (2, 2))
+
+class TestAutoInvestUnit(unittest.TestCase):
+    """Unit tests for auto-invest rule matching"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from auto_invest import RuleIndex, AutoInvestEngine, normalize_purpose
+            self.RuleIndex = RuleIndex
+            self.AutoInvestEngine = AutoInvestEngine
+            self.normalize_purpose = normalize_purpose
+        except ImportError:
+            self.skipTest("Auto-invest module not available")
+        
+        self.loan = {
+            'id': 'auto-loan',
+            'borrower_id': 'borrower-1',
+            'amount': 8000,
+            'term_months': 36,
+            'max_interest_rate': 12.0,
+            'purpose': 'Debt Consolidation'
+        }
+        self.borrower = {'credit_score': 740, 'annual_income': 80000}
+    
+    def _brute_force(self, rules, loan, borrower):
+        """Reference matcher that checks every predicate of every rule"""
+        matched = []
+        for rule in rules:
+            if borrower['credit_score'] < rule.get('min_credit_score', 0):
+                continue
+            if rule.get('terms') and loan['term_months'] not in rule['terms']:
+                continue
+            if rule.get('purposes') and self.normalize_purpose(loan['purpose']) not in \
+                    [self.normalize_purpose(p) for p in rule['purposes']]:
+                continue
+            if float(loan['amount']) < rule.get('min_amount', 0):
+                continue
+            if rule.get('max_amount') is not None and float(loan['amount']) > rule['max_amount']:
+                continue
+            if rule['interest_rate'] > loan['max_interest_rate']:
+                continue
+            matched.append(rule['id'])
+        return sorted(matched)
+    
+    def test_index_matches_brute_force(self):
+        """Test the bitset index agrees with checking every rule"""
+        import random
+        rng = random.Random(7)
+        purposes = ['Debt Consolidation', 'Business', 'Medical', 'Auto']
+        rules = []
+        for i in range(500):
+            rules.append({
+                'id': f'rule-{i}',
+                'lender_id': f'lender-{i % 50}',
+                'interest_rate': round(rng.uniform(4, 16), 1),
+                'min_credit_score': rng.choice([0, 650, 700, 720, 750]),
+                'terms': rng.choice([[], [36, 48], [12, 24], [60]]),
+                'min_amount': rng.choice([0, 5000]),
+                'max_amount': rng.choice([None, 10000, 25000]),
+                'purposes': rng.choice([[], ['Business'], ['Debt Consolidation', 'Medical']])
+            })
+        index = self.RuleIndex(rules)
+        
+        for _ in range(200):
+            loan = dict(self.loan, amount=rng.randint(1, 40) * 1000, term_months=rng.choice([12, 24, 36, 48, 60]),
+                        max_interest_rate=round(rng.uniform(5, 18), 1), purpose=rng.choice(purposes))
+            borrower = {'credit_score': rng.randint(600, 820)}
+            matched = sorted(rule['id'] for rule in index.match(loan, borrower))
+            self.assertEqual(matched, self._brute_force(rules, loan, borrower))
+    
+    @patch('bot_lenders.bid_model')
+    def test_engine_bids_once_per_funded_lender(self, mock_bid_model):
+        """Test matching lenders bid at their best rule rate from their ledger budget"""
+        mock_bid_model.create_bid.side_effect = lambda **kwargs: f"bid-{kwargs['lender_id']}"
+        rules = [
+            {'id': 'r1', 'lender_id': 'alice', 'interest_rate': 9.5, 'min_credit_score': 720,
+             'terms': [36, 48], 'max_amount': 10000},
+            {'id': 'r2', 'lender_id': 'alice', 'interest_rate': 8.0, 'min_credit_score': 700},
+            {'id': 'r3', 'lender_id': 'bob', 'interest_rate': 10.0},
+            {'id': 'r4', 'lender_id': 'carol', 'interest_rate': 7.0, 'min_credit_score': 780},
+            {'id': 'r5', 'lender_id': 'dave', 'interest_rate': 9.0}
+        ]
+        rule_model = Mock()
+        rule_model.get_active_rules.return_value = rules
+        ledger = FakeBotLedger()
+        ledger.open_account('alice', 50000)
+        ledger.open_account('bob', 5000)  # Not enough for the whole loan
+        ledger.open_account('carol', 50000)
+        # dave never deposited a budget
+        
+        engine = self.AutoInvestEngine(rule_model, ledger)
+        self.assertEqual(engine.invest(self.loan, self.borrower), ['bid-alice'])
+        
+        call = mock_bid_model.create_bid.call_args
+        self.assertEqual(call.kwargs['interest_rate'], 8.0)
+        self.assertEqual(call.kwargs['source'], 'auto_invest')
+        self.assertEqual(ledger.accounts['alice']['available_capital'], Decimal('42000'))
+        self.assertEqual(ledger.accounts['bob']['available_capital'], Decimal('5000'))
+    
+    @patch('bot_lenders.bid_model')
+    def test_engine_follows_loan_events(self, mock_bid_model):
+        """Test loans written by any path reach the engine through the loan model's events"""
+        from dynamodb_models import EventBus, DynamoDBLoanRequest, LoanCreated, LoanStatusChanged
+        mock_bid_model.create_bid.return_value = 'bid-alice'
+        rule_model = Mock()
+        rule_model.get_active_rules.return_value = [{'id': 'r1', 'lender_id': 'alice', 'interest_rate': 8.0}]
+        ledger = FakeBotLedger()
+        ledger.open_account('alice', 50000)
+        user_model = Mock()
+        user_model.get_user_by_id.return_value = self.borrower
+        engine = self.AutoInvestEngine(rule_model, ledger, user_model=user_model)
+        
+        bus = EventBus()
+        with patch('dynamodb_models.dynamodb'):
+            loan_model = DynamoDBLoanRequest(bus)
+        placed = []
+        loan_model.add_listener(lambda event, loan: placed.extend(engine.on_loan_event(event, loan)), remote=False)
+        
+        bus.publish(LoanCreated(self.loan))
+        bus.publish(LoanStatusChanged(self.loan['id'], 'funded'))
+        bus.dispatch(LoanCreated(dict(self.loan, id='elsewhere')), remote=True)
+        
+        self.assertEqual(placed, ['bid-alice'])
+        user_model.get_user_by_id.assert_called_once_with(self.loan['borrower_id'])
+        bus.close()
+    
+    def test_rule_form_validated(self):
+        """Test rules with bad rates or amounts are refused before anything is saved"""
+        try:
+            import app_dynamodb
+        except ImportError:
+            self.skipTest("Flask app not available")
+        user = Mock(id='lender-1', user_type='lender', is_authenticated=True)
+        app_dynamodb.app.config['LOGIN_DISABLED'] = True
+        try:
+            with patch.object(app_dynamodb, 'current_user', user), \
+                    patch.object(app_dynamodb.auto_invest_rule_model, 'create_rule', return_value=None) as create_rule:
+                client = app_dynamodb.app.test_client()
+                for form in ({'interest_rate': '0'}, {'interest_rate': '-3'}, {'interest_rate': 'nan'},
+                             {'interest_rate': 'abc'}, {'interest_rate': '8', 'min_amount': 'inf'},
+                             {'interest_rate': '8', 'min_amount': '5000', 'max_amount': '1000'}):
+                    response = client.post('/auto_invest', data=form)
+                    self.assertEqual(response.status_code, 302)
+                create_rule.assert_not_called()
+                
+                # A failed write is reported instead of raising
+                response = client.post('/auto_invest', data={'interest_rate': '8', 'max_amount': '5000'})
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(create_rule.call_args.kwargs['max_amount'], 5000.0)
+        finally:
+            app_dynamodb.app.config['LOGIN_DISABLED'] = False
+    
+    def test_budget_form_validated(self):
+        """Test bad deposits are refused and success is only reported once the ledger took it"""
+        try:
+            import app_dynamodb
+        except ImportError:
+            self.skipTest("Flask app not available")
+        user = Mock(id='lender-1', user_type='lender', is_authenticated=True)
+        ledger = Mock()
+        ledger.open_account.return_value = None
+        ledger.add_capital.return_value = False
+        app_dynamodb.app.config['LOGIN_DISABLED'] = True
+        try:
+            with patch.object(app_dynamodb, 'current_user', user), \
+                    patch.object(app_dynamodb, 'bot_ledger_model', ledger), \
+                    patch.object(app_dynamodb, 'flash') as flash:
+                client = app_dynamodb.app.test_client()
+                for amount in ('abc', 'nan', 'inf', '-5', '0'):
+                    self.assertEqual(client.post('/auto_invest/budget', data={'amount': amount}).status_code, 302)
+                ledger.open_account.assert_not_called()
+                
+                client.post('/auto_invest/budget', data={'amount': '500'})
+                self.assertEqual(flash.call_args.args[1], 'error')
+                ledger.add_capital.return_value = True
+                client.post('/auto_invest/budget', data={'amount': '500'})
+                self.assertEqual(flash.call_args.args, ('Added $500.00 to your auto-invest budget.', 'success'))
+        finally:
+            app_dynamodb.app.config['LOGIN_DISABLED'] = False
+
+class TestOrderBookUnit(unittest.TestCase):
+    """Unit tests for per-loan order books"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from order_book import OrderBook, OrderBookRegistry
+            self.OrderBook = OrderBook
+            self.OrderBookRegistry = OrderBookRegistry
+        except ImportError:
+            self.skipTest("Order book module not available")
+    
+    def _bid(self, bid_id, rate, amount=1000, created_at='2024-01-01T00:00:00', loan_id='loan-1'):
+        return {'id': bid_id, 'loan_request_id': loan_id, 'lender_id': f'lender-{bid_id}',
+                'interest_rate': Decimal(str(rate)), 'amount': Decimal(str(amount)),
+                'created_at': created_at, 'status': 'pending'}
+    
+    def test_priority_and_running_totals(self):
+        """Test bids sort by rate then time and aggregates follow adds and removes"""
+        book = self.OrderBook('loan-1', [
+            self._bid('a', 7.5, 2000),
+            self._bid('b', 6.0, 1000, created_at='2024-01-02T00:00:00'),
+            self._bid('c', 6.0, 3000, created_at='2024-01-01T00:00:00')
+        ])
+        
+        self.assertEqual([bid['id'] for bid in book.sorted_bids()], ['c', 'b', 'a'])
+        self.assertEqual(book.best()['id'], 'c')
+        self.assertEqual(book.best_rate, 6.0)
+        self.assertAlmostEqual(book.avg_rate, 6.5)
+        self.assertAlmostEqual(book.weighted_avg_rate, (15000 + 6000 + 18000) / 6000)
+        self.assertEqual(book.total_amount, 6000)
+        
+        book.remove('c')
+        self.assertEqual(book.best()['id'], 'b')
+        self.assertEqual(book.summary()['count'], 2)
+        self.assertEqual(book.total_amount, 3000)
+        
+        # Re-adding a bid replaces it instead of double counting
+        book.add(self._bid('a', 5.0, 2000))
+        self.assertEqual(book.best_rate, 5.0)
+        self.assertEqual(len(book), 2)
+        self.assertEqual(book.total_amount, 3000)
+        
+        book.remove('a')
+        book.remove('b')
+        self.assertIsNone(book.best())
+        self.assertEqual(book.summary()['total_amount'], 0.0)
+    
+    def test_chunked_keys_match_a_sorted_list(self):
+        """Test the chunked key store stays sorted through splits and emptied chunks"""
+        import random
+        from order_book import SortedKeys
+        rng = random.Random(7)
+        initial = [(rng.randint(1, 30), str(i)) for i in range(40)]
+        keys = SortedKeys(initial, load=4)
+        expected = sorted(initial)
+        
+        for i in range(40, 1000):
+            if expected and rng.random() < 0.45:
+                key = expected.pop(rng.randrange(len(expected)))
+                keys.remove(key)
+            else:
+                key = (rng.randint(1, 30), str(i))
+                keys.add(key)
+                expected.append(key)
+                expected.sort()
+            self.assertEqual(len(keys), len(expected))
+            self.assertEqual(keys.first(), expected[0] if expected else None)
+            self.assertTrue(all(len(chunk) <= 8 for chunk in keys.chunks))
+        
+        self.assertEqual(keys.head(), expected)
+        self.assertEqual(keys.head(10), expected[:10])
+        self.assertEqual(keys.maxes, [chunk[-1] for chunk in keys.chunks])
+    
+    def test_registry_follows_bid_events(self):
+        """Test books load once and then track bid creations and status changes"""
+        loader = Mock(return_value=[self._bid('a', 8.0), dict(self._bid('x', 4.0), status='rejected')])
+        registry = self.OrderBookRegistry(loader, max_age=0)
+        
+        book = registry.get('loan-1')
+        self.assertEqual([bid['id'] for bid in book.sorted_bids()], ['a'])
+        
+        registry.on_bid_event('created', self._bid('b', 6.5))
+        registry.on_bid_event('created', self._bid('other', 3.0, loan_id='loan-2'))
+        self.assertIs(registry.get('loan-1'), book)
+        self.assertEqual(book.best_rate, 6.5)
+        loader.assert_called_once_with('loan-1')
+        
+        registry.on_bid_event('status', {'id': 'b', 'status': 'rejected'})
+        self.assertEqual(book.best_rate, 8.0)
+        
+        registry.close('loan-1')
+        self.assertEqual(registry.bid_loans, {})
+    
+    def test_registry_reloads_stale_books(self):
+        """Test books older than max_age are reloaded from the table"""
+        loader = Mock(return_value=[self._bid('a', 8.0)])
+        registry = self.OrderBookRegistry(loader, max_age=30)
+        
+        book = registry.get('loan-1')
+        book.loaded_at -= 60
+        self.assertIsNot(registry.get('loan-1'), book)
+        self.assertEqual(loader.call_count, 2)
+
+class TestMatchingUnit(unittest.TestCase):
+    """Unit tests for the partial-fill matching engine"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from matching import match_bids, MatchingEngine
+            from order_book import OrderBook, OrderBookRegistry
+            self.match_bids = match_bids
+            self.MatchingEngine = MatchingEngine
+            self.OrderBook = OrderBook
+            self.OrderBookRegistry = OrderBookRegistry
+        except ImportError:
+            self.skipTest("Matching module not available")
+    
+    def _bid(self, bid_id, rate, amount, created_at='2024-01-01T00:00:00'):
+        return {'id': bid_id, 'loan_request_id': 'loan-1', 'lender_id': f'lender-{bid_id}',
+                'interest_rate': Decimal(str(rate)), 'amount': Decimal(str(amount)),
+                'created_at': created_at, 'status': 'pending'}
+    
+    def _sorted(self, bids):
+        return self.OrderBook('loan-1', bids).sorted_bids()
+    
+    def test_fills_in_rate_priority(self):
+        """Test cheaper bids fill first and the marginal bid is partially filled"""
+        bids = self._sorted([self._bid('a', 7.0, 10000), self._bid('b', 5.0, 12000), self._bid('c', 6.0, 10000)])
+        allocations, remaining = self.match_bids(30000, bids)
+        
+        self.assertEqual([(a.bid_id, a.amount) for a in allocations],
+                         [('b', Decimal('12000.00')), ('c', Decimal('10000.00')), ('a', Decimal('8000.00'))])
+        self.assertEqual(remaining, 0)
+        
+        # Not enough bids: everything fills and the rest stays open
+        allocations, remaining = self.match_bids(40000, bids)
+        self.assertEqual(remaining, Decimal('8000.00'))
+        self.assertEqual(len(allocations), 3)
+    
+    def test_pro_rata_at_marginal_rate(self):
+        """Test bids tied at the marginal rate share what is left pro rata"""
+        bids = self._sorted([
+            self._bid('cheap', 4.0, 1000),
+            self._bid('early', 6.0, 3000, created_at='2024-01-01T00:00:00'),
+            self._bid('late', 6.0, 1000, created_at='2024-01-02T00:00:00'),
+            self._bid('third', 6.0, 2000, created_at='2024-01-03T00:00:00')
+        ])
+        allocations, remaining = self.match_bids(2000.01, bids)
+        shares = {a.bid_id: a.amount for a in allocations}
+        
+        self.assertEqual(remaining, 0)
+        self.assertEqual(shares['cheap'], Decimal('1000.00'))
+        # 1000.01 split 3:1:2 rounds down to 999.99; the two leftover cents go to the earliest bids
+        self.assertEqual(shares['early'], Decimal('500.01'))
+        self.assertEqual(shares['late'], Decimal('166.67'))
+        self.assertEqual(shares['third'], Decimal('333.33'))
+        self.assertEqual(sum(shares.values()), Decimal('2000.01'))
+    
+    def test_large_book(self):
+        """Test thousands of bids match quickly and exactly"""
+        import random
+        rng = random.Random(3)
+        bids = self._sorted([self._bid(f'b{i}', rng.choice([5.0, 5.5, 6.0, 6.5]), rng.randint(1, 50) * 100,
+                                       created_at=f'2024-01-01T00:00:{i % 60:02d}.{i:06d}')
+                             for i in range(5000)])
+        start = time_ns()
+        allocations, remaining = self.match_bids(2500000, bids)
+        elapsed_ms = (time_ns() - start) / 1e6
+        
+        self.assertEqual(remaining, 0)
+        self.assertEqual(sum(a.amount for a in allocations), Decimal('2500000.00'))
+        self.assertLess(elapsed_ms, 1000)
+        # Every bid at a better rate than the marginal one is filled completely
+        marginal = max(a.interest_rate for a in allocations)
+        for a in allocations:
+            if a.interest_rate < marginal:
+                self.assertEqual(a.amount, a.bid_amount)
+    
+    def _engine(self, bids, loan):
+        """Engine over in-memory bids; the order book only sees the bids it was built with"""
+        loan_model = Mock()
+        loan_model.get_loan_request.return_value = loan
+        booked = [dict(bid) for bid in bids]
+        registry = self.OrderBookRegistry(lambda loan_id: [dict(bid) for bid in booked], max_age=3600)
+        
+        def set_status(bid_id, status, expected_status=None):
+            bid = next(bid for bid in bids if bid['id'] == bid_id)
+            if expected_status is not None and bid['status'] != expected_status:
+                return False
+            bid['status'] = status
+            registry.on_bid_event('status', {'id': bid_id, 'status': status})
+            return True
+        def accept(loan_id, allocations, expected, new_funded, fully_funded):
+            if loan['status'] != 'open' or loan.get('funded_amount', 0) != expected:
+                return False
+            for allocation in allocations:
+                set_status(allocation.bid_id, 'accepted')
+            loan['funded_amount'] = new_funded
+            loan['status'] = 'funded' if fully_funded else 'open'
+            return True
+        bid_model = Mock()
+        bid_model.accept_allocations.side_effect = accept
+        bid_model.update_bid_status.side_effect = set_status
+        bid_model.get_bids_for_loan.side_effect = lambda loan_id: [dict(bid) for bid in bids]
+        self.ledger = Mock()
+        self.settled = []
+        return self.MatchingEngine(loan_model, bid_model, self.ledger, registry,
+                                   on_settled=lambda *args: self.settled.append(args))
+    
+    def test_engine_commits_and_settles(self):
+        """Test the engine commits fills, releases unfilled capital and rejects the rest"""
+        bids = [self._bid('a', 5.0, 6000), self._bid('b', 6.0, 6000), self._bid('c', 7.0, 6000)]
+        loan = {'id': 'loan-1', 'amount': Decimal('10000'), 'status': 'open'}
+        engine = self._engine(bids, loan)
+        engine.order_books.get('loan-1')
+        # Placed through another worker after this one cached the book
+        bids.append(self._bid('d', 8.0, 500))
+        
+        result = engine.fill_loan('loan-1')
+        
+        self.assertTrue(result['funded'])
+        self.assertEqual(result['remaining'], 0)
+        self.assertEqual([(a['bid_id'], a['amount']) for a in result['allocations']], [('a', 6000), ('b', 4000)])
+        _, _, expected, new_funded, fully_funded = engine.bid_model.accept_allocations.call_args.args
+        self.assertEqual((expected, new_funded, fully_funded), (Decimal('0.00'), Decimal('10000.00'), True))
+        
+        self.ledger.commit_capital.assert_any_call('lender-b', Decimal('4000.00'), 'b', 'loan-1', release=Decimal('2000.00'))
+        self.assertEqual([bid['status'] for bid in bids], ['accepted', 'accepted', 'rejected', 'rejected'])
+        self.ledger.release_capital.assert_any_call('lender-d', Decimal('500'), 'd')
+        self.assertEqual([args[4] for args in self.settled], ['accepted', 'accepted', 'rejected', 'rejected'])
+    
+    def test_accept_bid_after_partial_fill(self):
+        """Test a borrower's single accept is capped at what partial fills left and refuses stale bids"""
+        bids = [self._bid('a', 5.0, 4000), self._bid('b', 6.0, 9000), self._bid('c', 7.0, 3000)]
+        loan = {'id': 'loan-1', 'amount': Decimal('10000'), 'status': 'open', 'funded_amount': Decimal('4000.00')}
+        bids[0]['status'] = 'accepted'
+        bids[2]['status'] = 'expired'
+        engine = self._engine(bids, loan)
+        
+        self.assertIsNone(engine.accept_bid(loan, dict(bids[2])))
+        result = engine.accept_bid(loan, dict(bids[1]))
+        
+        self.assertEqual(result['funded_amount'], 10000)
+        self.assertEqual(loan['status'], 'funded')
+        self.ledger.commit_capital.assert_called_once_with('lender-b', Decimal('6000.00'), 'b', 'loan-1',
+                                                           release=Decimal('3000.00'))
+        # Accepting again, or any bid once the loan is funded, is refused
+        self.assertIsNone(engine.accept_bid(loan, dict(bids[1])))
+        self.assertEqual(engine.bid_model.accept_allocations.call_count, 1)
+
+class TestAuctionCloseUnit(unittest.TestCase):
+    """Unit tests for the auction-close engine"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from auction_close import AuctionCloser, expiry_timestamp
+            from matching import MatchingEngine
+            from order_book import OrderBookRegistry
+            self.AuctionCloser = AuctionCloser
+            self.expiry_timestamp = expiry_timestamp
+            self.MatchingEngine = MatchingEngine
+            self.OrderBookRegistry = OrderBookRegistry
+        except ImportError:
+            self.skipTest("Auction close module not available")
+    
+    def _bid(self, bid_id, loan_id, rate, amount, created_at='2024-01-01T00:00:00'):
+        return {'id': bid_id, 'loan_request_id': loan_id, 'lender_id': f'lender-{bid_id}',
+                'interest_rate': Decimal(str(rate)), 'amount': Decimal(str(amount)),
+                'created_at': created_at, 'status': 'pending'}
+    
+    def _closer(self, loans, bids, **kwargs):
+        """Closer over in-memory loans and bids; per-loan bid loads fail the test"""
+        def no_scan(loan_id):
+            raise AssertionError(f"per-loan bid scan for {loan_id}")
+        registry = self.OrderBookRegistry(no_scan, max_age=0)
+        
+        loan_model = Mock()
+        loan_model.get_loan_requests.side_effect = lambda ids: {i: loans[i] for i in ids if i in loans}
+        loan_model.get_all_open_loans.side_effect = lambda: [l for l in loans.values() if l['status'] == 'open']
+        def expire(loan_id):
+            loans[loan_id]['status'] = 'expired'
+            return True
+        loan_model.expire_loan.side_effect = expire
+        
+        bid_model = Mock()
+        def pending(loan_ids, statuses=('pending',)):
+            by_loan = {loan_id: [] for loan_id in loan_ids}
+            for bid in bids:
+                if bid['status'] in statuses and bid['loan_request_id'] in by_loan:
+                    by_loan[bid['loan_request_id']].append(dict(bid))
+            return by_loan
+        bid_model.get_pending_bids_for_loans.side_effect = pending
+        def set_status(bid_id, status):
+            next(bid for bid in bids if bid['id'] == bid_id)['status'] = status
+            registry.on_bid_event('status', {'id': bid_id, 'status': status})
+        def accept(loan_id, allocations, expected, new_funded, fully_funded):
+            for allocation in allocations:
+                set_status(allocation.bid_id, 'accepted')
+            loans[loan_id]['funded_amount'] = new_funded
+            loans[loan_id]['status'] = 'funded' if fully_funded else 'open'
+            return True
+        bid_model.accept_allocations.side_effect = accept
+        def update_status(bid_id, status, expected_status=None):
+            if expected_status is not None and next(bid for bid in bids if bid['id'] == bid_id)['status'] != expected_status:
+                return False
+            set_status(bid_id, status)
+            return True
+        bid_model.update_bid_status.side_effect = update_status
+        
+        self.ledger = Mock()
+        engine = self.MatchingEngine(loan_model, bid_model, self.ledger, registry)
+        return self.AuctionCloser(loan_model, bid_model, engine, registry, **kwargs)
+    
+    def test_heap_order_and_reschedule(self):
+        """Test loans come due in deadline order and superseded entries are skipped"""
+        closer = self._closer({}, [])
+        closer.schedule('late', 300)
+        closer.schedule('early', 100)
+        closer.schedule('moved', 150)
+        closer.schedule('moved', 400)
+        closer.schedule('gone', 120)
+        closer.cancel('gone')
+        
+        self.assertEqual(len(closer), 3)
+        self.assertEqual(closer.next_deadline(), 100)
+        self.assertEqual(closer.due(now=350), ['early', 'late'])
+        self.assertEqual(closer.due(now=350), [])
+        self.assertEqual(closer.due(now=400), ['moved'])
+        self.assertEqual(self.expiry_timestamp('1970-01-02T00:00:00'), 86400)
+    
+    def test_new_loans_scheduled_from_events(self):
+        """Test loans written by any path are scheduled at their stored expiry right away"""
+        from dynamodb_models import EventBus, DynamoDBLoanRequest, LoanStatusChanged
+        closer = self._closer({}, [])
+        bus = EventBus()
+        with patch('dynamodb_models.dynamodb'):
+            loan_model = DynamoDBLoanRequest(bus)
+        loan_model.add_listener(closer.on_loan_event)
+        
+        item = dict(loan_model.build_loan_item('b1', 5000, 'Education', 36, 12.0), expires_at='2030-01-01T00:00:00')
+        with patch('dynamodb_models.batch_put_items', return_value=set()):
+            loan_model.put_loans([item])
+        bus.publish(LoanStatusChanged(item['id'], 'funded'))
+        
+        self.assertEqual(closer.deadlines, {item['id']: self.expiry_timestamp('2030-01-01T00:00:00')})
+        closer.loan_model.get_all_open_loans.assert_not_called()  # No resync was needed
+        bus.close()
+    
+    def test_close_funds_winners_and_releases_losers(self):
+        """Test expiry fills from the lowest rates and rejects every other bid"""
+        loans = {'loan-1': {'id': 'loan-1', 'amount': Decimal('10000'), 'status': 'open',
+                            'expires_at': '2024-01-31T00:00:00'}}
+        bids = [self._bid('a', 'loan-1', 6.0, 6000), self._bid('b', 'loan-1', 5.0, 6000),
+                self._bid('c', 'loan-1', 7.0, 6000)]
+        closer = self._closer(loans, bids)
+        closer.load_open_loans()
+        
+        self.assertEqual(closer.close_due(now=self.expiry_timestamp('2024-01-30T00:00:00')), [])
+        results = closer.close_due(now=self.expiry_timestamp('2024-01-31T00:00:00'))
+        
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0]['funded'])
+        self.assertEqual([(a['bid_id'], a['amount']) for a in results[0]['allocations']], [('b', 6000), ('a', 4000)])
+        self.assertEqual(loans['loan-1']['status'], 'funded')
+        self.assertEqual([bid['status'] for bid in bids], ['accepted', 'accepted', 'rejected'])
+        self.ledger.release_capital.assert_called_once_with('lender-c', Decimal('6000'), 'c')
+        self.assertEqual(closer.stats['funded'], 1)
+    
+    def test_underfunded_auction_expires(self):
+        """Test a loan short of the minimum fill expires and every bid is released"""
+        loans = {'loan-1': {'id': 'loan-1', 'amount': Decimal('10000'), 'status': 'open'}}
+        bids = [self._bid('a', 'loan-1', 5.0, 3000), self._bid('b', 'loan-1', 6.0, 3000)]
+        closer = self._closer(loans, bids, min_fill_ratio=0.8)
+        closer.schedule('loan-1', 100)
+        
+        results = closer.close_due(now=100)
+        
+        self.assertTrue(results[0]['expired'])
+        self.assertEqual(loans['loan-1']['status'], 'expired')
+        self.assertEqual([bid['status'] for bid in bids], ['rejected', 'rejected'])
+        self.assertEqual(self.ledger.release_capital.call_count, 2)
+        self.ledger.commit_capital.assert_not_called()
+        
+        # At a lower threshold the same bids close the loan, short of its amount
+        loans['loan-1']['status'] = 'open'
+        for bid in bids:
+            bid['status'] = 'pending'
+        closer = self._closer(loans, bids, min_fill_ratio=0.5)
+        closer.schedule('loan-1', 100)
+        result = closer.close_due(now=100)[0]
+        self.assertTrue(result['funded'])
+        self.assertEqual(result['funded_amount'], 6000)
+        self.assertEqual(loans['loan-1']['status'], 'funded')
+    
+    def test_single_winner_rule(self):
+        """Test the single rule takes the best bid that covers the loan alone, earliest on ties"""
+        loans = {'loan-1': {'id': 'loan-1', 'amount': Decimal('5000'), 'status': 'open'}}
+        bids = [self._bid('small', 'loan-1', 4.0, 1000),
+                self._bid('late', 'loan-1', 5.0, 8000, created_at='2024-01-02T00:00:00'),
+                self._bid('early', 'loan-1', 5.0, 5000, created_at='2024-01-01T00:00:00')]
+        closer = self._closer(loans, bids, rule='single')
+        closer.schedule('loan-1', 100)
+        
+        result = closer.close_due(now=100)[0]
+        
+        self.assertEqual([(a['bid_id'], a['amount']) for a in result['allocations']], [('early', 5000)])
+        self.assertEqual([bid['status'] for bid in bids], ['rejected', 'rejected', 'accepted'])
+    
+    def test_many_closings_per_batch(self):
+        """Test thousands of due loans close with one bid scan per batch"""
+        loans = {}
+        bids = []
+        for i in range(2000):
+            loan_id = f'loan-{i}'
+            loans[loan_id] = {'id': loan_id, 'amount': Decimal('1000'), 'status': 'open'}
+            bids.append(self._bid(f'b{i}', loan_id, 5.0, 1000))
+        closer = self._closer(loans, bids, batch_size=1000)
+        for loan_id in loans:
+            closer.schedule(loan_id, 100)
+        
+        start = time_ns()
+        results = closer.close_due(now=100) + closer.close_due(now=100)
+        elapsed_s = (time_ns() - start) / 1e9
+        
+        self.assertEqual(len(results), 2000)
+        self.assertTrue(all(result['funded'] for result in results))
+        # Per batch: one read to build the order books, one fresh read for the rejections
+        self.assertEqual(closer.bid_model.get_pending_bids_for_loans.call_count, 4)
+        self.assertEqual(len(closer), 0)
+        self.assertLess(elapsed_s, 30)
+
+class TestAmortizationUnit(unittest.TestCase):
+    """Unit tests for the amortization engine"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            import amortization
+            self.amortization = amortization
+        except ImportError:
+            self.skipTest("Amortization module not available")
+    
+    def test_known_payments(self):
+        """Test payments and interest match a standard amortization table"""
+        result = self.amortization.to_lists(self.amortization.amortize([10000, 5000], [6.0, 0], [36, 12]))
+        
+        self.assertEqual(result['monthly_payment'], [304.22, 416.67])
+        self.assertEqual(result['total_interest'], [951.88, 0.0])
+        self.assertEqual(result['total_payment'], [10951.88, 5000.0])
+        # The last payment absorbs the rounding
+        self.assertEqual(result['final_payment'], [304.18, 416.63])
+    
+    def test_schedule_repays_principal(self):
+        """Test a schedule's principal adds up to the loan and its balance ends at zero"""
+        rows = self.amortization.schedule(12345.67, 9.9, 48)
+        
+        self.assertEqual(len(rows), 48)
+        self.assertEqual(rows[-1]['balance'], 0)
+        self.assertAlmostEqual(sum(row['principal'] for row in rows), 12345.67, places=2)
+        for row in rows:
+            self.assertAlmostEqual(row['interest'] + row['principal'], row['payment'], places=2)
+        total = self.amortization.to_lists(self.amortization.amortize([12345.67], [9.9], [48]))
+        self.assertAlmostEqual(sum(row['interest'] for row in rows), total['total_interest'][0], places=2)
+    
+    def test_batch_matches_single_loans(self):
+        """Test mixed terms in one batch give the same numbers as one loan at a time"""
+        import random
+        rng = random.Random(11)
+        loans = [(rng.randint(10, 500) * 100, rng.choice([4.5, 7.25, 12.0, 19.9]), rng.choice([6, 12, 36, 60]))
+                 for _ in range(200)]
+        batch = self.amortization.to_lists(self.amortization.amortize(*zip(*loans), keep_schedule=True))
+        
+        for i, (amount, rate, term) in enumerate(loans):
+            single = self.amortization.to_lists(self.amortization.amortize([amount], [rate], [term]))
+            self.assertEqual(batch['total_interest'][i], single['total_interest'][0])
+            self.assertEqual(batch['monthly_payment'][i], self.amortization.level_payment(amount, rate, term))
+            self.assertEqual(len(batch['balance'][i]), 60)
+            self.assertTrue(all(value == 0 for value in batch['balance'][i][term - 1:]))
+        
+        if self.amortization.np is not None:
+            python = self.amortization._amortize_python(*zip(*loans), keep_schedule=False)
+            self.assertEqual(python['total_interest'], batch['total_interest'])
+    
+    def test_bid_costs(self):
+        """Test bids get their monthly payment and total interest"""
+        bids = [{'amount': 10000.0, 'interest_rate': 6.0}, {'amount': Decimal('10000'), 'interest_rate': Decimal('6.0')}]
+        self.amortization.add_bid_costs(bids, 36)
+        
+        for bid in bids:
+            self.assertEqual(bid['monthly_payment'], 304.22)
+            self.assertEqual(bid['total_interest'], 951.88)
+    
+    def test_bulk_api(self):
+        """Test the bulk endpoint validates input and trims schedules to each term"""
+        try:
+            from app_dynamodb import app
+        except ImportError:
+            self.skipTest("Flask app not available")
+        app.config['TESTING'] = True
+        app.config['LOGIN_DISABLED'] = True
+        try:
+            client = app.test_client()
+            response = client.post('/api/amortization', json={
+                'loans': [{'amount': 10000, 'interest_rate': 6, 'term_months': 36},
+                          {'amount': 1000, 'interest_rate': 12, 'term_months': 3}],
+                'schedule': True
+            })
+            data = response.get_json()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['count'], 2)
+            self.assertEqual(data['monthly_payment'], [304.22, 340.02])
+            self.assertEqual([len(row) for row in data['balance']], [36, 3])
+            
+            response = client.post('/api/amortization', json={'loans': [{'amount': 1000, 'term_months': 0}]})
+            self.assertEqual(response.status_code, 400)
+            
+            # NaN and inf pass every comparison check, so they are refused up front
+            for amount, rate in (('nan', 5), (1000, 'inf'), ('-inf', 5)):
+                response = client.post('/api/amortization', json={
+                    'loans': [{'amount': amount, 'interest_rate': rate, 'term_months': 12}]})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('finite', response.get_json()['error'])
+        finally:
+            app.config['LOGIN_DISABLED'] = False
+
+class TestPortfolioUnit(unittest.TestCase):
+    """Unit tests for incremental lender portfolios"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from portfolio import PortfolioRegistry, expected_interest
+            self.PortfolioRegistry = PortfolioRegistry
+            self.expected_interest = expected_interest
+        except ImportError:
+            self.skipTest("Portfolio module not available")
+        
+        self.loans = {
+            'loan-1': {'id': 'loan-1', 'borrower_id': 'b1', 'purpose': 'Business', 'term_months': 36},
+            'loan-2': {'id': 'loan-2', 'borrower_id': 'b2', 'purpose': 'Education', 'term_months': 12},
+            'loan-3': {'id': 'loan-3', 'borrower_id': 'b1', 'purpose': 'Business', 'term_months': 60}
+        }
+        self.users = {'b1': {'credit_score': 720}, 'b2': {'credit_score': 810}}
+        self.bids = [
+            {'id': 'x1', 'loan_request_id': 'loan-1', 'lender_id': 'L', 'amount': Decimal('10000'),
+             'interest_rate': Decimal('6.0'), 'status': 'accepted', 'created_at': '2024-01-01T00:00:00'},
+            {'id': 'x2', 'loan_request_id': 'loan-2', 'lender_id': 'L', 'amount': Decimal('5000'),
+             'interest_rate': Decimal('9.0'), 'status': 'pending', 'created_at': '2024-01-02T00:00:00'},
+            {'id': 'x3', 'loan_request_id': 'loan-3', 'lender_id': 'L', 'amount': Decimal('2000'),
+             'interest_rate': Decimal('7.0'), 'status': 'rejected', 'created_at': '2024-01-03T00:00:00'}
+        ]
+        self.bid_loader = Mock(side_effect=lambda lender_id: [dict(bid) for bid in self.bids
+                                                              if bid['lender_id'] == lender_id])
+        self.registry = self.PortfolioRegistry(
+            self.bid_loader,
+            lambda ids: {loan_id: self.loans[loan_id] for loan_id in ids},
+            lambda user_id: self.users.get(user_id)
+        )
+    
+    def test_load_and_summary(self):
+        """Test a loaded portfolio reports exposure, rates and acceptance"""
+        summary = self.registry.get('L').summary()
+        
+        self.assertEqual(summary['total_bids'], 3)
+        self.assertEqual(summary['counts'], {'pending': 1, 'accepted': 1, 'rejected': 1})
+        self.assertEqual(summary['invested'], 10000)
+        self.assertEqual(summary['weighted_avg_rate'], 6.0)
+        self.assertEqual(summary['avg_bid_rate'], round((60000 + 45000 + 14000) / 17000, 2))
+        self.assertEqual(summary['acceptance_ratio'], 0.5)
+        self.assertEqual(summary['expected_interest'], 951.88)
+        self.assertEqual(summary['exposure'], {'purpose': {'Business': 10000},
+                                               'term': {'36': 10000},
+                                               'credit_band': {'700-749': 10000}})
+        self.assertEqual([p['id'] for p in self.registry.get('L').recent(2)], ['x3', 'x2'])
+    
+    def test_events_update_in_place(self):
+        """Test bid events adjust a loaded portfolio without reloading it"""
+        self.registry.get('L')
+        self.registry.on_bid_event('status', {'id': 'x2', 'status': 'accepted', 'filled_amount': Decimal('4000')})
+        self.registry.on_bid_event('created', {'id': 'x4', 'loan_request_id': 'loan-3', 'lender_id': 'L',
+                                               'amount': Decimal('3000'), 'interest_rate': Decimal('8.0'),
+                                               'status': 'pending', 'created_at': '2024-01-04T00:00:00'})
+        # Other lenders' bids are ignored until their portfolio is loaded
+        self.registry.on_bid_event('created', {'id': 'y1', 'loan_request_id': 'loan-1', 'lender_id': 'M',
+                                               'amount': Decimal('100'), 'interest_rate': Decimal('5.0')})
+        summary = self.registry.get('L').summary()
+        
+        self.assertEqual(self.bid_loader.call_count, 1)
+        self.assertEqual(summary['counts'], {'pending': 1, 'accepted': 2, 'rejected': 1})
+        self.assertEqual(summary['invested'], 14000)
+        self.assertEqual(summary['exposure']['credit_band'], {'700-749': 10000, '800+': 4000})
+        self.assertEqual(summary['exposure']['term'], {'12': 4000, '36': 10000})
+        self.assertEqual(summary['expected_interest'], round(951.88 + self.expected_interest(4000, 9.0, 12), 2))
+        self.assertAlmostEqual(summary['acceptance_ratio'], 2 / 3, places=4)
+        self.assertNotIn('M', self.registry.portfolios)
+    
+    def test_incremental_matches_reload(self):
+        """Test a random stream of events leaves the same aggregates as a fresh load"""
+        import random
+        rng = random.Random(7)
+        self.registry.get('L')
+        for i in range(300):
+            if rng.random() < 0.5:
+                bid = {'id': f'n{i}', 'loan_request_id': rng.choice(list(self.loans)), 'lender_id': 'L',
+                       'amount': Decimal(rng.randint(1, 50) * 100), 'interest_rate': Decimal(str(rng.choice([5.5, 7.0, 9.25]))),
+                       'status': 'pending', 'created_at': f'2024-02-01T00:00:{i % 60:02d}'}
+                self.bids.append(bid)
+                self.registry.on_bid_event('created', dict(bid))
+            else:
+                bid = rng.choice(self.bids)
+                status = rng.choice(['accepted', 'rejected'])
+                bid['status'] = status
+                self.registry.on_bid_event('status', {'id': bid['id'], 'status': status})
+        
+        incremental = self.registry.get('L').summary()
+        self.registry.portfolios.clear()
+        reloaded = self.registry.get('L').summary()
+        self.assertEqual(incremental, reloaded)
+
+class TestLoanSearchUnit(unittest.TestCase):
+    """Unit tests for the columnar loan search index"""
+    
+    PURPOSES = ['Debt Consolidation', 'Home Improvement', 'Business', 'Education', 'Auto']
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from loan_search import LoanSearchIndex, rows_to_mask, mask_rows, INF
+            from portfolio import credit_band
+            self.LoanSearchIndex = LoanSearchIndex
+            self.rows_to_mask = rows_to_mask
+            self.mask_rows = mask_rows
+            self.INF = INF
+            self.credit_band = credit_band
+        except ImportError:
+            self.skipTest("Loan search module not available")
+    
+    def _book(self, rng, count, start=0):
+        loans = []
+        for i in range(start, start + count):
+            loans.append({'id': f'loan-{i}', 'borrower_id': f'b{i % 40}', 'amount': Decimal(rng.randint(10, 300) * 100),
+                          'max_interest_rate': Decimal(str(rng.choice([6.5, 8.0, 9.9, 12.0, 15.5]))),
+                          'term_months': rng.choice([12, 24, 36, 60]), 'purpose': rng.choice(self.PURPOSES),
+                          'created_at': f'2024-03-{1 + i % 28:02d}T00:00:00.{i:06d}', 'status': 'open'})
+        return loans
+    
+    def _expected(self, index, loans, borrowers, sort, limit, offset, **filters):
+        """Brute-force answer over plain dicts"""
+        def attributes(loan):
+            borrower = borrowers[loan['borrower_id']]
+            income = borrower['annual_income']
+            return {'amount': float(loan['amount']), 'rate': float(loan['max_interest_rate']),
+                    'dti': round(float(loan['amount']) / income, 4) if income else self.INF,
+                    'created': loan['created_at'], 'term': loan['term_months'],
+                    'purpose': loan['purpose'], 'credit_band': self.credit_band(borrower['credit_score'])}
+        
+        def keep(a, skip=None):
+            f = filters
+            return ((f.get('min_amount') is None or a['amount'] >= f['min_amount'])
+                    and (f.get('max_amount') is None or a['amount'] <= f['max_amount'])
+                    and (f.get('min_rate') is None or a['rate'] >= f['min_rate'])
+                    and (f.get('max_rate') is None or a['rate'] <= f['max_rate'])
+                    and (f.get('max_dti') is None or a['dti'] <= f['max_dti'])
+                    and (skip == 'term' or not f.get('terms') or a['term'] in f['terms'])
+                    and (skip == 'purpose' or not f.get('purposes') or a['purpose'] in f['purposes'])
+                    and (skip == 'credit_band' or not f.get('credit_bands') or a['credit_band'] in f['credit_bands']))
+        
+        rows = [(loan, attributes(loan)) for loan in loans]
+        matched = [(loan, a) for loan, a in rows if keep(a)]
+        column, reverse = {'amount': ('amount', False), '-amount': ('amount', True), 'rate': ('rate', False),
+                           'newest': ('created', True), 'dti': ('dti', False)}[sort]
+        matched.sort(key=lambda pair: (pair[1][column], index.rows[pair[0]['id']]), reverse=reverse)
+        facets = {}
+        for name in ('term', 'purpose', 'credit_band'):
+            counts = {}
+            for loan, a in rows:
+                if keep(a, skip=name):
+                    counts[str(a[name])] = counts.get(str(a[name]), 0) + 1
+            facets[name] = counts
+        return len(matched), [loan['id'] for loan, _ in matched[offset:offset + limit]], facets
+    
+    def test_bitmap_helpers(self):
+        """Test row lists and bitmaps convert both ways"""
+        rows = [0, 7, 8, 63, 64, 1000]
+        mask = self.rows_to_mask(rows, 1001)
+        self.assertEqual(mask, sum(1 << row for row in rows))
+        self.assertEqual(self.mask_rows(mask.to_bytes(126, 'little')), rows)
+    
+    def test_matches_brute_force(self):
+        """Test filters, sorting, paging and facets agree with a linear scan, before and after updates"""
+        import random
+        rng = random.Random(21)
+        borrowers = {f'b{i}': {'credit_score': rng.randint(580, 840), 'annual_income': rng.choice([0, 40000, 90000, 150000])}
+                     for i in range(40)}
+        loans = self._book(rng, 3000)
+        index = self.LoanSearchIndex(lambda borrower_id: borrowers[borrower_id], bin_size=32)
+        index.rebuild(loans, borrowers)
+        
+        def check(rounds):
+            for _ in range(rounds):
+                filters = {}
+                if rng.random() < 0.6:
+                    low = rng.randint(10, 200) * 100
+                    filters.update(min_amount=low, max_amount=low + rng.randint(0, 150) * 100)
+                if rng.random() < 0.4:
+                    filters['max_rate'] = rng.choice([8.0, 9.9, 12.0])
+                if rng.random() < 0.3:
+                    filters['max_dti'] = rng.choice([0.05, 0.1, 0.3])
+                if rng.random() < 0.5:
+                    filters['terms'] = rng.sample([12, 24, 36, 60], rng.randint(1, 2))
+                if rng.random() < 0.5:
+                    filters['purposes'] = rng.sample(self.PURPOSES, 2)
+                if rng.random() < 0.3:
+                    filters['credit_bands'] = ['700-749', '750-799']
+                sort = rng.choice(['amount', '-amount', 'rate', 'newest', 'dti'])
+                offset = rng.choice([0, 0, 5, 40])
+                
+                result = index.search(sort=sort, limit=10, offset=offset, **filters)
+                total, ids, facets = self._expected(index, loans, borrowers, sort, 10, offset, **filters)
+                self.assertEqual(result['total'], total, filters)
+                self.assertEqual([loan['id'] for loan in result['loans']], ids, (sort, filters))
+                self.assertEqual(result['facets'], facets, filters)
+        
+        check(60)
+        
+        # Close some loans and add new ones through the events
+        for loan in rng.sample(loans, 1200):
+            index.on_loan_event('status', {'id': loan['id'], 'status': 'funded'})
+            loans.remove(loan)
+        for loan in self._book(rng, 1500, start=3000):
+            index.on_loan_event('created', loan)
+            loans.append(loan)
+        self.assertEqual(len(index), len(loans))
+        check(60)
+    
+    def test_bid_and_loan_events(self):
+        """Test bid events keep counts and events before the first build are ignored"""
+        borrowers = {'b1': {'credit_score': 720, 'annual_income': 50000}}
+        loan = {'id': 'loan-1', 'borrower_id': 'b1', 'amount': 10000, 'max_interest_rate': 9,
+                'term_months': 36, 'purpose': 'Business', 'created_at': '2024-01-01T00:00:00'}
+        index = self.LoanSearchIndex(lambda borrower_id: borrowers[borrower_id])
+        index.on_loan_event('created', loan)
+        self.assertEqual(len(index), 0)
+        
+        index.rebuild([], {})
+        index.on_loan_event('created', loan)
+        index.on_bid_event('created', {'id': 'x', 'loan_request_id': 'loan-1', 'status': 'pending'})
+        index.on_bid_event('created', {'id': 'y', 'loan_request_id': 'loan-1', 'status': 'pending'})
+        index.on_bid_event('status', {'id': 'x', 'status': 'rejected'})
+        
+        result = index.search(max_dti=0.2, credit_bands=['700-749'])
+        self.assertEqual(result['loans'][0]['bid_count'], 1)
+        self.assertEqual(result['loans'][0]['dti'], 0.2)
+        self.assertEqual(result['facets']['purpose'], {'Business': 1})
+        
+        index.on_loan_event('status', {'id': 'loan-1', 'status': 'funded'})
+        self.assertEqual(index.search()['total'], 0)
+        with self.assertRaises(ValueError):
+            index.search(sort='bogus')
+    
+    def test_large_book_query_speed(self):
+        """Test filtered queries over a large book stay fast"""
+        import random
+        rng = random.Random(5)
+        borrowers = {f'b{i}': {'credit_score': rng.randint(580, 840), 'annual_income': 80000} for i in range(40)}
+        index = self.LoanSearchIndex()
+        index.rebuild(self._book(rng, 100000), borrowers)
+        
+        start = time_ns()
+        for _ in range(10):
+            result = index.search(min_amount=5000, max_amount=15000, terms=[36], purposes=['Business'], sort='rate')
+        elapsed_ms = (time_ns() - start) / 1e6 / 10
+        
+        self.assertGreater(result['total'], 0)
+        self.assertLess(elapsed_ms, 100)
+
+class TestTextSearchUnit(unittest.TestCase):
+    """Unit tests for the BM25 full-text loan index"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from text_index import TextIndex, tokenize
+            self.TextIndex = TextIndex
+            self.tokenize = tokenize
+        except ImportError:
+            self.skipTest("Text index module not available")
+    
+    def _loans(self):
+        return [
+            {'id': 'l1', 'purpose': 'Home Improvement', 'description': 'New roof and kitchen renovation', 'amount': Decimal('5000'), 'term_months': 36, 'status': 'open'},
+            {'id': 'l2', 'purpose': 'Debt Consolidation', 'description': 'Pay off credit cards before the kitchen refit', 'amount': Decimal('8000'), 'term_months': 24, 'status': 'open'},
+            {'id': 'l3', 'purpose': 'Business', 'description': 'Inventory for my bakery and a new oven', 'amount': Decimal('12000'), 'term_months': 60, 'status': 'open'},
+            {'id': 'l4', 'purpose': 'Auto', 'description': 'Used car', 'amount': Decimal('3000'), 'term_months': 12, 'status': 'funded'}
+        ]
+    
+    def _fresh(self, loans):
+        index = self.TextIndex()
+        index.rebuild(loans)
+        return index
+    
+    def test_tokenize_and_rank(self):
+        """Test tokenizing, BM25 ordering, purpose weighting and prefix matching"""
+        self.assertEqual(self.tokenize('The Kitchen, and NEW roof!'), ['kitchen', 'new', 'roof'])
+        index = self._fresh(self._loans())
+        self.assertEqual(len(index), 3)  # Funded loans are not indexed
+        
+        self.assertEqual([r['id'] for r in index.search('kitchen', prefix=False)], ['l1', 'l2'])
+        self.assertEqual(index.search('home')[0]['id'], 'l1')
+        self.assertEqual(index.search('debt consolidation')[0]['purpose'], 'Debt Consolidation')
+        self.assertEqual({r['id'] for r in index.search('bak')}, {'l3'})
+        self.assertEqual(index.search('bak', prefix=False), [])
+        result = index.search('car')  # Prefix of 'cards'; the car loan is funded
+        self.assertEqual([r['id'] for r in result], ['l2'])
+        self.assertEqual((result[0]['amount'], result[0]['term_months']), (8000.0, 24))
+        self.assertEqual(index.search('the and'), [])
+    
+    def test_incremental_matches_rebuild(self):
+        """Test that events leave the index identical to a rebuild"""
+        import random
+        rng = random.Random(44)
+        words = ['roof', 'kitchen', 'car', 'wedding', 'tuition', 'bakery', 'oven', 'medical', 'solar', 'boat']
+        loans = [{'id': f'loan-{i}', 'purpose': rng.choice(['Business', 'Home Improvement', 'Other']),
+                  'description': ' '.join(rng.choice(words) for _ in range(rng.randint(1, 12))),
+                  'amount': 1000, 'term_months': 36, 'status': 'open'} for i in range(200)]
+        index = self._fresh(loans[:100])
+        for loan in loans[100:]:
+            index.on_loan_event('created', loan)
+        for loan in loans[::3]:
+            index.on_loan_event('status', {'id': loan['id'], 'status': 'funded'})
+        remaining = [loan for i, loan in enumerate(loans) if i % 3]
+        expected = self._fresh(remaining)
+        
+        self.assertEqual(index.postings, expected.postings)
+        self.assertEqual(index.vocabulary, expected.vocabulary)
+        self.assertEqual(index.total_length, expected.total_length)
+        for query in ['kitchen', 'so', 'roof oven', 'b']:
+            self.assertEqual(index.search(query, limit=50), expected.search(query, limit=50))
+        
+        idle = self.TextIndex()
+        idle.on_loan_event('created', loans[0])  # Ignored until loaded
+        self.assertEqual(len(idle), 0)
+    
+    def test_snapshot_round_trip_and_sync(self):
+        """Test that a saved snapshot loads, syncs, and rejects stale or broken files"""
+        import tempfile
+        loans = self._loans()
+        index = self._fresh(loans)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'text.json.gz')
+            index.save(path)
+            self.assertEqual(os.listdir(directory), ['text.json.gz'])
+            
+            restored = self.TextIndex.load(path)
+            self.assertEqual(restored.search('kitchen'), index.search('kitchen'))
+            self.assertIsNone(self.TextIndex.load(path, max_age=-1))
+            
+            # l1 closed and l5 created while the process was down
+            now_open = loans[1:3] + [{'id': 'l5', 'purpose': 'Education', 'description': 'Kitchen design course', 'amount': 900, 'term_months': 12, 'status': 'open'}]
+            self.assertEqual(restored.sync(now_open), (1, 1))
+            self.assertEqual(restored.postings, self._fresh(now_open).postings)
+            
+            with open(path, 'wb') as handle:
+                handle.write(b'not gzip')
+            self.assertIsNone(self.TextIndex.load(path))
+            self.assertIsNone(self.TextIndex.load(os.path.join(directory, 'missing.json.gz')))
+
+class TestLiveEventsUnit(unittest.TestCase):
+    """Unit tests for the pub/sub behind the SSE streams"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from live_events import EventHub, HubFull
+            self.EventHub = EventHub
+            self.HubFull = HubFull
+        except ImportError:
+            self.skipTest("Live events module not available")
+    
+    def _drain(self, subscription):
+        messages = []
+        while True:
+            message = subscription.get(0)
+            if message is None:
+                return messages
+            messages.append(message)
+    
+    def test_routing_from_model_events(self):
+        """Test that bid and loan events reach loan and borrower subscribers"""
+        hub = self.EventHub()
+        watcher = hub.subscribe(['loan:l1'])
+        borrower = hub.subscribe(['borrower:b1'])
+        
+        hub.on_bid_event('created', {'id': 'x1', 'loan_request_id': 'l1', 'lender_id': 'u9', 'amount': Decimal('500'),
+                                     'interest_rate': Decimal('7.5'), 'status': 'pending', 'created_at': '2024-01-01'})
+        hub.on_bid_event('status', {'id': 'x1', 'status': 'accepted', 'filled_amount': 250.0, 'loan_request_id': 'l1'})
+        hub.on_bid_event('status', {'id': 'x2', 'status': 'rejected', 'loan_request_id': None})
+        hub.on_loan_event('status', {'id': 'l1', 'status': 'funded'})
+        events = self._drain(watcher)
+        self.assertEqual([event for _, event, _ in events], ['bid_placed', 'bid_status', 'loan_status'])
+        self.assertEqual(events[0][2]['amount'], 500.0)
+        self.assertNotIn('lender_id', events[0][2])
+        self.assertEqual(events[1][2]['filled_amount'], 250.0)
+        self.assertEqual(self._drain(borrower), [])
+        
+        # A new loan is announced to its borrower, whose stream then follows its bids
+        hub.on_loan_event('created', {'id': 'l2', 'borrower_id': 'b1', 'amount': Decimal('900'), 'purpose': 'Auto',
+                                      'term_months': 12, 'max_interest_rate': Decimal('9'), 'status': 'open'})
+        hub.on_bid_event('created', {'id': 'x3', 'loan_request_id': 'l2', 'amount': 100, 'interest_rate': 8})
+        self.assertEqual([event for _, event, _ in self._drain(borrower)], ['loan_created', 'bid_placed'])
+        
+        watcher.close()
+        borrower.close()
+        self.assertEqual(hub.describe()['subscribers'], 0)
+        self.assertEqual(hub.topics, {})
+    
+    def test_slow_subscriber_and_limits(self):
+        """Test that a full queue drops the subscriber instead of blocking, and the stream cap"""
+        hub = self.EventHub(max_subscribers=2, max_queue=3)
+        slow = hub.subscribe(['loan:l1'])
+        fast = hub.subscribe(['loan:l1'])
+        with self.assertRaises(self.HubFull):
+            hub.subscribe(['loan:l2'])
+        
+        for i in range(3):
+            hub.publish('loan:l1', 'bid_placed', {'n': i})
+            fast.get(0)
+        hub.publish('loan:l1', 'bid_placed', {'n': 3})
+        self.assertTrue(slow.overflowed)
+        self.assertFalse(fast.overflowed)
+        self.assertEqual(hub.stats['dropped'], 1)
+        self.assertEqual(hub.subscribers, 1)
+        
+        frames = list(hub.stream(slow, heartbeat=0))
+        self.assertEqual(frames[0], 'retry: 5000\n\n')
+        self.assertEqual(len(frames), 5)  # retry, three queued events, reset
+        self.assertEqual(frames[-1], 'event: reset\ndata: {}\n\n')
+        self.assertTrue(frames[1].startswith(f'id: {hub.epoch}-1\nevent: bid_placed\n'))
+        hub.subscribe(['loan:l3']).close()  # The dropped stream's slot is free again
+    
+    def test_worker_connections_cover_stream_cap(self):
+        """Test the gunicorn connection limit leaves room for requests beyond the stream cap"""
+        import runpy
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+        with patch.dict(os.environ, {'SSE_MAX_SUBSCRIBERS': '8000'}):
+            settings = runpy.run_path(path)
+        self.assertEqual(settings['worker_class'], 'gevent')
+        self.assertGreater(settings['worker_connections'], 8000)
+    
+    def test_replay_on_reconnect(self):
+        """Test Last-Event-ID replay, and a reset when events were lost or the id is foreign"""
+        hub = self.EventHub(replay_size=5)
+        first = hub.publish('loan:l1', 'bid_placed', {'n': 1})
+        hub.publish('loan:l2', 'bid_placed', {'n': 2})
+        hub.publish('loan:l1', 'bid_status', {'n': 3})
+        
+        resumed = hub.subscribe(['loan:l1'], f'{hub.epoch}-{first}')
+        self.assertEqual([data for _, _, data in self._drain(resumed)], [{'n': 3}])
+        self.assertEqual(self._drain(hub.subscribe(['loan:l1'], f'other-{first}'))[0][1], 'reset')
+        self.assertEqual(hub.parse_event_id(None), None)
+        
+        for n in range(10):
+            hub.publish('loan:l1', 'bid_placed', {'n': n})
+        self.assertEqual(self._drain(hub.subscribe(['loan:l1'], f'{hub.epoch}-{first}'))[0][1], 'reset')
+        
+        # Heartbeats while idle
+        idle = hub.subscribe(['loan:l9'])
+        stream = hub.stream(idle, heartbeat=0.01)
+        self.assertEqual(next(stream), 'retry: 5000\n\n')
+        self.assertEqual(next(stream), ': ping\n\n')
+        stream.close()
+        self.assertIsNone(idle.topics)
+
+class TestEventBusUnit(unittest.TestCase):
+    """Unit tests for the model event bus and its socket transport"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            from dynamodb_models import EventBus, LoanCreated, LoanStatusChanged, BidCreated, BidStatusChanged
+            self.EventBus = EventBus
+            self.LoanCreated = LoanCreated
+            self.LoanStatusChanged = LoanStatusChanged
+            self.BidCreated = BidCreated
+            self.BidStatusChanged = BidStatusChanged
+        except ImportError:
+            self.skipTest("Event bus not available")
+    
+    def test_sync_and_async_subscribers(self):
+        """Test type filtering, ordered async delivery and isolation from failing handlers"""
+        import threading
+        bus = self.EventBus()
+        seen, legacy = [], []
+        bus.subscribe((self.LoanStatusChanged,), seen.append)
+        bus.subscribe((self.LoanStatusChanged,), lambda event: 1 / 0, name='broken')
+        done = threading.Event()
+        background = []
+        def slow(event):
+            background.append((event, threading.current_thread().name))
+            if len(background) == 50:
+                done.set()
+        bus.subscribe((self.LoanStatusChanged,), slow, asynchronous=True, name='slow')
+        
+        from dynamodb_models import DynamoDBLoanRequest
+        with patch('dynamodb_models.dynamodb'):
+            loan_model = DynamoDBLoanRequest(bus)
+        loan_model.add_listener(lambda event, loan: legacy.append((event, loan)))
+        
+        bus.publish(self.BidCreated({'id': 'b1'}))
+        for i in range(50):
+            bus.publish(self.LoanStatusChanged(f'l{i}', 'funded'))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(len(seen), 50)
+        self.assertEqual([event.loan_id for event, _ in background], [f'l{i}' for i in range(50)])
+        self.assertEqual(background[0][1], 'events-slow')
+        self.assertEqual(legacy[0], ('status', {'id': 'l0', 'status': 'funded'}))
+        
+        status = {sub['name']: sub for sub in bus.describe()['subscriptions']}
+        self.assertEqual(status['broken']['failed'], 50)
+        self.assertEqual(status['slow']['delivered'], 50)
+        bus.close()
+    
+    def test_overflow_policies(self):
+        """Test drop_oldest, drop_newest and bounded blocking on a stalled subscriber"""
+        import threading
+        gate = threading.Event()
+        bus = self.EventBus()
+        handled = {policy: [] for policy in ('drop_oldest', 'drop_newest', 'block')}
+        subscriptions = {}
+        for policy in handled:
+            def handler(event, policy=policy):
+                gate.wait(5)
+                handled[policy].append(event.loan_id)
+            subscriptions[policy] = bus.subscribe((self.LoanStatusChanged,), handler, asynchronous=True,
+                                                  max_queue=2, overflow=policy, block_timeout=0.01)
+        with self.assertRaises(ValueError):
+            bus.subscribe((self.LoanStatusChanged,), print, overflow='spill')
+        
+        bus.publish(self.LoanStatusChanged('first', 'open'))
+        import time
+        deadline = time.time() + 5
+        while any(sub.queue.qsize() for sub in subscriptions.values()) and time.time() < deadline:
+            time.sleep(0.001)  # Each worker is now stuck on 'first'
+        for i in range(4):
+            bus.publish(self.LoanStatusChanged(f'l{i}', 'open'))
+        gate.set()
+        bus.close()
+        
+        self.assertEqual(handled['drop_oldest'], ['first', 'l2', 'l3'])
+        self.assertEqual(handled['drop_newest'], ['first', 'l0', 'l1'])
+        self.assertEqual(handled['block'], ['first', 'l0', 'l1'])
+        self.assertEqual({policy: sub.stats['dropped'] for policy, sub in subscriptions.items()},
+                         {'drop_oldest': 2, 'drop_newest': 2, 'block': 2})
+    
+    def test_unix_socket_transport(self):
+        """Test events reach another bus through the transport, Decimal intact and without echo"""
+        import tempfile
+        import threading
+        try:
+            from event_transport import UnixSocketTransport, encode_event, decode_event
+        except ImportError:
+            self.skipTest("Event transport not available")
+        event = self.BidCreated({'id': 'b1', 'amount': Decimal('12.50'), 'status': 'pending'})
+        self.assertEqual(decode_event(encode_event(event)), event)
+        self.assertEqual(decode_event(encode_event(self.BidStatusChanged('b1', 'accepted'))).filled_amount, None)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            here, there = self.EventBus(), self.EventBus()
+            local, remote, once = [], [], []
+            arrived = threading.Event()
+            here.subscribe((self.BidCreated,), local.append)
+            there.subscribe((self.BidCreated,), once.append, remote=False)
+            there.subscribe((self.BidCreated,), lambda e: (remote.append(e), arrived.set()))
+            here.set_transport(UnixSocketTransport(directory))
+            there.set_transport(UnixSocketTransport(directory))
+            
+            here.publish(event)
+            self.assertTrue(arrived.wait(5))
+            self.assertEqual(remote, [event])
+            self.assertIsInstance(remote[0].bid['amount'], Decimal)
+            self.assertEqual(local, [event])  # Delivered once locally, not echoed back
+            self.assertEqual(once, [])  # Subscribers that opted out of remote events don't see it
+            self.assertEqual(there.stats['received'], 1)
+            
+            there.close()
+            here.publish(event)  # The departed peer's socket is cleaned up
+            self.assertEqual(os.listdir(directory), [os.path.basename(here.transport.path)])
+            here.close()
+
+class TestIdempotencyUnit(unittest.TestCase):
+    """Unit tests for replaying repeated bid and loan submissions"""
+    
+    class KeyStore:
+        """In-memory stand-in for the idempotency key table"""
+        def __init__(self):
+            self.items = {}
+        
+        def claim(self, key_id, fingerprint, ttl_seconds):
+            if key_id in self.items:
+                return False, dict(self.items[key_id])
+            self.items[key_id] = {'id': key_id, 'fingerprint': fingerprint, 'status': 'pending'}
+            return True, None
+        
+        def complete(self, key_id, resource_id=None, response=None):
+            self.items[key_id].update(status='done', resource_id=resource_id, response=response)
+        
+        def release(self, key_id):
+            del self.items[key_id]
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            import app_dynamodb
+            self.app_module = app_dynamodb
+        except ImportError:
+            self.skipTest("Flask app not available")
+        self.keys = self.KeyStore()
+        loan = {'id': 'loan-1', 'borrower_id': 'b1', 'status': 'open', 'amount': Decimal('5000'),
+                'max_interest_rate': Decimal('12'), 'term_months': 36}
+        self.patches = [
+            patch.object(app_dynamodb, 'idempotency_model', self.keys),
+            patch.object(app_dynamodb, 'current_user', Mock(id='lender-1', user_type='lender', is_authenticated=True)),
+            patch.object(app_dynamodb.loan_model, 'get_loan_request', return_value=loan),
+            patch.object(app_dynamodb.user_model, 'get_user_by_id', return_value={}),
+        ]
+        for p in self.patches:
+            p.start()
+        app_dynamodb.app.config['LOGIN_DISABLED'] = True
+        self.client = app_dynamodb.app.test_client()
+    
+    def tearDown(self):
+        self.app_module.app.config['LOGIN_DISABLED'] = False
+        for p in reversed(self.patches):
+            p.stop()
+    
+    def _bid(self, key, amount='1000', header=False):
+        form = {'amount': amount, 'interest_rate': '8.5', 'message': ''}
+        if header:
+            return self.client.post('/place_bid/loan-1', data=form, headers={'Idempotency-Key': key})
+        return self.client.post('/place_bid/loan-1', data=dict(form, idempotency_key=key))
+    
+    def test_repeated_bid_is_written_once(self):
+        """Test a resubmitted form or retried request replays instead of creating another bid"""
+        with patch.object(self.app_module.bid_model, 'create_bid', return_value='bid-1') as create_bid:
+            first = self._bid('k1')
+            again = self._bid('k1')
+            retried = self._bid('k1', header=True)
+            self.assertEqual(create_bid.call_count, 1)
+            self.assertEqual(first.status_code, 302)
+            self.assertNotIn('Idempotent-Replayed', first.headers)
+            for response in (again, retried):
+                self.assertEqual(response.headers['Location'], first.headers['Location'])
+                self.assertEqual(response.headers['Idempotent-Replayed'], 'true')
+            self.assertEqual(self.keys.items['place_bid:lender-1:k1']['resource_id'], 'bid-1')
+            
+            # A new key is a new bid; the same key with other details is refused
+            self._bid('k2')
+            self.assertEqual(create_bid.call_count, 2)
+            conflict = self._bid('k1', amount='2000')
+            self.assertEqual(create_bid.call_count, 2)
+            self.assertEqual(conflict.headers['Idempotent-Replayed'], 'true')
+            
+            # Without a key nothing changes
+            self.client.post('/place_bid/loan-1', data={'amount': '1000', 'interest_rate': '8.5'})
+            self.assertEqual(create_bid.call_count, 3)
+    
+    def test_failed_write_frees_the_key(self):
+        """Test a request that fails to write can be retried with the same key"""
+        with patch.object(self.app_module.bid_model, 'create_bid', side_effect=RuntimeError('throttled')):
+            self.app_module.app.config['PROPAGATE_EXCEPTIONS'] = False
+            try:
+                self.assertEqual(self._bid('k3').status_code, 500)
+            finally:
+                self.app_module.app.config['PROPAGATE_EXCEPTIONS'] = None
+        self.assertEqual(self.keys.items, {})
+        with patch.object(self.app_module.bid_model, 'create_bid', return_value='bid-3') as create_bid:
+            self._bid('k3')
+            self.assertEqual(create_bid.call_count, 1)
+        self.assertEqual(self.keys.items['place_bid:lender-1:k3']['status'], 'done')
+    
+    def test_unreachable_key_table_does_not_block_writes(self):
+        """Test a key table error lets the bid through untracked instead of failing it"""
+        from dynamodb_models import DynamoDBIdempotencyKey
+        keys = DynamoDBIdempotencyKey()
+        keys.table = Mock()
+        keys.table.put_item.side_effect = RuntimeError('ResourceNotFoundException')
+        self.assertEqual(keys.claim('place_bid:lender-1:k4', 'f', 60), (None, None))
+        
+        with patch.object(self.app_module, 'idempotency_model', keys), \
+                patch.object(self.app_module.bid_model, 'create_bid', return_value='bid-4') as create_bid:
+            self.assertEqual(self._bid('k4').status_code, 302)
+            self.assertEqual(create_bid.call_count, 1)
+        keys.table.update_item.assert_not_called()
+
+class TestBulkBidsUnit(unittest.TestCase):
+    """Unit tests for the bulk bid API"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            import app_dynamodb
+            self.app_module = app_dynamodb
+        except ImportError:
+            self.skipTest("Flask app not available")
+        self.loans = {
+            'open': {'id': 'open', 'borrower_id': 'b1', 'status': 'open', 'amount': Decimal('5000'),
+                     'max_interest_rate': Decimal('10'), 'term_months': 36},
+            'funded': {'id': 'funded', 'borrower_id': 'b1', 'status': 'funded', 'amount': Decimal('5000'),
+                       'max_interest_rate': Decimal('10'), 'term_months': 36}
+        }
+        self.user = Mock(id='lender-1', user_type='lender', is_authenticated=True)
+        self.patches = [
+            patch.object(app_dynamodb, 'current_user', self.user),
+            patch.object(app_dynamodb.loan_model, 'get_loan_requests',
+                         side_effect=lambda ids: {i: self.loans[i] for i in ids if i in self.loans}),
+            patch.object(app_dynamodb.user_model, 'get_users', return_value={'b1': {'credit_score': 700}}),
+        ]
+        for p in self.patches:
+            p.start()
+        app_dynamodb.app.config['LOGIN_DISABLED'] = True
+        self.client = app_dynamodb.app.test_client()
+    
+    def tearDown(self):
+        self.app_module.app.config['LOGIN_DISABLED'] = False
+        for p in reversed(self.patches):
+            p.stop()
+    
+    def test_per_item_results(self):
+        """Test every intent gets a result and valid ones are written in one call"""
+        intents = [
+            {'loan_id': 'open', 'amount': 1000, 'interest_rate': 8},
+            {'loan_id': 'funded', 'amount': 1000, 'interest_rate': 8},
+            {'loan_id': 'open', 'amount': 9000, 'interest_rate': 8},
+            {'loan_id': 'open', 'amount': 1000, 'interest_rate': 12},
+            {'loan_id': 'missing', 'amount': 1000, 'interest_rate': 8},
+            {'loan_id': 'open', 'amount': 'lots'},
+            'not a bid',
+            {'loan_id': 'open', 'amount': '250.50', 'interest_rate': '9.5', 'message': 'hi'},
+        ]
+        with patch.object(self.app_module.bid_model, 'create_bids', return_value=['bid-a', None]) as create_bids:
+            response = self.client.post('/api/bids/bulk', json={'bids': intents})
+        data = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((data['created'], data['rejected'], data['failed']), (1, 6, 1))
+        self.assertEqual([r['status'] for r in data['results']],
+                         ['created', 'rejected', 'rejected', 'rejected', 'rejected', 'rejected', 'rejected', 'failed'])
+        self.assertEqual(data['results'][0]['bid_id'], 'bid-a')
+        self.assertEqual(data['results'][2]['error'], 'Bid amount cannot exceed loan amount.')
+        create_bids.assert_called_once()
+        lender_id, written = create_bids.call_args.args
+        self.assertEqual(lender_id, 'lender-1')
+        self.assertEqual(written[1], {'loan_request_id': 'open', 'amount': 250.5, 'interest_rate': 9.5, 'message': 'hi'})
+        self.assertEqual(self.app_module.loan_model.get_loan_requests.call_count, 1)
+    
+    def test_request_limits(self):
+        """Test bad bodies, the size cap and non-lenders are refused"""
+        self.assertEqual(self.client.post('/api/bids/bulk', json={'bids': []}).status_code, 400)
+        self.assertEqual(self.client.post('/api/bids/bulk', data='nope').status_code, 400)
+        with patch.dict(os.environ, {'BULK_BID_MAX': '2'}):
+            too_many = [{'loan_id': 'open', 'amount': 1, 'interest_rate': 1}] * 3
+            self.assertEqual(self.client.post('/api/bids/bulk', json={'bids': too_many}).status_code, 400)
+        self.user.user_type = 'borrower'
+        self.assertEqual(self.client.post('/api/bids/bulk', json={'bids': [{}]}).status_code, 403)
+    
+    def test_non_finite_values_rejected(self):
+        """Test NaN and infinite amounts or rates are rejected instead of failing their chunk"""
+        intents = [{'loan_id': 'open', 'amount': 'nan', 'interest_rate': 8},
+                   {'loan_id': 'open', 'amount': 1000, 'interest_rate': 'inf'},
+                   {'loan_id': 'open', 'amount': 1000, 'interest_rate': 8}]
+        with patch.object(self.app_module.bid_model, 'create_bids', return_value=['bid-a']) as create_bids:
+            data = self.client.post('/api/bids/bulk', json={'bids': intents}).get_json()
+        self.assertEqual([r['status'] for r in data['results']], ['rejected', 'rejected', 'created'])
+        self.assertEqual(len(create_bids.call_args.args[1]), 1)
+    
+    def test_retried_request_replays_results(self):
+        """Test a retried bulk request with the same Idempotency-Key writes nothing new"""
+        keys = TestIdempotencyUnit.KeyStore()
+        intents = [{'loan_id': 'open', 'amount': 1000, 'interest_rate': 8}]
+        headers = {'Idempotency-Key': 'batch-1'}
+        with patch.object(self.app_module, 'idempotency_model', keys), \
+                patch.object(self.app_module.bid_model, 'create_bids', return_value=['bid-a']) as create_bids:
+            first = self.client.post('/api/bids/bulk', json={'bids': intents}, headers=headers)
+            retried = self.client.post('/api/bids/bulk', json={'bids': intents}, headers=headers)
+            changed = self.client.post('/api/bids/bulk', json={'bids': intents * 2}, headers=headers)
+        self.assertEqual(create_bids.call_count, 1)
+        self.assertEqual(retried.get_json(), first.get_json())
+        self.assertEqual(retried.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(changed.status_code, 422)
+
+class TestLoanImportUnit(unittest.TestCase):
+    """Unit tests for the streaming loan import"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            import import_loans
+            from dynamodb_models import DynamoDBLoanRequest
+            self.import_loans = import_loans
+        except ImportError:
+            self.skipTest("Import module not available")
+        import io
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.written = []
+        self.loan_model = Mock()
+        self.loan_model.build_loan_item.side_effect = lambda **loan: DynamoDBLoanRequest.build_loan_item(None, **loan)
+        self.loan_model.put_loans.side_effect = lambda items: self.written.extend(items) or set()
+        self.loan_model.get_loan_requests.side_effect = lambda ids: {item['id']: item for item in self.written
+                                                                    if item['id'] in ids}
+        self.user_model = Mock()
+        self.user_model.get_users.side_effect = lambda ids: {i: {} for i in ids if i != 'ghost'}
+        self.out = io.StringIO()
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def path(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+    
+    def importer(self, path, **options):
+        return self.import_loans.LoanImporter(
+            self.loan_model, self.user_model, source=self.import_loans.source_key(path), workers=2,
+            checkpoint_path=path + '.checkpoint', errors_path=path + '.errors.ndjson',
+            progress_interval=0, out=self.out, **options
+        )
+    
+    def test_csv_rows_validated_and_rejects_recorded(self):
+        """Test valid CSV rows are written and bad ones land in the errors file"""
+        import json
+        path = self.path('loans.csv', (
+            'borrower_id,amount,purpose,term_months,max_interest_rate,description\n'
+            'b1,5000,Business,36,9.5,"Truck, used"\n'
+            'b2,50,Business,36,9.5,\n'
+            'b3,5000,Vacation,36,9.5,\n'
+            'ghost,5000,Auto,12,12,\n'
+            'b4,abc,Auto,12,12,\n'
+        ))
+        stats = self.importer(path).run(self.import_loans.read_rows(path))
+        self.assertEqual((stats['rows'], stats['written'], stats['invalid'], stats['failed']), (5, 1, 4, 0))
+        self.assertEqual(self.written[0]['description'], 'Truck, used')
+        self.assertEqual(self.written[0]['max_interest_rate'], Decimal('9.5'))
+        with open(path + '.errors.ndjson') as f:
+            errors = [json.loads(line) for line in f]
+        self.assertEqual(sorted(error['line'] for error in errors), [3, 4, 5, 6])
+        self.assertIn('unknown borrower', next(e['error'] for e in errors if e['line'] == 5))
+        self.assertIn('rows/s', self.out.getvalue())
+    
+    def test_checkpoint_resume_is_idempotent(self):
+        """Test a resumed import skips done lines and reuses the same loan ids"""
+        import json
+        row = {'borrower_id': 'b1', 'amount': 1000, 'purpose': 'Auto', 'term_months': 12, 'max_interest_rate': 10}
+        lines = [json.dumps(dict(row, description=str(i))) for i in range(60)]
+        lines.insert(10, '{broken')
+        path = self.path('loans.ndjson', '\n'.join(lines) + '\n')
+        
+        # Stop partway through, as if the process were killed
+        rows = self.import_loans.read_rows(path)
+        partial = (next(rows) for _ in range(30))
+        self.importer(path).run(partial)
+        with open(path + '.checkpoint') as f:
+            self.assertEqual(json.load(f)['line'], 30)
+        first_ids = [item['id'] for item in self.written]
+        
+        stats = self.importer(path).run(self.import_loans.read_rows(path))
+        self.assertEqual((stats['skipped'], stats['rows'], stats['written']), (30, 31, 31))
+        self.assertEqual(len({item['id'] for item in self.written}), 60)
+        source = self.import_loans.source_key(path)
+        self.assertEqual(first_ids, [self.import_loans.LoanImporter(None, source=source).loan_id(n)
+                                     for n in range(1, 31) if n != 11])
+        
+        # Another file's checkpoint is refused rather than silently applied
+        other = self.importer(path)
+        other.source = 'other'
+        with self.assertRaises(ValueError):
+            other.run(iter(()))
+        
+        # Without the checkpoint, loans already there are left alone rather than overwritten
+        os.remove(path + '.checkpoint')
+        stats = self.importer(path).run(self.import_loans.read_rows(path))
+        self.assertEqual((stats['existing'], stats['written']), (60, 0))
+        self.assertEqual(len(self.written), 60)
+    
+    def test_same_name_in_other_directory_gets_other_ids(self):
+        """Test partner files that only share a file name don't overwrite each other's loans"""
+        row = 'borrower_id,amount,purpose,term_months,max_interest_rate\n{},1000,Auto,12,10\n'
+        os.makedirs(os.path.join(self.tmpdir.name, 'a'))
+        os.makedirs(os.path.join(self.tmpdir.name, 'b'))
+        first = self.path(os.path.join('a', 'loans.csv'), row.format('b1'))
+        second = self.path(os.path.join('b', 'loans.csv'), row.format('b2'))
+        self.importer(first).run(self.import_loans.read_rows(first))
+        stats = self.importer(second).run(self.import_loans.read_rows(second))
+        self.assertEqual(stats['written'], 1)
+        self.assertEqual(len({item['id'] for item in self.written}), 2)
+
+class TestDataExportUnit(unittest.TestCase):
+    """Unit tests for the streaming table export"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        try:
+            import export_data
+            self.export_data = export_data
+        except ImportError:
+            self.skipTest("Export module not available")
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.users = [{'id': f'u{i}', 'email': f'u{i}@example.com', 'password_hash': 'secret',
+                       'credit_score': Decimal('700'), 'annual_income': Decimal('55000.50'),
+                       'tags': {'a', 'b'}} for i in range(50)]
+        self.users[45]['provider'] = 'google'
+        
+        def scan(Segment, TotalSegments, ExclusiveStartKey=None, **kwargs):
+            # Each segment pages through its share of the items 4 at a time
+            mine = self.users[Segment::TotalSegments]
+            start = ExclusiveStartKey or 0
+            response = {'Items': mine[start:start + 4]}
+            if start + 4 < len(mine):
+                response['LastEvaluatedKey'] = start + 4
+            return response
+        table = Mock()
+        table.scan.side_effect = scan
+        self.patcher = patch.object(export_data, 'dynamodb')
+        self.patcher.start().Table.return_value = table
+    
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmpdir.cleanup()
+    
+    def read_parts(self, manifest):
+        import gzip
+        return [gzip.open(os.path.join(self.tmpdir.name, part['path']), 'rt').read() for part in manifest['parts']]
+    
+    def test_ndjson_parts(self):
+        """Test every item lands once across size-capped gzip parts, without secrets"""
+        import json
+        manifest = self.export_data.export_table('users', self.tmpdir.name, part_size=1000, segments=3)
+        parts = self.read_parts(manifest)
+        rows = [json.loads(line) for part in parts for line in part.splitlines()]
+        self.assertEqual(manifest['rows'], 50)
+        self.assertGreater(len(parts), 1)
+        self.assertEqual(sum(part['rows'] for part in manifest['parts']), 50)
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(user['id'] for user in self.users))
+        self.assertNotIn('password_hash', rows[0])
+        self.assertEqual((rows[0]['credit_score'], rows[0]['annual_income'], rows[0]['tags']), (700, 55000.5, ['a', 'b']))
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, 'users-manifest.json')))
+        self.assertFalse([name for name in os.listdir(self.tmpdir.name) if name.endswith('.tmp')])
+    
+    def test_csv_parts_and_stream(self):
+        """Test CSV parts each carry the header and late attributes go to the extra column"""
+        import csv
+        import gzip
+        with patch.object(self.export_data, 'CSV_SAMPLE_ROWS', 10):
+            manifest = self.export_data.export_table('users', self.tmpdir.name, fmt='csv', part_size=1500,
+                                                     segments=1)
+        rows = []
+        for part in self.read_parts(manifest):
+            reader = list(csv.DictReader(part.splitlines()))
+            rows.extend(reader)
+        self.assertEqual(len(rows), 50)
+        self.assertGreater(len(manifest['parts']), 1)
+        self.assertEqual(next(row for row in rows if row['id'] == 'u45')['_extra'], '{"provider":"google"}')
+        self.assertNotIn('password_hash', rows[0])
+        
+        body = gzip.decompress(b''.join(self.export_data.export_stream('users', 'csv')))
+        self.assertEqual(len(body.decode().splitlines()), 51)
+        with self.assertRaises(ValueError):
+            self.export_data.compressor('lz4')
+    
+    def test_admin_endpoint(self):
+        """Test the endpoint streams a gzip attachment to admins only"""
+        import gzip
+        try:
+            import app_dynamodb
+        except ImportError:
+            self.skipTest("Flask app not available")
+        user = Mock(id='admin-1', email='ops@admin.com', is_authenticated=True)
+        app_dynamodb.app.config['LOGIN_DISABLED'] = True
+        try:
+            with patch.object(app_dynamodb, 'current_user', user):
+                client = app_dynamodb.app.test_client()
+                response = client.get('/admin/export/users')
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('attachment', response.headers['Content-Disposition'])
+                self.assertEqual(len(gzip.decompress(response.data).splitlines()), 50)
+                self.assertEqual(client.get('/admin/export/ledger').status_code, 404)
+                self.assertEqual(client.get('/admin/export/users?format=xml').status_code, 400)
+                user.email = 'someone@example.com'
+                self.assertEqual(client.get('/admin/export/users').status_code, 403)
+        finally:
+            app_dynamodb.app.config['LOGIN_DISABLED'] = False
+
 class TestTemplateFiltersUnit(unittest.TestCase):
     """Unit tests for template filters"""
     
@@ -427,6 +3071,31 @@ def run_unit_tests():
     # Create test suite
     test_classes = [
         TestBotLenderLogic,
+        TestRateTableUnit,
+        TestConcurrentBiddingUnit,
+        TestBotLedgerUnit,
+        TestLeaderElectionUnit,
+        TestPortfolioAllocationUnit,
+        TestBacktestUnit,
+        TestDecisionLogUnit,
+        TestIncrementalStatsUnit,
+        TestRateLimiterUnit,
+        TestBotShardingUnit,
+        TestMarketIndexUnit,
+        TestAutoInvestUnit,
+        TestOrderBookUnit,
+        TestMatchingUnit,
+        TestAuctionCloseUnit,
+        TestAmortizationUnit,
+        TestPortfolioUnit,
+        TestLoanSearchUnit,
+        TestTextSearchUnit,
+        TestLiveEventsUnit,
+        TestEventBusUnit,
+        TestIdempotencyUnit,
+        TestBulkBidsUnit,
+        TestLoanImportUnit,
+        TestDataExportUnit,
         TestTemplateFiltersUnit,
         TestDataConversionUnit
     ]